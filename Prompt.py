@@ -1,241 +1,174 @@
-import streamlit as st
-from openai import OpenAI
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Iterator, Optional
 
-# 🔐 Streamlit Secrets 에서 OpenAI API Key 가져오기
-OPENAI_API_KEY = st.secrets["openai_api_key"]
+import streamlit as st
 
-# ✅ 기본값 상수 (리셋 시 여기에 적힌 값으로 돌아감)
-DEFAULT_BRAND = "니코모리"
-DEFAULT_ASPECT = "16:9"
-DEFAULT_DURATION = 8
-
-DEFAULT_SUBJECT = "밝게 미소 짓는 20대 한국인 여성"
-DEFAULT_CHARACTER_DETAIL = "긴 생머리, 깔끔한 셔츠와 데님, 자연스러운 메이크업"
-DEFAULT_ACTION = "카페 테라스에서 노트북으로 작업하며, 가끔 창밖을 보며 미소 짓는다"
-DEFAULT_EMOTION = "집중 + 여유 + 작은 설렘"
-
-DEFAULT_BACKGROUND = "햇살이 들어오는 도심 카페 테라스, 주변에 화분과 나무, 뒤로 흐릿한 도시 풍경"
-DEFAULT_LIGHTING = "golden hour, soft natural light"
-DEFAULT_CAMERA_MOVE = "slow dolly-in, medium shot, 약간 높은 앵글"
-DEFAULT_STYLE = "cinematic, realistic, soft color grading"
-DEFAULT_COMPOSITION = "rule of thirds, subject slightly off-center"
-
-DEFAULT_BGM = "warm lo-fi beat, soft piano, medium tempo"
-DEFAULT_SFX = "카페 사람들 소음, 잔잔한 대화 소리, 컵 부딪히는 소리"
-DEFAULT_VOICE = ""
-
-DEFAULT_TIMELINE_OVERVIEW = "총 8초, 3개의 주요 구간으로 구성"
-DEFAULT_TIMELINE_DETAIL = (
-    "0-3초: 카페 전경, 테라스와 도시 배경을 보여주는 와이드 샷\n"
-    "3-6초: 노트북으로 작업 중인 인물을 중심으로 미디엄 샷, 화면에 집중하는 표정\n"
-    "6-8초: 살짝 카메라가 줌인되며 창밖을 보며 미소 짓는 클로즈업"
+from prompt_core import (
+    COMFYUI_JSON_TEMPLATE,
+    COMFYUI_SYSTEM_INSTRUCTION,
+    DEFAULT_BRIEF,
+    FORM_FIELDS,
+    MAX_VARIANTS,
+    MIDJOURNEY_FIELDS,
+    MIDJOURNEY_SYSTEM_INSTRUCTION,
+    MODEL_NAME,
+    PATCH_SYSTEM_INSTRUCTION,
+    STRUCTURED_RESPONSE_FORMAT,
+    STRUCTURED_SYSTEM_INSTRUCTION,
+    SYSTEM_INSTRUCTION,
+    TEMPERATURE,
+    VARIANT_TEMPERATURE,
+    StructuredOutputError,
+    apply_timeline,
+    build_combined_prompt,
+    build_messages,
+    build_patch_prompt,
+    changed_fields,
+    extract_comfyui_json,
+    extract_midjourney,
+    merge_patch,
+    parse_patch_output,
+    parse_structured_output,
+    patch_response_format,
+    patched_to_markdown,
+    replace_comfyui_json,
+    sections_to_regenerate,
+    structured_response_format,
+    structured_to_markdown,
 )
-DEFAULT_EXTRA = ""
-DEFAULT_PROMPT_NAME = "카페 테라스 작업 씬"
-
-# ==============================================================================
-# [1] System Instruction 설정 (역할 + 규칙)
-# ==============================================================================
-SYSTEM_INSTRUCTION = """
-당신은 입력된 내용을 분석하여 'ComfyUI JSON 프롬프트'와 '미드저니 프롬프트'로 변환하는 전문 AI입니다.
-사용자가 입력한 내용을 바탕으로 아래의 [조건]과 [양식]을 완벽하게 준수하여 답변하세요.
-
-[전체 역할]
-- 사용자는 한국어로 장면/인물/배경/오디오/타임라인 정보를 입력합니다.
-- 당신은 이를 토대로:
-  1) ComfyUI에서 사용할 수 있는 JSON 프롬프트
-  2) Midjourney에서 사용할 수 있는 한 줄짜리 영문 프롬프트
-  를 생성해야 합니다.
-
-[조건 1: ComfyUI JSON 작성]
-- 아래 [JSON 템플릿]의 구조와 key 이름, 계층 구조를 절대 변경하지 마세요.
-- "___" 부분을 입력 내용을 기반으로 모두 영어로 채우세요.
-- 입력으로 제공되는 [오디오 / 사운드], [타임라인 / 씬 분할] 정보는 반드시 JSON의 "audio"와 "timeline" 섹션에 반영해야 합니다.
-- "timeline" 필드는 반드시 배열 형태여야 하며, 각 요소는 다음 네 개의 key만 사용합니다:
-  - "sequence" : 정수, 1부터 시작하는 씬 번호
-  - "timestamp" : 예) "00:00-03:00" 형식의 문자열
-  - "action" : 해당 구간에서 화면에 보이는 내용, 카메라 움직임, 분위기를 모두 포함하는 설명 (영어)
-  - "audio" : 해당 구간에서 들리는 사운드/효과음/음악 관련 설명 (영어)
-- "timeline" 안에는 shot_type, camera_movement 등 다른 key를 추가로 만들지 마세요. 필요한 정보는 모두 "action" 텍스트 안에 녹여서 작성합니다.
-- "audio" 필드는 반드시 아래 두 개의 key만 사용합니다:
-  - "voice_over" : 내레이션/대사/보이스 관련 요약 (영어)
-  - "music" : BGM 또는 음악 스타일, 분위기 (영어)
-- "audio" 안에 bgm, sfx 같은 다른 key 이름을 만들지 말고, 모든 음악/사운드 정보는:
-  - 전반적인 음악/톤 → "music"
-  - 내레이션/보이스 → "voice_over"
-  로만 정리합니다.
-- "camera_work" 섹션은 전체 영상에 공통으로 적용되는 렌즈, 전역적인 카메라 스타일, 효과 정도만 간단히 채우세요.
-  - 씬별 카메라 움직임, 샷 타입, 구체적인 화면 설명은 모두 "timeline" 배열의 "action" 텍스트 안에 포함합니다.
-- 카메라, 렌즈, 조명 등은 설명이 없을 때는 당신이 장면에 어울리는 값을 "추천"해서 채우고, 정말 결정하기 어려운 경우에만 "none"을 사용하세요.
-
-※ 중요 규칙:
-- 카메라 움직임, 샷 타입, 앵글, 화면 묘사 등 모든 카메라 관련 구체 정보는 반드시 timeline[*].action 내부 문장으로만 표현해야 합니다.
-camera_work.notes 또는 camera_work.effects 안에는 절대로 구체적인 카메라 움직임(dolly, zoom, pan, tilt), 샷 타입(wide, medium, close-up), 앵글(high-angle, low-angle) 정보를 넣지 마세요.
-
-※ Voice Over 관련 중요 규칙:
-- 만약 사용자가 voice_over 또는 대사(말한 문장)를 제공한 경우,
-timeline[*].action 안에는 반드시 '말하고 있는 동작'을 포함해야 합니다.
-
-예:
-"speaking softly",
-"mouth moving naturally while talking",
-"subtle talking motion",
-"talking while smiling"
-
-voice_over는 단순 내레이션이 아니라,
-인물이 직접 말하고 있는 경우라면 반드시 스타일을 반영해 주세요.
-
-즉, voice_over가 있을 경우:
-- timeline[*].action 문장 안에 'speaking' 관련 묘사를 추가해야 합니다.
-- 해당 컷에서 인물이 말하고 있는 모습이 시각적으로 묘사되도록 작성하세요.
-
-camera_work 섹션에는 아래와 같은 "전역적인 설정"만 포함해야 합니다:
-- 전체 영상에 공통으로 사용되는 렌즈 정보 (예: 35mm, 50mm 등)
-- 전체 영상에 공통으로 적용되는 색보정/효과 (예: soft bloom, cinematic grading)
-- 전체적인 카메라 톤 (예: overall cinematic tone)
-
-모든 장면별 카메라 동작, 샷 구성, 화면 내용은 timeline[*].action 문장 안에 포함하세요.
-
-[조건 2: 누락 데이터 처리]
-- 입력 내용에서 찾을 수 없는 정보는 "none"이라고 기입하세요.
-- 단, 가능한 경우에는 입력된 키워드와 전체 분위기를 바탕으로 합리적인 값을 추론해 채우려고 노력한 뒤, 정말 정보가 없을 때만 "none"을 사용합니다.
-- JSON 작성 후, 하단에 'ComfyUI 사용 json 프롬프트 중 누락 / none 부분'을 마크다운 리스트로 정리하세요.
-  - 예: "- character.appearance.eye_color : 눈 색상 정보 없음"
-
-[조건 3: 미드저니 프롬프트 작성]
-- 모든 내용은 영문으로 작성합니다.
-- 다음 순서를 반드시 지켜서 한 줄 프롬프트를 구성하세요:
-  주제(Topic) → 액션(Action) → 배경(Background) → 카메라 움직임(Camera movement) → 스타일(Style) → 구도(Composition)
-- 각 요소는 쉼표(,)로 구분합니다.
-- 오디오 / 타임라인에서 유추되는 분위기, 리듬감(느린 롱테이크, 빠른 컷 편집 등)은 Style, Camera movement, Mood 표현에 자연스럽게 반영하세요.
-- 출력 예시는 다음과 같은 형식입니다(예시는 그대로 복사하지 말고, 상황에 맞게 새로 작성하세요):
-
-  "a smiling Korean woman in her 20s, working on a laptop at a sunlit cafe terrace, soft camera dolly-in with medium shot, cinematic realistic style with warm tones, rule of thirds composition"
-
-[조건 4: 미드저니 누락 확인]
-- 미드저니 프롬프트 작성 후, 부족하거나 빠진 요소(예: 카메라 움직임이 모호함, 조명 스타일이 구체적이지 않음 등)를 하단에 리스트로 정리하세요.
-  - 예: "- 카메라 움직임이 구체적이지 않음 (어떤 방향으로 이동하는지 불명확)"
-
-[출력 양식 – 반드시 이 순서를 지키세요]
-
-1️⃣ ComfyUI 사용 json 프롬프트
-- 아래 [JSON 템플릿]을 기반으로 한 JSON을, 코드 블럭(```json ... ```) 형식으로 출력합니다.
-
-⚠️ ComfyUI 사용 json 프롬프트 중 누락 / none 부분
-- JSON 내에서 "none"으로 남은 항목들을 마크다운 리스트로 정리합니다.
-
-2️⃣ 미드저니 사용 프롬프트
-- 한 줄짜리 영문 프롬프트로 출력합니다.
-- 구성 순서: Topic, Action, Background, Camera movement, Style, Composition (각 요소는 쉼표로 구분)
-
-⚠️ 미드저니 사용 프롬프트 중 누락부분
-- 부족하거나 빠진 요소를 리스트로 정리합니다.
-
-[JSON 템플릿]
-
-{
-  "topic_and_content": {
-    "description": "___"
-  },
-  "character": {
-    "gender": "___",
-    "appearance": {
-      "nationality": "___",
-      "age": "___",
-      "eye_color": "___",
-      "scar": "___",
-      "hair": "___"
-    },
-    "clothing": "___",
-    "emotions_sequence": [
-      "___",
-      "___",
-      "___"
-    ]
-  },
-  "action": {
-    "sequence": [
-      "___",
-      "___",
-      "___",
-      "___"
-    ],
-    "object_interaction": [
-      "___",
-      "___",
-      "___"
-    ]
-  },
-  "background": {
-    "location": "___",
-    "time_of_day": "___",
-    "elements": [
-      "___",
-      "___"
-    ],
-    "weather": "___",
-      "scene_lighting": "___"
-  },
-  "camera_work": {
-    "lens": "___",
-    "effects": [
-      "___",
-      "___"
-    ],
-    "notes": "___"
-  },
-  "style": {
-    "genre": "___",
-    "style_lighting": "___",
-    "film_grain": "___",
-    "color_palette": "___",
-    "mood": "___"
-  },
-
-  "timeline": [
-    {
-      "sequence": 1,
-      "timestamp": "00:00-03:00",
-      "action": "___",
-      "audio": "___"
-    },
-    {
-      "sequence": 2,
-      "timestamp": "03:00-06:00",
-      "action": "___",
-      "audio": "___"
-    },
-    {
-      "sequence": 3,
-      "timestamp": "06:00-08:00",
-      "action": "___",
-      "audio": "___"
-    }
-  ],
-
-  "audio": {
-    "voice_over": "___",
-    "music": "___"
-  },
-
-  "aspect_ratio": "___",
-  "requirements": "full-size video without letterboxes"
-}
-
-[ComfyUI 사용 json 프롬프트 중 누락 / none 부분 예시]
+from history_store import HistoryStore
+from job_queue import STATUS_CANCELLED, STATUS_DONE, STATUS_ERROR, Job, JobCancelled, JobQueue
+from output_validator import (
+    MIDJOURNEY_SECTION,
+    build_repair_prompt,
+    drop_unknown_sections,
+    repair_targets,
+    replace_midjourney,
+    rewrite_response,
+    validate_output,
+)
+from preset_library import PresetError, PresetLibrary
+from rate_limiter import PRIORITY_BATCH, PRIORITY_INTERACTIVE, Lane, RateLimitScheduler
+from response_cache import (
+    ResponseCache,
+    SimilarityIndex,
+    canonical_brief,
+    dedupe_similar,
+    make_cache_key,
+    similarity_text,
+)
+from single_flight import SingleFlight
+from telemetry import Telemetry, Trace, format_duration, phase_sort_key
+from token_budget import (
+    RequestBudget,
+    count_system_tokens,
+    count_tokens,
+    expected_output_tokens,
+    fit_brief,
+    plan_request,
+    reserved_tokens_for,
+)
+from timeline_parser import parse_timeline, validate_timeline
+from usage_stats import ScopedUsageLog, prompt_fingerprint, summarize_usage, usage_record
+from workflow_export import ARCHIVE_NAME, BundleWriter, scene_filename
 
-- character.appearance.eye_color : 눈 색상 정보 없음
-- character.appearance.scar : 흉터 유무 정보 없음
+if TYPE_CHECKING:
+    from openai import OpenAI
 
-[미드저니 사용 프롬프트 출력 예시]
+    from model_router import Router
 
-Topic, Action, Background, Camera movement, Style, Composition
+# 🔐 Streamlit Secrets 에서 OpenAI API Key 가져오기
+OPENAI_API_KEY = st.secrets["openai_api_key"]
 
-[미드저니 사용 프롬프트 중 누락부분 예시]
+# ✅ 추가 백엔드 (선택): Secrets 에 설정이 있으면 라우터에 등록되어
+#   최근 p95 지연 / 오류율 기준으로 자동 선택되고, 느리면 헤징, 실패하면 폴백
+GEMINI_API_KEY = st.secrets.get("gemini_api_key")
+GEMINI_MODEL_NAME = st.secrets.get("gemini_model", "gemini-2.0-flash")
+COMPATIBLE_BASE_URL = st.secrets.get("openai_compatible_base_url")
+COMPATIBLE_API_KEY = st.secrets.get("openai_compatible_api_key", "local")
+COMPATIBLE_MODEL_NAME = st.secrets.get("openai_compatible_model", MODEL_NAME)
+# 이 시간(초) 안에 첫 백엔드 응답이 없으면 다음 백엔드에도 같은 요청을 보냄
+ROUTER_HEDGE_DELAY_SECONDS = float(st.secrets.get("router_hedge_delay_seconds", 20.0))
+
+# ✅ API 호출 스케줄러 (모든 세션 공유): 동시 호출 수 상한 + 분당 요청 / 토큰 한도.
+#   한도는 OpenAI 응답의 x-ratelimit-* 헤더로 자동으로 맞춰지고, Secrets 값은 첫 응답 전까지의 초기값
+MAX_CONCURRENT_REQUESTS = int(st.secrets.get("max_concurrent_requests", 8))
+REQUESTS_PER_MINUTE = st.secrets.get("requests_per_minute")
+TOKENS_PER_MINUTE = st.secrets.get("tokens_per_minute")
+# 예상치를 계산하지 않은 호출의 출력 토큰 예상치 (분당 토큰 한도 계산용)
+DEFAULT_OUTPUT_TOKEN_ESTIMATE = 2000
+# 출력 토큰 상한 (max_tokens). 기본은 지정하지 않음 – 예상치는 근사라서 상한으로 쓰면 JSON 이 중간에 잘림
+MAX_OUTPUT_TOKENS = st.secrets.get("max_output_tokens")
+
+# ✅ 응답 캐시 설정 (같은 입력이면 API 호출 없이 저장된 결과 재사용)
+CACHE_PATH = ".cache/responses.sqlite3"
+CACHE_MAX_ENTRIES = 500
+CACHE_TTL_SECONDS = 7 * 24 * 3600
+SIMILARITY_DEFAULT_THRESHOLD = 0.92
+
+# ✅ 입력 폼 섹션별 필드 (섹션 리셋 버튼 단위)
+FORM_SECTIONS = {
+    "basic": ("brand", "aspect", "duration", "prompt_name"),
+    "character": ("subject", "character_detail", "action", "emotion"),
+    "bg_cam": ("background", "lighting", "camera_move", "style", "composition"),
+    "audio": ("audio_bgm", "audio_sfx", "audio_voice"),
+    "timeline": ("timeline_overview", "timeline_detail"),
+    "extra": ("extra",),
+}
 
-- 카메라 움직임 관련 구체적인 표현 부족
-- 조명 스타일 구체 정보 부족
-"""
+# ✅ 장면 프리셋 라이브러리 (JSON 파일 하나 또는 디렉터리, 처음 열 때 읽음)
+PRESETS_PATH = st.secrets.get("presets_path", "presets")
+PRESET_PAGE_SIZE = 20
+
+# ✅ 생성 기록 (캐시와 달리 삭제/만료 없이 계속 쌓임)
+HISTORY_PATH = ".cache/history.sqlite3"
+HISTORY_PAGE_SIZE = 10
+# ✅ ComfyUI JSON 번들 내보내기 위치 (생성 기록 검색 결과를 장면별 파일 + zip + 인덱스로 기록)
+EXPORT_PATH = st.secrets.get("export_path", "exports")
+
+# ✅ 백그라운드 생성 작업 (생성 중에도 폼 수정 / 기록 검색 등 UI 조작 가능)
+JOB_WORKERS = 4
+JOB_POLL_SECONDS = 0.5
+
+# ✅ 미리 생성 (선택): 폼 입력이 이 시간(초) 동안 바뀌지 않으면 백그라운드에서 먼저 생성해 두고,
+#   생성 버튼을 누를 때 입력이 그대로면 그 결과(완료 / 진행 중)를 사용
+SPECULATION_DEBOUNCE_SECONDS = 3.0
+SPECULATION_POLL_SECONDS = 1.0
+
+# ✅ 단계별 계측: 사이드바에 최근 N건 요약. Secrets 에 지정하면 Prometheus 텍스트를 파일 / HTTP(/metrics)로 내보냄
+TELEMETRY_RECENT = 50
+METRICS_PATH = st.secrets.get("metrics_path")
+METRICS_PORT = st.secrets.get("metrics_port")
+
+# ✅ 스트리밍 출력 시 화면 갱신 간격 (토큰마다 다시 그리면 느려지므로 묶어서 갱신)
+STREAM_REFRESH_SECONDS = 0.15
+
+# ✅ 생성 방식
+MODE_STREAM = "실시간 스트리밍"
+MODE_BLOCKING = "완료 후 한 번에 출력"
+MODE_STRUCTURED = "구조화 출력 (JSON 스키마)"
+MODE_SPLIT = "ComfyUI / 미드저니 분리 병렬 요청"
+MODE_INCREMENTAL = "변경된 섹션만 다시 생성"
+GENERATION_MODES = [MODE_STREAM, MODE_BLOCKING, MODE_STRUCTURED, MODE_SPLIT, MODE_INCREMENTAL]
+# 계측 / 생성 기록에 남길 방식 이름 (부분 재생성은 실제로 부분 생성한 경우에만 "patch")
+GENERATION_KINDS = {
+    MODE_STREAM: "stream",
+    MODE_BLOCKING: "text",
+    MODE_STRUCTURED: "structured",
+    MODE_SPLIT: "split",
+    MODE_INCREMENTAL: "text",
+}
+# 여러 후보를 한 번의 요청(n)으로 받을 수 있는 방식 (스트리밍은 후보가 섞여 오므로 완료 후 한 번에 표시)
+VARIANT_MODES = (MODE_STREAM, MODE_BLOCKING, MODE_STRUCTURED)
+# 미드저니 프롬프트 유사도가 이 값 이상인 후보는 중복으로 보고 하나만 표시
+VARIANT_DEDUPE_THRESHOLD = 0.9
+# 출력 검증에서 규칙 위반이 나오면 위반 섹션만 다시 받는 수리 요청의 최대 횟수 (생성 1건당)
+REPAIR_MAX_ROUNDS = 2
 
 # ==============================================================================
 # [2] Streamlit UI
@@ -252,57 +185,159 @@ with st.sidebar:
         "- 이 화면에서는 별도의 키 입력이 필요 없습니다."
     )
     st.markdown("---")
-    st.markdown("**사용 모델:** `gpt-4.1-mini` (텍스트 전용)")
+    st.markdown(f"**사용 모델:** `{MODEL_NAME}` (텍스트 전용)")
+    fallback_models = [
+        f"`{model}`" for model, enabled in (
+            (GEMINI_MODEL_NAME, GEMINI_API_KEY),
+            (f"{COMPATIBLE_MODEL_NAME} @ {COMPATIBLE_BASE_URL}", COMPATIBLE_BASE_URL),
+        ) if enabled
+    ]
+    if fallback_models:
+        st.caption("보조 백엔드 (지연 시간 기준 자동 선택 / 폴백): " + ", ".join(fallback_models))
+    st.markdown("---")
+    st.subheader("🗄 응답 캐시")
+    bypass_cache = st.checkbox(
+        "캐시 우회 (항상 새로 생성)",
+        value=False,
+        help="체크하면 저장된 결과를 쓰지 않고 항상 OpenAI를 호출합니다. 새 결과는 캐시에 다시 저장됩니다.",
+        key="bypass_cache"
+    )
+    reuse_similar = st.checkbox(
+        "비슷한 이전 브리프 결과 재사용",
+        value=True,
+        help="프롬프트 이름, 공백, 브랜드 대소문자 차이는 항상 같은 브리프로 봅니다. "
+             "그 외 내용이 조금 다른 경우에도 유사도가 임계값 이상이면 이전 결과를 API 호출 없이 보여줍니다.",
+        key="reuse_similar"
+    )
+    similarity_threshold = st.slider(
+        "유사도 임계값",
+        min_value=0.80,
+        max_value=0.99,
+        value=SIMILARITY_DEFAULT_THRESHOLD,
+        step=0.01,
+        disabled=not reuse_similar,
+        key="similarity_threshold"
+    )
+    st.markdown("---")
+    st.subheader("⚡ 생성 방식")
+    generation_mode = st.radio(
+        "생성 방식",
+        GENERATION_MODES,
+        index=0,
+        help=(
+            "실시간 스트리밍: 생성되는 토큰을 바로바로 결과 영역에 보여줍니다.\n\n"
+            "완료 후 한 번에 출력: 전체 응답이 완료된 뒤 한 번에 표시합니다.\n\n"
+            "구조화 출력: 스키마가 지정된 단일 JSON 객체로 응답받아 한 번에 파싱/검증합니다.\n\n"
+            "분리 병렬 요청: ComfyUI JSON 과 미드저니 프롬프트를 각각 별도 요청으로 동시에 생성하고, 먼저 끝난 쪽부터 표시합니다.\n\n"
+            "변경된 섹션만 다시 생성: 마지막 결과와 비교해 바뀐 입력에 해당하는 JSON 섹션만 다시 만들어 병합합니다. "
+            "이전 결과가 없거나 바뀐 부분이 많으면 전체를 새로 생성합니다."
+        ),
+        label_visibility="collapsed",
+        key="generation_mode"
+    )
+    variant_count = st.slider(
+        "후보 개수",
+        min_value=1,
+        max_value=MAX_VARIANTS,
+        value=1,
+        help="2개 이상이면 한 번의 요청으로 여러 후보를 받아 나란히 보여줍니다. "
+             "입력 토큰은 한 번만 과금되고, 거의 같은 미드저니 프롬프트는 하나만 남깁니다.",
+        disabled=generation_mode not in VARIANT_MODES,
+        key="variant_count"
+    )
+    truncate_long_fields = st.checkbox(
+        "긴 입력 자르기 (토큰 예산)",
+        value=True,
+        help="필드별 토큰 상한을 넘는 긴 자유 입력은 상한까지만 보냅니다. 끄면 경고만 표시하고 그대로 보냅니다.",
+        key="truncate_long_fields"
+    )
+    speculative_generation = st.checkbox(
+        "입력 중 미리 생성 (실험적)",
+        value=False,
+        help=f"폼 입력이 {SPECULATION_DEBOUNCE_SECONDS:.0f}초 동안 바뀌지 않으면 현재 입력으로 미리 생성해 둡니다. "
+             "생성 버튼을 누를 때 입력이 그대로면 기다리지 않고 그 결과를 보여주고, "
+             "입력이 바뀌면 미리 생성한 결과는 버려집니다 (그만큼 토큰이 더 쓰일 수 있음). "
+             "후보 여러 개 / 변경된 섹션만 다시 생성 방식에서는 동작하지 않습니다.",
+        key="speculative_generation"
+    )
+    auto_repair = st.checkbox(
+        "규칙 위반 자동 수리",
+        value=True,
+        help="생성 결과를 템플릿 / 규칙(타임라인 key, audio key, camera_work 의 샷 타입 등)으로 검사하고, "
+             "위반이 있으면 전체를 다시 만들지 않고 해당 섹션만 고쳐 달라는 짧은 요청을 보냅니다.",
+        key="auto_repair"
+    )
+
+# 폼 위젯의 초기값은 위젯 인자(value=) 대신 세션 상태로 한 번만 채움
+#   (프리셋 / 생성 기록을 적용할 때 위젯 기본값과 충돌하지 않도록)
+for key in FORM_FIELDS:
+    st.session_state.setdefault(key, DEFAULT_BRIEF[key])
+# API 호출 스케줄러의 공정 대기열 key (세션마다 하나)
+st.session_state.setdefault("session_key", uuid.uuid4().hex[:8])
+
+# 프리셋 적용 / 생성 기록 "폼에 불러오기": 위젯이 만들어지기 전에 모든 필드를 한 번에 채움
+pending_brief = st.session_state.pop("pending_brief", None)
+if pending_brief is not None:
+    st.session_state.update({key: pending_brief[key] for key in FORM_FIELDS if key in pending_brief})
+
+
+def reset_fields(section: str) -> None:
+    # 섹션 리셋: 마지막으로 적용한 프리셋 값으로 (없으면 기본 브리프)
+    base = st.session_state.get("preset_brief", DEFAULT_BRIEF)
+    st.session_state.update({key: base[key] for key in FORM_SECTIONS[section]})
+
+
+# ※ 각 입력 섹션은 st.fragment 로 감싸서, 필드를 수정하거나 리셋해도
+#   앱 전체가 아니라 해당 섹션만 다시 실행되도록 함 (생성 시에는 st.session_state 에서 값을 읽음)
 
 # ======================
 # 1) 기본 정보 + 리셋
 # ======================
 st.markdown("## 1) 기본 정보")
 
-with st.container():
-    header_col, reset_col = st.columns([4, 1])
-    with header_col:
-        st.markdown("### 🎬 프로젝트 기본 설정")
-    with reset_col:
-        if st.button("↺ 기본 정보 리셋", key="reset_basic"):
-            st.session_state["brand"] = DEFAULT_BRAND
-            st.session_state["aspect"] = DEFAULT_ASPECT
-            st.session_state["duration"] = DEFAULT_DURATION
-            st.session_state["prompt_name"] = DEFAULT_PROMPT_NAME
-
-    c1, c2, c3 = st.columns([1.2, 0.8, 0.8])
-
-    with c1:
-        brand = st.text_input(
-            "브랜드 / 프로젝트명",
-            value=DEFAULT_BRAND,
-            placeholder="예: NICO MORI",
-            key="brand"
-        )
 
-    with c2:
-        aspect = st.selectbox(
-            "비율",
-            ["16:9", "9:16", "1:1", "21:9"],
-            index=0,
-            key="aspect"
-        )
+@st.fragment
+def basic_info_section():
+    with st.container():
+        header_col, reset_col = st.columns([4, 1])
+        with header_col:
+            st.markdown("### 🎬 프로젝트 기본 설정")
+        with reset_col:
+            if st.button("↺ 기본 정보 리셋", key="reset_basic"):
+                reset_fields("basic")
+
+        c1, c2, c3 = st.columns([1.2, 0.8, 0.8])
+
+        with c1:
+            st.text_input(
+                "브랜드 / 프로젝트명",
+                placeholder="예: NICO MORI",
+                key="brand"
+            )
+
+        with c2:
+            st.selectbox(
+                "비율",
+                ["16:9", "9:16", "1:1", "21:9"],
+                key="aspect"
+            )
+
+        with c3:
+            st.number_input(
+                "길이(초)",
+                min_value=3,
+                max_value=60,
+                step=1,
+                key="duration"
+            )
+
+    st.text_input(
+        "프롬프트 이름 (내가 구분용으로 쓸 제목)",
+        key="prompt_name"
+    )
 
-    with c3:
-        duration = st.number_input(
-            "길이(초)",
-            min_value=3,
-            max_value=60,
-            value=DEFAULT_DURATION,
-            step=1,
-            key="duration"
-        )
 
-prompt_name = st.text_input(
-    "프롬프트 이름 (내가 구분용으로 쓸 제목)",
-    value=DEFAULT_PROMPT_NAME,
-    key="prompt_name"
-)
+basic_info_section()
 
 st.markdown("---")
 
@@ -311,43 +346,42 @@ st.markdown("---")
 # ===============================
 st.markdown("## 2) 인물 / 캐릭터 / 액션")
 
-with st.container():
-    header_col, reset_col = st.columns([4, 1])
-    with header_col:
-        st.markdown("### 👤 캐릭터 & 액션")
-    with reset_col:
-        if st.button("↺ 인물/캐릭터 리셋", key="reset_character"):
-            st.session_state["subject"] = DEFAULT_SUBJECT
-            st.session_state["character_detail"] = DEFAULT_CHARACTER_DETAIL
-            st.session_state["action"] = DEFAULT_ACTION
-            st.session_state["emotion"] = DEFAULT_EMOTION
-
-    col3, col4 = st.columns(2)
-    with col3:
-        subject = st.text_input(
-            "주제 / 메인 인물",
-            value=DEFAULT_SUBJECT,
-            key="subject"
-        )
-        character_detail = st.text_area(
-            "캐릭터 디테일 (외모, 헤어, 의상 등)",
-            height=100,
-            value=DEFAULT_CHARACTER_DETAIL,
-            key="character_detail"
-        )
 
-    with col4:
-        action = st.text_area(
-            "액션 / 행동 (무엇을 하고 있는지)",
-            height=100,
-            value=DEFAULT_ACTION,
-            key="action"
-        )
-        emotion = st.text_input(
-            "감정 / 분위기",
-            value=DEFAULT_EMOTION,
-            key="emotion"
-        )
+@st.fragment
+def character_section():
+    with st.container():
+        header_col, reset_col = st.columns([4, 1])
+        with header_col:
+            st.markdown("### 👤 캐릭터 & 액션")
+        with reset_col:
+            if st.button("↺ 인물/캐릭터 리셋", key="reset_character"):
+                reset_fields("character")
+
+        col3, col4 = st.columns(2)
+        with col3:
+            st.text_input(
+                "주제 / 메인 인물",
+                key="subject"
+            )
+            st.text_area(
+                "캐릭터 디테일 (외모, 헤어, 의상 등)",
+                height=100,
+                key="character_detail"
+            )
+
+        with col4:
+            st.text_area(
+                "액션 / 행동 (무엇을 하고 있는지)",
+                height=100,
+                key="action"
+            )
+            st.text_input(
+                "감정 / 분위기",
+                key="emotion"
+            )
+
+
+character_section()
 
 st.markdown("---")
 
@@ -356,48 +390,45 @@ st.markdown("---")
 # ===============================
 st.markdown("## 3) 배경 / 카메라 / 스타일")
 
-with st.container():
-    header_col, reset_col = st.columns([4, 1])
-    with header_col:
-        st.markdown("### 🏙 배경 & 카메라 & 스타일")
-    with reset_col:
-        if st.button("↺ 배경/카메라 리셋", key="reset_bg_cam"):
-            st.session_state["background"] = DEFAULT_BACKGROUND
-            st.session_state["lighting"] = DEFAULT_LIGHTING
-            st.session_state["camera_move"] = DEFAULT_CAMERA_MOVE
-            st.session_state["style"] = DEFAULT_STYLE
-            st.session_state["composition"] = DEFAULT_COMPOSITION
-
-    col5, col6 = st.columns(2)
-    with col5:
-        background = st.text_area(
-            "배경 / 장소 설명",
-            height=100,
-            value=DEFAULT_BACKGROUND,
-            key="background"
-        )
-        lighting = st.text_input(
-            "조명 / 분위기",
-            value=DEFAULT_LIGHTING,
-            key="lighting"
-        )
 
-    with col6:
-        camera_move = st.text_input(
-            "카메라 움직임 / 샷 타입",
-            value=DEFAULT_CAMERA_MOVE,
-            key="camera_move"
-        )
-        style = st.text_input(
-            "스타일 (예: 시네마틱, 픽사풍, 사진 스타일 등)",
-            value=DEFAULT_STYLE,
-            key="style"
-        )
-        composition = st.text_input(
-            "구도 (예: rule of thirds, center framing 등)",
-            value=DEFAULT_COMPOSITION,
-            key="composition"
-        )
+@st.fragment
+def background_camera_section():
+    with st.container():
+        header_col, reset_col = st.columns([4, 1])
+        with header_col:
+            st.markdown("### 🏙 배경 & 카메라 & 스타일")
+        with reset_col:
+            if st.button("↺ 배경/카메라 리셋", key="reset_bg_cam"):
+                reset_fields("bg_cam")
+
+        col5, col6 = st.columns(2)
+        with col5:
+            st.text_area(
+                "배경 / 장소 설명",
+                height=100,
+                key="background"
+            )
+            st.text_input(
+                "조명 / 분위기",
+                key="lighting"
+            )
+
+        with col6:
+            st.text_input(
+                "카메라 움직임 / 샷 타입",
+                key="camera_move"
+            )
+            st.text_input(
+                "스타일 (예: 시네마틱, 픽사풍, 사진 스타일 등)",
+                key="style"
+            )
+            st.text_input(
+                "구도 (예: rule of thirds, center framing 등)",
+                key="composition"
+            )
+
+
+background_camera_section()
 
 st.markdown("---")
 
@@ -406,40 +437,41 @@ st.markdown("---")
 # ===============================
 st.markdown("## 4) 오디오 / 사운드")
 
-with st.container():
-    header_col, reset_col = st.columns([4, 1])
-    with header_col:
-        st.markdown("### 🎧 사운드 설계")
-    with reset_col:
-        if st.button("↺ 오디오 리셋", key="reset_audio"):
-            st.session_state["audio_bgm"] = DEFAULT_BGM
-            st.session_state["audio_sfx"] = DEFAULT_SFX
-            st.session_state["audio_voice"] = DEFAULT_VOICE
-
-    col_a1, col_a2 = st.columns(2)
-    with col_a1:
-        audio_bgm = st.text_input(
-            "배경 음악 (BGM)",
-            value=DEFAULT_BGM,
-            help="음악 장르, 분위기, 템포 등을 적어주세요.",
-            key="audio_bgm"
-        )
-        audio_sfx = st.text_area(
-            "효과음 (SFX)",
-            height=80,
-            value=DEFAULT_SFX,
-            help="현장감 있는 소리, 환경음 등을 적어주세요.",
-            key="audio_sfx"
-        )
 
-    with col_a2:
-        audio_voice = st.text_area(
-            "내레이션 / 대사 (선택)",
-            height=120,
-            value=DEFAULT_VOICE,
-            placeholder="예: 그녀의 내레이션, 브랜드 메시지, 짧은 카피 문구 등",
-            key="audio_voice"
-        )
+@st.fragment
+def audio_section():
+    with st.container():
+        header_col, reset_col = st.columns([4, 1])
+        with header_col:
+            st.markdown("### 🎧 사운드 설계")
+        with reset_col:
+            if st.button("↺ 오디오 리셋", key="reset_audio"):
+                reset_fields("audio")
+
+        col_a1, col_a2 = st.columns(2)
+        with col_a1:
+            st.text_input(
+                "배경 음악 (BGM)",
+                help="음악 장르, 분위기, 템포 등을 적어주세요.",
+                key="audio_bgm"
+            )
+            st.text_area(
+                "효과음 (SFX)",
+                height=80,
+                help="현장감 있는 소리, 환경음 등을 적어주세요.",
+                key="audio_sfx"
+            )
+
+        with col_a2:
+            st.text_area(
+                "내레이션 / 대사 (선택)",
+                height=120,
+                placeholder="예: 그녀의 내레이션, 브랜드 메시지, 짧은 카피 문구 등",
+                key="audio_voice"
+            )
+
+
+audio_section()
 
 st.markdown("---")
 
@@ -448,29 +480,43 @@ st.markdown("---")
 # ===============================
 st.markdown("## 5) 타임라인 / 씬 분할")
 
-with st.container():
-    header_col, reset_col = st.columns([4, 1])
-    with header_col:
-        st.markdown("### ⏱ 타임라인 구조")
-    with reset_col:
-        if st.button("↺ 타임라인 리셋", key="reset_timeline"):
-            st.session_state["timeline_overview"] = DEFAULT_TIMELINE_OVERVIEW
-            st.session_state["timeline_detail"] = DEFAULT_TIMELINE_DETAIL
-
-    timeline_overview = st.text_input(
-        "타임라인 요약",
-        value=DEFAULT_TIMELINE_OVERVIEW,
-        help="전체 길이와 씬 분할 개수 정도를 간단히 적어주세요.",
-        key="timeline_overview"
-    )
 
-    timeline_detail = st.text_area(
-        "씬별 타임라인 (초 단위로 적어도 좋아요)",
-        height=140,
-        value=DEFAULT_TIMELINE_DETAIL,
-        help="0-3초 / 3-6초 처럼 시간대별로 어떤 장면이 나오는지 적어주세요.",
-        key="timeline_detail"
-    )
+@st.fragment
+def timeline_section():
+    with st.container():
+        header_col, reset_col = st.columns([4, 1])
+        with header_col:
+            st.markdown("### ⏱ 타임라인 구조")
+        with reset_col:
+            if st.button("↺ 타임라인 리셋", key="reset_timeline"):
+                reset_fields("timeline")
+
+        st.text_input(
+            "타임라인 요약",
+            help="전체 길이와 씬 분할 개수 정도를 간단히 적어주세요.",
+            key="timeline_overview"
+        )
+
+        st.text_area(
+            "씬별 타임라인 (초 단위로 적어도 좋아요)",
+            height=140,
+            help="0-3초 / 3-6초 처럼 시간대별로 어떤 장면이 나오는지 적어주세요.",
+            key="timeline_detail"
+        )
+
+        # API 호출 전에 씬 구간을 로컬에서 미리 확인 (타임라인 구조는 이 값으로 채워짐)
+        segments = parse_timeline(st.session_state["timeline_detail"])
+        if segments:
+            st.caption(
+                f"인식된 구간 {len(segments)}개: " + " · ".join(segment.timestamp for segment in segments)
+            )
+            for issue in validate_timeline(segments, st.session_state["duration"]):
+                st.warning(issue)
+        else:
+            st.caption("인식된 시간 구간이 없습니다. 타임라인 구조는 모델이 직접 작성합니다. (예: 0-3초: ...)")
+
+
+timeline_section()
 
 st.markdown("---")
 
@@ -479,155 +525,1605 @@ st.markdown("---")
 # ===============================
 st.markdown("## 6) 추가 메모")
 
-with st.container():
-    header_col, reset_col = st.columns([4, 1])
-    with header_col:
-        st.markdown("### 📝 기타 메모")
-    with reset_col:
-        if st.button("↺ 메모 리셋", key="reset_extra"):
-            st.session_state["extra"] = DEFAULT_EXTRA
-
-    extra = st.text_area(
-        "추가로 반영되면 좋은 요소들 (선택)",
-        height=80,
-        value=DEFAULT_EXTRA,
-        placeholder="예: 손에 머그컵 들고 있음, 바람에 머리카락이 살짝 흩날림, 브랜딩 컬러를 배경에 살짝 반영 등",
-        key="extra"
+
+@st.fragment
+def extra_section():
+    with st.container():
+        header_col, reset_col = st.columns([4, 1])
+        with header_col:
+            st.markdown("### 📝 기타 메모")
+        with reset_col:
+            if st.button("↺ 메모 리셋", key="reset_extra"):
+                reset_fields("extra")
+
+        st.text_area(
+            "추가로 반영되면 좋은 요소들 (선택)",
+            height=80,
+            placeholder="예: 손에 머그컵 들고 있음, 바람에 머리카락이 살짝 흩날림, 브랜딩 컬러를 배경에 살짝 반영 등",
+            key="extra"
+        )
+
+
+extra_section()
+
+
+def preflight_section():
+    # 보내기 전 예상 토큰 (로컬 계산). 폼 섹션은 fragment 라 입력 중에는 갱신되지 않고 다음 전체 재실행 때 반영
+    brief, warnings = fit_brief({key: st.session_state[key] for key in FORM_FIELDS}, truncate_long_fields)
+    system_instruction = STRUCTURED_SYSTEM_INSTRUCTION if generation_mode == MODE_STRUCTURED else SYSTEM_INSTRUCTION
+    timeline_items = len(parse_timeline(brief["timeline_detail"])) or len(COMFYUI_JSON_TEMPLATE["timeline"])
+    plan = plan_request(
+        system_instruction, build_combined_prompt(brief), expected_output_tokens(timeline_items=timeline_items),
+        tuple(warnings),
+    )
+    st.caption(
+        f"📏 예상 입력 약 {plan.input_tokens:,} 토큰 (시스템 {plan.system_tokens:,} · 브리프 {plan.prompt_tokens:,}) · "
+        f"예상 출력 약 {plan.expected_output_tokens:,} 토큰 (예약 {plan.reserved_output_tokens:,})"
     )
+    if plan.warnings:
+        st.warning("긴 입력이 있습니다:\n" + "\n".join(f"- {warning}" for warning in plan.warnings))
+
+
+preflight_section()
 
 generate_btn = st.button("🚀 프롬프트 생성하기 (텍스트 기반)")
 
 # ==============================================================================
 # [3] OpenAI 호출 함수 (텍스트 기반)
 # ==============================================================================
-def ask_openai(prompt: str) -> str:
-    client = OpenAI(api_key=OPENAI_API_KEY)
-
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",  # 필요하면 gpt-4.1 / gpt-4.1-mini 등으로 변경 가능
-        messages=[
-            {"role": "system", "content": SYSTEM_INSTRUCTION},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=0.3,
+@st.cache_resource
+def get_response_cache() -> ResponseCache:
+    # 프로세스 전체(모든 세션)에서 하나의 캐시를 공유
+    return ResponseCache(CACHE_PATH, max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS)
+
+
+@st.cache_resource
+def get_similarity_index() -> SimilarityIndex:
+    # 캐시에 남아 있는 브리프들로 인덱스를 복원
+    index = SimilarityIndex(max_entries=CACHE_MAX_ENTRIES)
+    for key, namespace, text in get_response_cache().load_prompts():
+        index.add(key, text, namespace)
+    return index
+
+
+@st.cache_resource
+def get_single_flight() -> SingleFlight:
+    # 여러 세션에서 같은 캐시 key 로 동시에 생성하면 API 호출은 한 번만
+    return SingleFlight()
+
+
+@st.cache_resource
+def get_history_store() -> HistoryStore:
+    return HistoryStore(HISTORY_PATH)
+
+
+@st.cache_resource
+def get_telemetry() -> Telemetry:
+    # 모든 세션의 생성을 한곳에 모음 (부하 상황에서의 p95 회귀 확인용)
+    telemetry = Telemetry(recent=TELEMETRY_RECENT, metrics_path=METRICS_PATH)
+    if METRICS_PORT:
+        telemetry.serve(int(METRICS_PORT))
+    return telemetry
+
+
+@st.cache_resource
+def get_preset_library() -> PresetLibrary:
+    return PresetLibrary(PRESETS_PATH)
+
+
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    # 작업은 세션이 아니라 프로세스에 속함 (재실행 / 새로고침 중에도 계속 실행)
+    return JobQueue(max_workers=JOB_WORKERS)
+
+
+@st.cache_resource
+def get_scheduler() -> RateLimitScheduler:
+    # 세션별 공정 대기열 + 대화형 우선. 한 세션의 연속 요청이 rate limit 을 다 써서 다른 세션이 실패하지 않도록
+    return RateLimitScheduler(
+        max_concurrent=MAX_CONCURRENT_REQUESTS,
+        requests_per_minute=REQUESTS_PER_MINUTE,
+        tokens_per_minute=TOKENS_PER_MINUTE,
+    )
+
+
+@st.cache_resource
+def get_openai_client() -> "OpenAI":
+    # 모든 세션/재실행이 하나의 클라이언트(keep-alive 커넥션 풀)를 공유.
+    # openai SDK 는 import 비용이 커서 첫 생성 시점에만 불러옴 (콜드 스타트 단축)
+    from openai_client import ClientConfig, build_client
+
+    scheduler = get_scheduler()
+    return build_client(
+        # 재시도(429 / 5xx / 연결 오류)는 스케줄러가 대기열 순서대로 함 (SDK 재시도까지 켜면 재시도가 겹쳐서 한도를 더 씀)
+        ClientConfig(api_key=OPENAI_API_KEY, max_retries=0),
+        # 모든 응답의 rate limit 헤더로 스케줄러 한도를 맞추고, 429 면 retry-after 동안 전체 호출을 멈춤
+        on_response=lambda response: scheduler.update_from_headers(response.headers, response.status_code),
+    )
+
+
+@st.cache_resource
+def get_router() -> "Router":
+    # 지연 시간 통계는 모든 세션이 공유 (한 세션에서 느려진 백엔드는 다른 세션에서도 피함)
+    from model_router import GeminiBackend, OpenAIBackend, Router
+    from openai_client import ClientConfig, build_client
+
+    backends = [OpenAIBackend("openai", get_openai_client(), MODEL_NAME)]
+    if GEMINI_API_KEY:
+        backends.append(GeminiBackend("gemini", GEMINI_API_KEY, GEMINI_MODEL_NAME))
+    if COMPATIBLE_BASE_URL:
+        client = build_client(ClientConfig(api_key=COMPATIBLE_API_KEY, base_url=COMPATIBLE_BASE_URL, max_retries=0))
+        backends.append(OpenAIBackend("compatible", client, COMPATIBLE_MODEL_NAME))
+    return Router(backends, hedge_delay=ROUTER_HEDGE_DELAY_SECONDS)
+
+
+DEFAULT_LANE = Lane("default")
+
+
+def request_tokens(system_instruction: str, prompt: str, reserve_tokens: Optional[int], n: int = 1) -> int:
+    # 분당 토큰 한도에서 차감할 양: 입력 + 예상 출력 (상한을 지정했으면 그 이상은 나오지 않음)
+    output_tokens = reserve_tokens or DEFAULT_OUTPUT_TOKEN_ESTIMATE
+    if MAX_OUTPUT_TOKENS:
+        output_tokens = min(output_tokens, MAX_OUTPUT_TOKENS)
+    return count_system_tokens(system_instruction) + count_tokens(prompt) + output_tokens * n
+
+
+def output_limit() -> dict:
+    # API 에 보낼 출력 상한 인자 (Secrets 에 지정한 경우에만)
+    return {"max_tokens": MAX_OUTPUT_TOKENS} if MAX_OUTPUT_TOKENS else {}
+
+
+def ask_openai(
+    prompt: str,
+    system_instruction: str = SYSTEM_INSTRUCTION,
+    usage_log: Optional[list] = None,
+    mode: str = "text",
+    reserve_tokens: Optional[int] = None,
+    lane: Lane = DEFAULT_LANE,
+) -> str:
+    # 일반 텍스트 생성은 라우터를 거침 (백엔드가 OpenAI 하나뿐이면 직접 호출과 동일).
+    # 보조 백엔드로 가는 호출도 같은 스케줄러 슬롯을 씀 (동시 호출 수 상한은 백엔드와 무관하게 적용).
+    # 헤지 요청은 슬롯 / 토큰을 따로 잡을 수 있을 때만 보내고, 진 요청의 사용량도 기록
+    scheduler = get_scheduler()
+    tokens = request_tokens(system_instruction, prompt, reserve_tokens)
+
+    def discarded(completion) -> None:
+        if usage_log is not None:
+            mode_name = f"{mode}@{completion.backend}:hedge"
+            usage_log.append(usage_record(completion.usage, completion.model, mode_name, completion.latency))
+
+    completion = scheduler.run(
+        lane,
+        tokens,
+        lambda: get_router().complete(
+            system_instruction, prompt, TEMPERATURE, MAX_OUTPUT_TOKENS,
+            acquire_hedge=lambda: scheduler.try_acquire(lane, tokens),
+            on_discarded=discarded,
+        ),
+    )
+    if usage_log is not None:
+        usage_log.append(
+            usage_record(completion.usage, completion.model, f"{mode}@{completion.backend}", completion.latency)
+        )
+    return completion.text
+
+
+def ask_openai_stream(
+    prompt: str, usage_log: Optional[list] = None, reserve_tokens: Optional[int] = None, lane: Lane = DEFAULT_LANE
+) -> Iterator[str]:
+    client = get_openai_client()
+    start = time.perf_counter()
+    ttft = None
+    usage = None
+
+    def create():
+        nonlocal start
+        start = time.perf_counter()
+        return client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=build_messages(prompt),
+            temperature=TEMPERATURE,
+            stream=True,
+            **output_limit(),
+            # 마지막 청크에 usage 가 포함되도록 요청 (choices 가 빈 청크로 옴)
+            stream_options={"include_usage": True},
+        )
+
+    # 스트림은 끝까지 읽을 때까지 슬롯을 잡고 있음. 429 는 첫 청크 전에 오므로 다른 호출과 같이 스케줄러가 재시도
+    lease, stream = get_scheduler().open(lane, request_tokens(SYSTEM_INSTRUCTION, prompt, reserve_tokens), create)
+    received = []
+    try:
+        with lease:
+            try:
+                for chunk in stream:
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if ttft is None:
+                            ttft = time.perf_counter() - start
+                        received.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+            finally:
+                # 끝까지 읽지 않고 닫히면 (받는 쪽이 모두 취소) 응답 연결도 끊어서 더 생성되지 않게 함
+                stream.close()
+    finally:
+        mode = "stream"
+        if usage is None:
+            # 마지막 usage 청크 전에 닫힘: 보낸 입력과 받은 만큼의 출력으로 근사
+            mode = "stream:aborted"
+            usage = SimpleNamespace(
+                prompt_tokens=count_system_tokens(SYSTEM_INSTRUCTION) + count_tokens(prompt),
+                completion_tokens=count_tokens("".join(received)),
+            )
+        if usage_log is not None:
+            usage_log.append(usage_record(usage, MODEL_NAME, mode, time.perf_counter() - start, ttft))
+
+
+def ask_openai_structured(
+    prompt: str,
+    usage_log: Optional[list] = None,
+    system_instruction: str = STRUCTURED_SYSTEM_INSTRUCTION,
+    response_format: dict = STRUCTURED_RESPONSE_FORMAT,
+    mode: str = "structured",
+    reserve_tokens: Optional[int] = None,
+    lane: Lane = DEFAULT_LANE,
+) -> str:
+    client = get_openai_client()
+
+    start = time.perf_counter()
+    response = get_scheduler().run(
+        lane,
+        request_tokens(system_instruction, prompt, reserve_tokens),
+        lambda: client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=build_messages(prompt, system_instruction),
+            temperature=TEMPERATURE,
+            response_format=response_format,
+            **output_limit(),
+        ),
     )
+    if usage_log is not None:
+        usage_log.append(usage_record(response.usage, MODEL_NAME, mode, time.perf_counter() - start))
     return response.choices[0].message.content
 
 
-# ==============================================================================
-# [4] 텍스트 기반 생성 로직
-# ==============================================================================
-if generate_btn:
-    if not OPENAI_API_KEY:
-        st.error("OPENAI_API_KEY가 설정되지 않았습니다. Secrets에 'openai_api_key'를 등록해 주세요.")
+def ask_openai_variants(
+    prompt: str,
+    n: int,
+    usage_log: Optional[list] = None,
+    system_instruction: str = SYSTEM_INSTRUCTION,
+    response_format: Optional[dict] = None,
+    reserve_tokens: Optional[int] = None,
+    lane: Lane = DEFAULT_LANE,
+) -> list:
+    # n 개 후보를 한 번의 요청으로 생성 (라우터의 보조 백엔드는 n 을 지원하지 않으므로 OpenAI 직접 호출)
+    client = get_openai_client()
+
+    start = time.perf_counter()
+    # 출력 상한 / 예상치는 후보 하나 기준
+    extra = {"response_format": response_format} if response_format is not None else {}
+    extra.update(output_limit())
+    response = get_scheduler().run(
+        lane,
+        request_tokens(system_instruction, prompt, reserve_tokens, n),
+        lambda: client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=build_messages(prompt, system_instruction),
+            temperature=VARIANT_TEMPERATURE,
+            n=n,
+            **extra,
+        ),
+    )
+    if usage_log is not None:
+        usage_log.append(usage_record(response.usage, MODEL_NAME, f"variants×{n}", time.perf_counter() - start))
+    return [choice.message.content for choice in sorted(response.choices, key=lambda choice: choice.index)]
+
+
+def cached_ask_openai(
+    prompt: str,
+    brief_key: str,
+    system_instruction: str,
+    use_cache: bool = True,
+    usage_log: Optional[list] = None,
+    mode: str = "text",
+    reserve_tokens: Optional[int] = None,
+    lane: Lane = DEFAULT_LANE,
+) -> tuple:
+    # (응답 텍스트, 캐시 히트 여부). 분리 병렬 모드에서 워커 스레드로 실행됨
+    cache = get_response_cache()
+    cache_key = make_cache_key(MODEL_NAME, TEMPERATURE, system_instruction, brief_key)
+    if use_cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached, True
+
+    text, shared = get_single_flight().do(
+        cache_key, lambda: ask_openai(prompt, system_instruction, usage_log, mode, reserve_tokens, lane)
+    )
+    # 캐시 저장은 실제로 호출한 쪽(대표)만 함. 공유받았으면 비용이 들지 않았으므로 캐시 히트와 같이 취급
+    if not shared:
+        cache.set(cache_key, text)
+    return text, shared
+
+
+def generation_cache_key(brief: dict, structured: bool) -> tuple:
+    # (캐시 key, 유사도 비교 namespace). 같은 모드(시스템 지시문 / 응답 스키마)로 만든 결과끼리만 공유
+    cache_scope = STRUCTURED_SYSTEM_INSTRUCTION if structured else SYSTEM_INSTRUCTION
+    if structured:
+        # 타임라인 구간을 로컬에서 계산할 수 있으면 응답 스키마가 달라지므로 캐시도 따로 둠
+        cache_scope += structured_response_format(brief)["json_schema"]["name"]
+    return (
+        make_cache_key(MODEL_NAME, TEMPERATURE, cache_scope, canonical_brief(brief)),
+        make_cache_key(MODEL_NAME, TEMPERATURE, cache_scope, ""),
+    )
+
+
+def render_midjourney(box, mj: Optional[str], fallback_text: str) -> None:
+    if mj is None:
+        with box.container():
+            st.info("미드저니 프롬프트 구간을 찾을 수 없습니다.")
+            st.code(fallback_text, language="text")
     else:
-        combined_prompt = f"""
-[브랜드/프로젝트]
-{brand}
+        box.code(mj, language="text")
+
+
+def comfyui_download(comfyui_json: Optional[dict], brief: dict, key: str) -> None:
+    # ComfyUI 에 바로 불러올 수 있는 JSON 파일 (다운로드해도 재실행하지 않음)
+    if comfyui_json is None:
+        return
+    st.download_button(
+        "⬇ ComfyUI JSON",
+        json.dumps(comfyui_json, ensure_ascii=False, indent=2),
+        file_name=scene_filename(brief.get("prompt_name", ""), brief.get("brand", "")),
+        mime="application/json",
+        key=key,
+        on_click="ignore",
+    )
 
-[프롬프트 이름]
-{prompt_name}
 
-[영상 정보]
-- Aspect Ratio: {aspect}
-- Duration: {duration}초
+def record_history(
+    brief: dict,
+    combined_prompt: str,
+    mode: str,
+    result_text: str,
+    comfyui_json: Optional[dict],
+    mj: Optional[str],
+    usage_records: list,
+) -> None:
+    # 새로 생성된 결과만 기록 (캐시 / 유사 브리프 재사용은 이미 기록된 결과)
+    get_history_store().add({
+        "prompt_name": brief["prompt_name"],
+        "brand": brief["brand"],
+        "mode": mode,
+        "model": MODEL_NAME,
+        "brief": brief,
+        "combined_prompt": combined_prompt,
+        "result_text": result_text,
+        "comfyui_json": comfyui_json,
+        "midjourney_prompt": mj,
+        "prompt_tokens": sum(r["prompt_tokens"] for r in usage_records),
+        "cached_tokens": sum(r["cached_tokens"] for r in usage_records),
+        "completion_tokens": sum(r["completion_tokens"] for r in usage_records),
+        "latency": max((r["latency"] for r in usage_records), default=None),
+    })
+
+
+def remember_generation(brief: dict, comfyui_json: Optional[dict], mj: Optional[str]) -> None:
+    # 부분 재생성 모드의 비교 기준. JSON 을 파싱하지 못한 결과는 기준으로 쓸 수 없음
+    if comfyui_json is None:
+        st.session_state.pop("last_generation", None)
+    else:
+        st.session_state["last_generation"] = {"brief": brief, "comfyui_json": comfyui_json, "midjourney_prompt": mj}
 
-[주제 / 메인 인물]
-{subject}
 
-[캐릭터 디테일]
-{character_detail}
+# ==============================================================================
+# [4] 텍스트 기반 생성 로직
+# ==============================================================================
+def job_lane(job: Job, request: dict, cancellable: bool = True) -> Lane:
+    # 스케줄러 대기열 자리 (세션별 라운드 로빈). 대기 순번은 진행 상황에 표시하고, 대기 중 취소되면 바로 빠짐.
+    # single_flight 로 다른 세션과 공유하는 호출은 cancellable=False (대표 세션이 취소돼도 합류한 세션은 결과를 받도록)
+    return Lane(
+        request["session_key"],
+        request["priority"],
+        job.check_cancelled if cancellable else None,
+        lambda position: job.update(queue_position=position),
+    )
 
-[액션 / 행동]
-{action}
 
-[감정 / 분위기]
-{emotion}
+def validate_and_repair(
+    job: Job,
+    request: dict,
+    brief: dict,
+    comfyui_json: Optional[dict],
+    mj: Optional[str],
+    trace: Trace,
+) -> tuple:
+    # (comfyui_json, mj, 남은 위반 목록, 수리 요청 횟수). 로컬 검증은 모든 응답에 대해 실행하고,
+    # 위반이 있으면 위반 섹션만 "이 항목을 고쳐 달라"는 짧은 요청으로 다시 받아 병합
+    with trace.phase("validate"):
+        violations = validate_output(comfyui_json, mj, brief)
+    trace.count("validated")
+    trace.count("validation_failed", bool(violations))
+
+    repairs = 0
+    while violations and request["auto_repair"] and repairs < REPAIR_MAX_ROUNDS:
+        sections, include_mj = repair_targets(violations)
+        if not sections and not include_mj:
+            # JSON 자체를 파싱하지 못한 경우 등은 부분 수리 대상이 아님
+            break
+        repairs += 1
+        job.update(
+            message=f"규칙 위반 {len(violations)}건을 고치는 중입니다... ("
+            + ", ".join(sections + ([MIDJOURNEY_SECTION] if include_mj else [])) + ")"
+        )
+        segments = parse_timeline(brief["timeline_detail"])
+        prose_timeline = "timeline" in sections and bool(segments)
+        response_format = patch_response_format(sections, include_mj, prose_timeline)
+        comfyui_json = drop_unknown_sections(comfyui_json)
+        expected = expected_output_tokens(sections, include_mj, notes=False, timeline_items=len(segments) or 3)
+        with trace.phase("repair"):
+            repair_text = ask_openai_structured(
+                build_repair_prompt(brief, comfyui_json, mj, violations, sections, include_mj),
+                request["usage_log"], PATCH_SYSTEM_INSTRUCTION, response_format, "repair", reserved_tokens_for(expected),
+                job_lane(job, request),
+            )
+        job.check_cancelled()
+        try:
+            patch = parse_patch_output(repair_text, response_format)
+        except StructuredOutputError:
+            continue
+        comfyui_json = merge_patch(comfyui_json, patch)
+        if prose_timeline:
+            comfyui_json = apply_timeline(comfyui_json, brief)
+        if include_mj:
+            mj = patch["midjourney_prompt"].strip()
+        with trace.phase("validate"):
+            violations = validate_output(comfyui_json, mj, brief)
+
+    trace.count("repair_requests", repairs)
+    if repairs:
+        trace.count("repair_unresolved" if violations else "repaired")
+    return comfyui_json, mj, violations, repairs
+
+
+def run_generation(job: Job, request: dict) -> dict:
+    # 백그라운드 워커에서 실행: st.* / st.session_state 를 쓰지 않고, 진행 상황은 job.update() 로만 알림.
+    # 단계별 소요 시간은 성공 / 실패 / 취소와 관계없이 기록
+    trace = Trace(GENERATION_KINDS[request["generation_mode"]])
+    # 이 작업의 사용량만 따로 모음 (세션 기록에도 같이 남음)
+    usage_log = ScopedUsageLog(request["usage_log"])
+    request = {**request, "usage_log": usage_log}
+    outcome = "error"
+    try:
+        result = generate(job, request, trace)
+        outcome = "ok"
+    except JobCancelled:
+        outcome = "cancelled"
+        raise
+    finally:
+        wasted = request["speculative"] and job.cancelled
+        # 취소로 닫힌 스트림의 사용량은 이 시점 뒤에 도착할 수 있으므로, 버린 미리 생성이면 도착할 때 따로 셈
+        records = usage_log.follow(count_late_wasted_tokens) if wasted else list(usage_log)
+        for record in records:
+            trace.count("api_calls")
+            trace.count("prompt_tokens", record["prompt_tokens"])
+            trace.count("completion_tokens", record["completion_tokens"])
+            if record["mode"] == "repair":
+                trace.count("repair_tokens", record["prompt_tokens"] + record["completion_tokens"])
+        tokens = trace.counters.get("prompt_tokens", 0) + trace.counters.get("completion_tokens", 0)
+        job.update(tokens=tokens)
+        if request["speculative"]:
+            # 버려진 미리 생성은 여기서만 셈: 도중에 취소됐으면 이 trace 에, 완료 후 입력이 바뀌어 버려지면 그때
+            trace.count("speculative_started")
+            if wasted:
+                trace.count("speculative_wasted")
+                trace.count("speculative_wasted_tokens", tokens)
+            elif outcome == "ok":
+                job.on_cancel(lambda: count_wasted_speculation(tokens))
+        trace.finish(outcome)
+        get_telemetry().record(trace)
+    return {**result, "trace": trace}
+
+
+def count_wasted_speculation(tokens: int) -> None:
+    telemetry = get_telemetry()
+    telemetry.count("speculative_wasted")
+    telemetry.count("speculative_wasted_tokens", tokens)
+
+
+def count_late_wasted_tokens(record: dict) -> None:
+    get_telemetry().count("speculative_wasted_tokens", record["prompt_tokens"] + record["completion_tokens"])
+
+
+def generate(job: Job, request: dict, trace: Trace) -> dict:
+    generation_mode = request["generation_mode"]
+    bypass_cache = request["bypass_cache"]
+    # run_generation 이 만든 이 작업 전용 기록 (ScopedUsageLog)
+    usage_log = request["usage_log"]
+    with trace.phase("prompt"):
+        # 긴 자유 입력은 필드별 토큰 상한으로 자르거나 경고만 남김 (빈 / 중복 섹션은 프롬프트 조립 시 제외)
+        brief, budget_warnings = fit_brief(request["brief"], request["truncate_long_fields"])
+        combined_prompt = build_combined_prompt(brief)
+        # 캐시 키는 정규화된 브리프 기준 (프롬프트 이름 / 공백 / 브랜드 대소문자 차이 무시)
+        brief_key = canonical_brief(brief)
+        timeline_items = len(parse_timeline(brief["timeline_detail"])) or len(COMFYUI_JSON_TEMPLATE["timeline"])
+    trace.count("fields_over_budget", len(budget_warnings))
+
+    def budget(system_instruction: str, prompt: str, expected: int) -> RequestBudget:
+        plan = plan_request(system_instruction, prompt, expected, tuple(budget_warnings))
+        trace.count("estimated_input_tokens", plan.input_tokens)
+        return plan
+
+    lane = job_lane(job, request)
+    shared_lane = job_lane(job, request, cancellable=False)
+
+    # 미리 생성(추측) 결과는 사용자가 생성 버튼으로 가져갈 때까지 생성 기록에 남기지 않음 (버려진 결과 제외)
+    pending_history = []
+
+    def history(*args) -> None:
+        if request["speculative"]:
+            pending_history.append(args)
+        else:
+            record_history(*args)
+
+    def prepare_client() -> None:
+        # 클라이언트 / 라우터는 프로세스당 한 번 만들어지므로 보통 0 에 가깝고, 콜드 스타트 때만 커짐
+        with trace.phase("client"):
+            get_router()
+
+    # 부분 재생성: 마지막으로 생성한 브리프와 비교해 다시 만들 섹션을 결정 (None 이면 전체 생성)
+    last_generation = request["last_generation"]
+    patch_fields, patch_sections = [], None
+    if generation_mode == MODE_INCREMENTAL and last_generation is not None:
+        patch_fields = changed_fields(last_generation["brief"], brief)
+        patch_sections = sections_to_regenerate(patch_fields)
+
+    result = {
+        "brief": brief, "similar_score": None, "mj_notes": None, "variants": None, "violations": [], "repairs": 0,
+        "budget": None, "budget_warnings": budget_warnings, "pending_history": pending_history,
+    }
+
+    if generation_mode == MODE_SPLIT:
+        # 두 요청을 동시에 보내고, 먼저 도착한 쪽 결과부터 진행 상황에 반영
+        job.update(message="ComfyUI JSON / 미드저니 프롬프트를 병렬로 생성하는 중입니다...")
+        cache_hits = 0
+        split_texts = {}
+        comfyui_budget = budget(
+            COMFYUI_SYSTEM_INSTRUCTION, combined_prompt,
+            expected_output_tokens(include_midjourney=False, timeline_items=timeline_items),
+        )
+        midjourney_budget = budget(MIDJOURNEY_SYSTEM_INSTRUCTION, combined_prompt, expected_output_tokens([]))
+        result["budget"] = comfyui_budget
+        prepare_client()
+        with trace.phase("api"), ThreadPoolExecutor(max_workers=2) as pool:
+            futures = {
+                pool.submit(
+                    cached_ask_openai, combined_prompt, brief_key, COMFYUI_SYSTEM_INSTRUCTION,
+                    not bypass_cache, usage_log, "split-comfyui", comfyui_budget.reserved_output_tokens, shared_lane,
+                ): "comfyui",
+                pool.submit(
+                    cached_ask_openai, combined_prompt, brief_key, MIDJOURNEY_SYSTEM_INSTRUCTION,
+                    not bypass_cache, usage_log, "split-midjourney", midjourney_budget.reserved_output_tokens, shared_lane,
+                ): "midjourney",
+            }
+            for future in as_completed(futures):
+                text, from_cache = future.result()
+                cache_hits += from_cache
+                split_texts[futures[future]] = text
+                if futures[future] == "comfyui":
+                    job.update(result_text=text)
+                else:
+                    job.update(mj=extract_midjourney(text))
+
+        with trace.phase("extract"):
+            comfyui_json = extract_comfyui_json(split_texts["comfyui"])
+            mj = extract_midjourney(split_texts["midjourney"])
+        original_mj = mj
+        comfyui_json, mj, violations, repairs = validate_and_repair(job, request, brief, comfyui_json, mj, trace)
+        if repairs:
+            # 수리된 결과로 두 응답을 고쳐서 캐시에도 덮어씀 (다음 히트부터는 수리 요청 없음)
+            split_texts["comfyui"] = replace_comfyui_json(split_texts["comfyui"], comfyui_json)
+            if mj:
+                split_texts["midjourney"] = replace_midjourney(split_texts["midjourney"], original_mj, mj)
+            with trace.phase("cache"):
+                for name, instruction in (
+                    ("comfyui", COMFYUI_SYSTEM_INSTRUCTION), ("midjourney", MIDJOURNEY_SYSTEM_INSTRUCTION)
+                ):
+                    get_response_cache().set(
+                        make_cache_key(MODEL_NAME, TEMPERATURE, instruction, brief_key), split_texts[name]
+                    )
+        trace.count("cache_hit", cache_hits)
+        if cache_hits == len(futures):
+            message = "프롬프트 생성 완료! (캐시된 결과 사용)"
+        else:
+            with trace.phase("history"):
+                history(
+                    brief, combined_prompt, "split",
+                    split_texts["comfyui"] + "\n\n" + split_texts["midjourney"],
+                    comfyui_json, mj, list(usage_log),
+                )
+            message = "프롬프트 생성 완료!"
+        return {
+            **result,
+            "message": message,
+            "result_text": split_texts["comfyui"],
+            "comfyui_json": comfyui_json,
+            "mj": mj,
+            "mj_fallback": split_texts["midjourney"],
+            "mj_notes": split_texts["midjourney"],
+            "violations": violations,
+            "repairs": repairs,
+        }
+
+    if patch_sections is not None:
+        trace.kind = "patch"
+        previous_json = last_generation["comfyui_json"]
+        previous_mj = last_generation["midjourney_prompt"]
+        include_mj = not previous_mj or any(key in MIDJOURNEY_FIELDS for key in patch_fields)
+
+        if patch_sections or include_mj:
+            response_format = patch_response_format(
+                patch_sections, include_mj, prose_timeline=bool(parse_timeline(brief["timeline_detail"]))
+            )
+            patch_prompt = build_patch_prompt(
+                brief, previous_json, patch_fields, patch_sections, include_mj, previous_mj
+            )
+            result["budget"] = budget(
+                PATCH_SYSTEM_INSTRUCTION, patch_prompt,
+                expected_output_tokens(patch_sections, include_mj, notes=False, timeline_items=timeline_items),
+            )
+            job.update(
+                message="변경된 섹션만 다시 생성하는 중입니다... (" + ", ".join(patch_sections or ["midjourney"]) + ")"
+            )
+            prepare_client()
+            with trace.phase("api"):
+                patch_text = ask_openai_structured(
+                    patch_prompt, usage_log, PATCH_SYSTEM_INSTRUCTION, response_format, "patch",
+                    result["budget"].reserved_output_tokens, lane,
+                )
+            job.check_cancelled()
+            with trace.phase("extract"):
+                patch = parse_patch_output(patch_text, response_format)
+                comfyui_json = apply_timeline(merge_patch(previous_json, patch), brief)
+                mj = patch.get("midjourney_prompt", previous_mj).strip()
+            comfyui_json, mj, violations, repairs = validate_and_repair(job, request, brief, comfyui_json, mj, trace)
+            result = {**result, "violations": violations, "repairs": repairs}
+            result_text = patched_to_markdown(comfyui_json, mj, patch_sections)
+            with trace.phase("history"):
+                history(
+                    brief, combined_prompt, "patch", result_text, comfyui_json, mj, list(usage_log)
+                )
+            message = (
+                f"부분 재생성 완료! ({len(patch_sections)}/{len(COMFYUI_JSON_TEMPLATE)} 섹션 · "
+                f"변경된 입력: {', '.join(patch_fields)})"
+            )
+        else:
+            # 프롬프트 이름처럼 결과에 영향이 없는 필드만 바뀐 경우
+            comfyui_json, mj = previous_json, previous_mj
+            result_text = patched_to_markdown(comfyui_json, mj, [])
+            message = "결과에 영향을 주는 변경이 없어 이전 결과를 그대로 사용합니다."
+        return {
+            **result,
+            "message": message,
+            "result_text": result_text,
+            "comfyui_json": comfyui_json,
+            "mj": mj,
+            "mj_fallback": result_text,
+        }
+
+    use_structured = generation_mode == MODE_STRUCTURED
+    system_instruction = STRUCTURED_SYSTEM_INSTRUCTION if use_structured else SYSTEM_INSTRUCTION
+    variant_count = request["variant_count"]
+    result["budget"] = budget(
+        system_instruction, combined_prompt, expected_output_tokens(timeline_items=timeline_items)
+    )
+    reserve_tokens = result["budget"].reserved_output_tokens
+
+    if variant_count > 1 and generation_mode in VARIANT_MODES:
+        # 후보 여러 개: 캐시를 거치지 않고 한 번의 요청(n)으로 생성한 뒤 거의 같은 후보는 제외
+        response_format = structured_response_format(brief) if use_structured else None
+        trace.kind = "variants"
+        job.update(message=f"후보 {variant_count}개를 한 번의 요청으로 생성하는 중입니다...")
+        prepare_client()
+        start = time.perf_counter()
+        with trace.phase("api"):
+            texts = ask_openai_variants(
+                combined_prompt, variant_count, usage_log, system_instruction, response_format, reserve_tokens, lane
+            )
+        elapsed = time.perf_counter() - start
+        job.check_cancelled()
+
+        variants = []
+        extract_start = time.perf_counter()
+        for text in texts:
+            if use_structured:
+                try:
+                    structured = parse_structured_output(text, response_format["json_schema"]["schema"])
+                except StructuredOutputError:
+                    # 스키마 검증에 실패한 후보만 제외
+                    continue
+                structured["comfyui_json"] = apply_timeline(structured["comfyui_json"], brief)
+                variants.append({
+                    "result_text": structured_to_markdown(structured),
+                    "comfyui_json": structured["comfyui_json"],
+                    "mj": structured["midjourney_prompt"].strip(),
+                })
+            else:
+                variants.append({
+                    "result_text": text,
+                    "comfyui_json": extract_comfyui_json(text),
+                    "mj": extract_midjourney(text),
+                })
+        if not variants:
+            raise StructuredOutputError("모든 후보가 스키마 검증에 실패했습니다")
+
+        kept = dedupe_similar([v["mj"] or v["result_text"] for v in variants], VARIANT_DEDUPE_THRESHOLD)
+        variants = [variants[index] for index in kept]
+        trace.add("extract", time.perf_counter() - extract_start)
+        # 후보는 검증만 하고 수리 요청은 보내지 않음 (후보마다 요청이 늘어나고, 위반 없는 다른 후보를 고르면 됨)
+        with trace.phase("validate"):
+            for variant in variants:
+                variant["violations"] = validate_output(variant["comfyui_json"], variant["mj"], brief)
+                trace.count("validated")
+                trace.count("validation_failed", bool(variant["violations"]))
+        trace.count("variants", len(variants))
+        with trace.phase("history"):
+            for number, variant in enumerate(variants):
+                # 토큰 사용량은 한 번의 요청이므로 첫 후보에만 기록
+                history(
+                    brief, combined_prompt, f"variant {number + 1}/{len(variants)}", variant["result_text"],
+                    variant["comfyui_json"], variant["mj"], list(usage_log) if number == 0 else [],
+                )
+
+        usage = usage_log[-1]
+        message = (
+            f"후보 {len(variants)}개 생성 완료! (중복 {len(texts) - len(variants)}개 제외) · "
+            f"입력 {usage['prompt_tokens']:,} · 출력 {usage['completion_tokens']:,} 토큰 · {elapsed:.1f}초 "
+            f"— 같은 브리프로 {variant_count}번 생성했다면 입력 약 {usage['prompt_tokens'] * variant_count:,} 토큰 · "
+            f"약 {elapsed * variant_count:.1f}초"
+        )
+        return {
+            **result,
+            "message": message,
+            "result_text": variants[0]["result_text"],
+            "comfyui_json": variants[0]["comfyui_json"],
+            "mj": variants[0]["mj"],
+            "mj_fallback": variants[0]["result_text"],
+            "variants": variants,
+            "violations": variants[0]["violations"],
+        }
+
+    if use_structured:
+        response_format = structured_response_format(brief)
+    with trace.phase("cache"):
+        cache = get_response_cache()
+        similarity_index = get_similarity_index()
+        cache_key, namespace = generation_cache_key(brief, use_structured)
+        brief_text = similarity_text(brief)
+        response_text = None if bypass_cache else cache.get(cache_key)
+        similar_score = None
+
+        reuse_similar_result = request["reuse_similar"] and not bypass_cache and not request["force_regenerate"]
+        if response_text is None and reuse_similar_result:
+            match = similarity_index.lookup(brief_text, request["similarity_threshold"], namespace)
+            if match is not None:
+                similar_key, similar_score = match
+                response_text = cache.get(similar_key, record_stats=False)
+                if response_text is None:
+                    similar_score = None
+
+    from_cache = response_text is not None
+    trace.count("similar_hit" if similar_score is not None else "cache_hit", from_cache)
+    single_flight = get_single_flight()
+    shared = False
+
+    if response_text is None:
+        prepare_client()
+        api_start = time.perf_counter()
+        # 같은 cache_key 로 이미 진행 중인 호출이 있으면 (다른 세션 포함) 그 결과를 같이 받음
+        if use_structured:
+            job.update(message="OpenAI가 프롬프트를 생성하는 중입니다... (JSON 모드)")
+            response_text, shared = single_flight.do(
+                cache_key,
+                lambda: ask_openai_structured(
+                    combined_prompt, usage_log, response_format=response_format, reserve_tokens=reserve_tokens,
+                    lane=shared_lane,
+                ),
+            )
+        elif generation_mode == MODE_STREAM:
+            deltas, shared = single_flight.stream(
+                cache_key, lambda: ask_openai_stream(combined_prompt, usage_log, reserve_tokens, shared_lane)
+            )
+            job.update(
+                message="같은 요청이 이미 생성 중이어서 그 결과를 함께 받는 중입니다... (실시간 출력)"
+                if shared else "OpenAI가 프롬프트를 생성하는 중입니다... (실시간 출력)"
+            )
+            chunks = []
+            last_refresh = 0.0
+            try:
+                for delta in deltas:
+                    job.check_cancelled()
+                    if not chunks:
+                        trace.add("ttft", time.perf_counter() - api_start)
+                    chunks.append(delta)
+                    now = time.monotonic()
+                    if now - last_refresh >= STREAM_REFRESH_SECONDS:
+                        partial = "".join(chunks)
+                        # 미드저니 구간 마커가 보이는 즉시 코드 박스부터 채움
+                        job.update(result_text=partial, mj=extract_midjourney(partial))
+                        last_refresh = now
+            finally:
+                # 취소로 중간에 그만두면 바로 알려서, 같이 받는 세션이 없을 때 업스트림 스트림을 닫게 함
+                deltas.close()
+            response_text = "".join(chunks)
+            trace.count("stream_chunks", len(chunks))
+        else:
+            job.update(message="OpenAI가 프롬프트를 생성하는 중입니다...")
+            response_text, shared = single_flight.do(
+                cache_key,
+                lambda: ask_openai(combined_prompt, usage_log=usage_log, reserve_tokens=reserve_tokens, lane=shared_lane),
+            )
+        trace.add("api", time.perf_counter() - api_start)
+        trace.count("shared", shared)
+        job.check_cancelled()
+
+    with trace.phase("extract"):
+        if use_structured:
+            # 스키마 검증에 실패한 응답은 캐시에 저장하지 않음
+            structured = parse_structured_output(response_text, response_format["json_schema"]["schema"])
+            structured["comfyui_json"] = apply_timeline(structured["comfyui_json"], brief)
+            result_text = structured_to_markdown(structured)
+            comfyui_json = structured["comfyui_json"]
+            mj = structured["midjourney_prompt"].strip()
+        else:
+            result_text = response_text
+            comfyui_json = extract_comfyui_json(result_text)
+            mj = extract_midjourney(result_text)
+
+    original_mj = mj
+    comfyui_json, mj, violations, repairs = validate_and_repair(job, request, brief, comfyui_json, mj, trace)
+    if repairs:
+        # 캐시에는 수리된 응답을 저장 (같은 브리프의 다음 히트부터는 수리 요청 없음)
+        response_text = rewrite_response(
+            response_text, comfyui_json, mj, original_mj,
+            response_format["json_schema"]["schema"] if use_structured else None,
+        )
+        if use_structured:
+            result_text = structured_to_markdown(
+                {**structured, "comfyui_json": comfyui_json, "midjourney_prompt": mj}
+            )
+        else:
+            result_text = response_text
+
+    if similar_score is not None:
+        message = f"프롬프트 생성 완료! (비슷한 이전 브리프의 결과 재사용 · 유사도 {similar_score:.2f})"
+    elif from_cache:
+        message = "프롬프트 생성 완료! (캐시된 결과 사용)"
+        if repairs:
+            # 검증 규칙이 생기기 전에 저장된 결과 등: 수리된 결과로 교체
+            with trace.phase("cache"):
+                cache.set(cache_key, response_text, brief_text, namespace)
+    elif shared:
+        # 캐시 / 유사도 인덱스 / 생성 기록은 실제로 호출한 세션(대표)이 남김
+        message = "프롬프트 생성 완료! (동시에 진행 중이던 같은 요청의 결과 공유)"
+    else:
+        with trace.phase("cache"):
+            cache.set(cache_key, response_text, brief_text, namespace)
+            similarity_index.add(cache_key, brief_text, namespace)
+        with trace.phase("history"):
+            history(brief, combined_prompt, trace.kind, result_text, comfyui_json, mj, list(usage_log))
+        message = "프롬프트 생성 완료!"
+
+    return {
+        **result,
+        "message": message,
+        "similar_score": similar_score,
+        "result_text": result_text,
+        "comfyui_json": comfyui_json,
+        "mj": mj,
+        "mj_fallback": result_text,
+        "violations": violations,
+        "repairs": repairs,
+    }
 
-[배경 / 장소]
-{background}
 
-[조명 / 분위기]
-{lighting}
+def prefetch_presets(job: Job, briefs: list, structured: bool, usage_log: list, session_key: str) -> dict:
+    # 프리셋 결과를 미리 생성해서 응답 캐시에 저장 (하나가 실패해도 나머지는 계속).
+    # 배치 우선순위로 호출하므로 다른 세션의 대화형 생성이 대기열에서 먼저 나감.
+    # 브리프는 목록의 캐시 키와 같도록 호출하는 쪽에서 이미 토큰 예산을 적용해서 넘김
+    failed = []
+    for number, brief in enumerate(briefs, start=1):
+        job.check_cancelled()
+        job.update(prefetch=f"{number}/{len(briefs)} · {brief['prompt_name']}")
+        try:
+            run_generation(job, {
+                "brief": brief,
+                "generation_mode": MODE_STRUCTURED if structured else MODE_BLOCKING,
+                "bypass_cache": False,
+                "reuse_similar": False,
+                "similarity_threshold": 1.0,
+                "force_regenerate": False,
+                "last_generation": None,
+                "variant_count": 1,
+                "auto_repair": True,
+                "truncate_long_fields": False,
+                "usage_log": usage_log,
+                "session_key": session_key,
+                "priority": PRIORITY_BATCH,
+                "speculative": False,
+            })
+        except JobCancelled:
+            raise
+        except Exception as e:
+            failed.append(f"{brief['prompt_name']}: {e}")
+    return {"count": len(briefs), "failed": failed}
+
+
+def result_columns() -> tuple:
+    left, right = st.columns(2)
+    with left:
+        st.markdown("### 🧩 전체 결과 (Markdown)")
+        result_box = st.empty()
+    with right:
+        st.markdown("### 🎨 Midjourney 프롬프트 (코드 복사용)")
+        mj_box = st.empty()
+        mj_notes_box = st.empty()
+    return result_box, mj_box, mj_notes_box
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def job_progress_section(job_id: str):
+    # 실행 중인 작업만 주기적으로 다시 그림. 끝나면 앱 전체를 재실행해서 최종 결과를 그리고 폴링을 멈춤
+    job = get_job_queue().get(job_id)
+    if job is None or job.done:
+        st.rerun()
+
+    progress = job.progress
+    status_col, cancel_col = st.columns([4, 1])
+    with status_col:
+        st.info(f"{progress.get('message', '생성 대기 중입니다...')} ({job.elapsed:.0f}초)")
+        if progress.get("queue_position"):
+            st.caption(f"⏳ API 호출 대기열 {progress['queue_position']}번째 (다른 세션의 요청 / rate limit 대기)")
+    with cancel_col:
+        if st.button("⏹ 생성 취소", key=f"cancel_job_{job.id}"):
+            job.cancel()
+            st.rerun()
+
+    result_box, mj_box, _ = result_columns()
+    if progress.get("result_text"):
+        result_box.markdown(progress["result_text"])
+    if progress.get("mj"):
+        mj_box.code(progress["mj"], language="text")
+
+
+def render_budget(budget: Optional[RequestBudget], warnings: list) -> None:
+    # 요청 예산이 있으면 그 경고(필드별 + 프롬프트 전체)를, 없으면(API 호출 없음) 필드별 경고만 표시
+    if budget is not None:
+        warnings = budget.warnings
+    if warnings:
+        st.warning("토큰 예산을 넘는 입력:\n" + "\n".join(f"- {warning}" for warning in warnings))
+    if budget is not None:
+        st.caption(
+            f"📏 요청 입력 약 {budget.input_tokens:,} 토큰 · 출력 예약 {budget.reserved_output_tokens:,} 토큰 "
+            f"(예상 {budget.expected_output_tokens:,})"
+        )
 
-[카메라 움직임 / 샷 타입]
-{camera_move}
 
-[스타일]
-{style}
+def render_violations(violations: list, repairs: int) -> None:
+    if repairs and not violations:
+        st.caption(f"🔧 규칙 위반을 부분 수리 요청 {repairs}회로 고쳤습니다.")
+    if violations:
+        title = f"⚠️ 규칙 위반 {len(violations)}건" + (f" (수리 요청 {repairs}회 후에도 남음)" if repairs else "")
+        with st.expander(title):
+            st.markdown("\n".join(f"- `{violation.path}` {violation.message}" for violation in violations))
+
+
+def render_job(job: Job) -> None:
+    if job.status == STATUS_CANCELLED:
+        st.warning("생성을 취소했습니다.")
+        return
+    if job.status == STATUS_ERROR:
+        if isinstance(job.error, StructuredOutputError):
+            st.error(f"구조화 응답 검증에 실패했습니다: {job.error}")
+        else:
+            st.error(f"실행 중 오류가 발생했습니다: {job.error}")
+        return
+
+    result = job.result
+    # 부분 재생성의 비교 기준은 작업이 끝난 뒤 한 번만 갱신 (생성 중에 폼을 고쳐도 제출 시점 브리프 기준)
+    if st.session_state.get("applied_job") != job.id:
+        remember_generation(result["brief"], result["comfyui_json"], result["mj"])
+        # 미리 생성한 결과는 사용할 때 생성 기록에 남김
+        for args in result["pending_history"]:
+            record_history(*args)
+        st.session_state["applied_job"] = job.id
+
+    st.success(result["message"])
+    if st.session_state.get("speculation_claimed") == job.id:
+        st.caption("🔮 입력 중에 미리 생성해 둔 결과입니다.")
+    render_budget(result["budget"], result["budget_warnings"])
+    render_violations(result["violations"], result["repairs"])
+    if result["variants"]:
+        # 후보를 나란히 표시 (부분 재생성의 비교 기준은 첫 번째 후보)
+        for column, (number, variant) in zip(
+            st.columns(len(result["variants"])), enumerate(result["variants"], start=1)
+        ):
+            with column:
+                st.markdown(f"### 🎨 후보 {number}")
+                if variant["violations"]:
+                    st.caption(f"⚠️ 규칙 위반 {len(variant['violations'])}건")
+                render_midjourney(st.empty(), variant["mj"], variant["result_text"])
+                comfyui_download(variant["comfyui_json"], result["brief"], f"download_variant_{number}")
+                with st.expander("전체 결과 (Markdown)"):
+                    st.markdown(variant["result_text"])
+        return
+    if result["similar_score"] is not None:
+        st.button(
+            "🔄 이전 결과 말고 새로 생성하기",
+            key="force_regenerate_btn",
+            on_click=lambda: st.session_state.update(force_regenerate=True),
+        )
 
-[구도]
-{composition}
+    result_box, mj_box, mj_notes_box = result_columns()
+    result_box.markdown(result["result_text"])
+    render_midjourney(mj_box, result["mj"], result["mj_fallback"])
+    comfyui_download(result["comfyui_json"], result["brief"], "download_result")
+    if result["mj_notes"] is not None:
+        with mj_notes_box.container():
+            with st.expander("미드저니 전체 응답 (누락 부분 포함)"):
+                st.markdown(result["mj_notes"])
+
+
+# 생성 결과에 영향을 주는 사이드바 설정 (위젯 key)
+GENERATION_SETTINGS = (
+    "generation_mode",
+    "bypass_cache",
+    "reuse_similar",
+    "similarity_threshold",
+    "variant_count",
+    "auto_repair",
+    "truncate_long_fields",
+)
 
-[오디오 / 사운드]
-- BGM: {audio_bgm}
-- SFX: {audio_sfx}
-- Voice / Narration: {audio_voice}
 
-[타임라인 / 씬 분할]
-- 요약: {timeline_overview}
-- 상세:
-{timeline_detail}
+def generation_settings() -> dict:
+    # 사이드바 위젯의 현재 값. fragment 재실행에서는 모듈 변수가 마지막 전체 실행 때 값이므로 세션 상태에서 읽음
+    return {key: st.session_state[key] for key in GENERATION_SETTINGS}
+
+
+def generation_request(
+    brief: dict, settings: dict, force_regenerate: bool = False, speculative: bool = False
+) -> dict:
+    # 생성 작업에 넘길 요청 (워커는 st.* 를 쓰지 않으므로 필요한 설정을 모두 담음)
+    return {
+        "brief": brief,
+        **settings,
+        "force_regenerate": force_regenerate,
+        "last_generation": st.session_state.get("last_generation"),
+        # 워커 스레드에서 append 할 수 있도록 리스트 객체 자체를 넘김
+        "usage_log": st.session_state.setdefault("usage_log", []),
+        "session_key": st.session_state["session_key"],
+        # 미리 생성은 다른 세션의 실제 생성보다 뒤에 호출
+        "priority": PRIORITY_BATCH if speculative else PRIORITY_INTERACTIVE,
+        "speculative": speculative,
+    }
 
-[추가 메모]
-{extra}
-""".strip()
 
-        try:
-            with st.spinner("OpenAI가 프롬프트를 생성하는 중입니다..."):
-                result_text = ask_openai(combined_prompt)
+def is_cache_hit(request: dict) -> bool:
+    # generate() 와 같은 기준으로 캐시 / 유사 결과 히트인지 미리 확인 (캐시 통계 / LRU 에는 반영하지 않음)
+    generation_mode = request["generation_mode"]
+    if request["bypass_cache"] or (request["variant_count"] > 1 and generation_mode in VARIANT_MODES):
+        return False
+    brief = fit_brief(request["brief"], request["truncate_long_fields"])[0]
+    last_generation = request["last_generation"]
+    if generation_mode == MODE_INCREMENTAL and last_generation is not None:
+        # 부분 재생성은 캐시를 거치지 않음 (전체 재생성으로 넘어가는 경우만 확인)
+        if sections_to_regenerate(changed_fields(last_generation["brief"], brief)) is not None:
+            return False
+    cache = get_response_cache()
+    if generation_mode == MODE_SPLIT:
+        brief_key = canonical_brief(brief)
+        keys = [
+            make_cache_key(MODEL_NAME, TEMPERATURE, instruction, brief_key)
+            for instruction in (COMFYUI_SYSTEM_INSTRUCTION, MIDJOURNEY_SYSTEM_INSTRUCTION)
+        ]
+        return len(cache.cached_keys(keys)) == len(keys)
+    cache_key, namespace = generation_cache_key(brief, generation_mode == MODE_STRUCTURED)
+    if cache.cached_keys([cache_key]):
+        return True
+    if not request["reuse_similar"] or request["force_regenerate"]:
+        return False
+    match = get_similarity_index().lookup(similarity_text(brief), request["similarity_threshold"], namespace)
+    return match is not None and bool(cache.cached_keys([match[0]]))
+
+
+def speculation_key(brief: dict, settings: dict) -> str:
+    # 같은 key 면 같은 결과: 브리프 + 결과에 영향을 주는 생성 설정
+    return json.dumps({"brief": brief, **settings}, ensure_ascii=False, sort_keys=True)
+
+
+def can_speculate(settings: dict) -> bool:
+    # 후보 여러 개(비용 n배) / 부분 재생성(이전 결과에 의존)은 미리 생성하지 않음
+    return (
+        st.session_state["speculative_generation"]
+        and settings["variant_count"] == 1
+        and settings["generation_mode"] != MODE_INCREMENTAL
+    )
 
-            st.success("프롬프트 생성 완료!")
 
-            left, right = st.columns(2)
+def discard_speculation() -> None:
+    # 현재 미리 생성 작업을 버림: 실행 중이면 취소, 이미 끝났으면 결과를 버린 것으로 표시 (버린 토큰은 워커가 셈)
+    speculation = st.session_state.pop("speculation", None)
+    job = get_job_queue().get(speculation["job"]) if speculation else None
+    if job is not None:
+        job.cancel()
+
+
+@st.fragment(run_every=SPECULATION_POLL_SECONDS)
+def speculation_section():
+    # 폼 입력이 SPECULATION_DEBOUNCE_SECONDS 동안 바뀌지 않으면 현재 브리프로 백그라운드 생성을 시작.
+    # 입력이 바뀌면 진행 중인 미리 생성을 취소하고, 다시 안정되면 새로 시작
+    brief = {key: st.session_state[key] for key in FORM_FIELDS}
+    settings = generation_settings()
+    key = speculation_key(brief, settings)
+    now = time.monotonic()
+    if st.session_state.get("speculation_seen") != key:
+        # 처음 실행(페이지를 연 직후의 기본 브리프)은 수정된 것으로 보지 않음
+        edited = "speculation_seen" in st.session_state
+        st.session_state["speculation_seen"] = key
+        st.session_state["speculation_since"] = now if edited else None
+        speculation = st.session_state.get("speculation")
+        if speculation is not None and speculation["key"] != key:
+            discard_speculation()
+
+    speculation = st.session_state.get("speculation")
+    since = st.session_state.get("speculation_since")
+    if (
+        speculation is None
+        and since is not None
+        and now - since >= SPECULATION_DEBOUNCE_SECONDS
+        and st.session_state.get("generation_key") != key
+    ):
+        job = get_job_queue().submit(
+            run_generation,
+            generation_request(brief, settings, speculative=True),
+            label=f"speculative:{brief['prompt_name']}",
+        )
+        speculation = {"job": job.id, "key": key}
+        st.session_state["speculation"] = speculation
+
+    job = get_job_queue().get(speculation["job"]) if speculation else None
+    if job is None:
+        st.caption("🔮 입력이 멈추면 미리 생성을 시작합니다.")
+    elif job.status == STATUS_DONE:
+        st.caption("🔮 현재 입력으로 미리 생성 완료 — 생성 버튼을 누르면 바로 표시합니다.")
+    elif not job.done:
+        st.caption(f"🔮 현재 입력으로 미리 생성 중... ({job.elapsed:.0f}초)")
+    else:
+        st.caption("🔮 미리 생성에 실패했습니다. 생성 버튼을 누르면 새로 생성합니다.")
 
-            with left:
-                st.markdown("### 🧩 전체 결과 (Markdown)")
-                st.markdown(result_text)
 
-            with right:
-                st.markdown("### 🎨 Midjourney 프롬프트 (코드 복사용)")
+# "새로 생성하기" 버튼으로 들어온 재실행이면 유사 결과 재사용을 건너뛰고 바로 생성
+force_regenerate = st.session_state.pop("force_regenerate", False)
 
-                text = result_text
+if generate_btn or force_regenerate:
+    if not OPENAI_API_KEY:
+        st.error("OPENAI_API_KEY가 설정되지 않았습니다. Secrets에 'openai_api_key'를 등록해 주세요.")
+    else:
+        job_queue = get_job_queue()
+        # 이전 작업이 아직 실행 중이면 취소하고 새 작업으로 교체
+        previous_job = job_queue.get(st.session_state.get("generation_job"))
+        if previous_job is not None and not previous_job.done:
+            previous_job.cancel()
+        st.session_state.pop("history_view", None)
+
+        brief = {key: st.session_state[key] for key in FORM_FIELDS}
+        settings = generation_settings()
+        key = speculation_key(brief, settings)
+        speculation = st.session_state.get("speculation")
+        speculative_job = job_queue.get(speculation["job"]) if speculation else None
+        if (
+            not force_regenerate
+            and can_speculate(settings)
+            and speculative_job is not None
+            and speculation["key"] == key
+            and speculative_job.status not in (STATUS_ERROR, STATUS_CANCELLED)
+        ):
+            # 입력이 그대로면 미리 생성한 결과(완료 / 진행 중)를 그대로 사용
+            job = speculative_job
+            st.session_state.pop("speculation")
+            st.session_state["speculation_claimed"] = job.id
+            get_telemetry().count("speculative_hit")
+        else:
+            if can_speculate(settings):
+                get_telemetry().count("speculative_miss")
+            discard_speculation()
+            request = generation_request(brief, settings, force_regenerate)
+            if is_cache_hit(request):
+                # 캐시 / 유사 결과 히트는 대기열과 진행 표시(폴링)를 거치지 않고 이 실행에서 바로 처리
+                job = job_queue.run(run_generation, request, label=brief["prompt_name"])
+            else:
+                job = job_queue.submit(run_generation, request, label=brief["prompt_name"])
+        st.session_state["generation_job"] = job.id
+        st.session_state["generation_key"] = key
+
+# 생성 버튼 처리 뒤에 그려야 방금 가져간 미리 생성 결과를 다시 '완료'로 표시하지 않음
+if can_speculate(generation_settings()):
+    speculation_section()
+elif "speculation" in st.session_state:
+    # 미리 생성을 끄거나 미리 생성할 수 없는 설정으로 바꾼 경우
+    discard_speculation()
+
+current_job = get_job_queue().get(st.session_state.get("generation_job"))
+
+if "history_view" in st.session_state:
+    # 사이드바 생성 기록에서 "결과 보기"를 누른 항목을 API 호출 없이 다시 표시
+    entry = get_history_store().get(st.session_state["history_view"])
+    if entry is not None:
+        header_col, close_col = st.columns([4, 1])
+        with header_col:
+            st.info(
+                f"🕘 저장된 기록 #{entry['id']} · {entry['prompt_name']} · {entry['brand']} · "
+                f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['created_at']))}"
+            )
+        with close_col:
+            st.button("✕ 닫기", key="close_history_view", on_click=lambda: st.session_state.pop("history_view", None))
+
+        left, right = st.columns(2)
+        with left:
+            st.markdown("### 🧩 전체 결과 (Markdown)")
+            st.markdown(entry["result_text"])
+        with right:
+            st.markdown("### 🎨 Midjourney 프롬프트 (코드 복사용)")
+            render_midjourney(st.empty(), entry["midjourney_prompt"], entry["result_text"])
+            comfyui_download(entry["comfyui_json"], entry["brief"], "download_history_view")
+
+elif current_job is not None:
+    if current_job.done:
+        render_start = time.perf_counter()
+        render_job(current_job)
+        # 렌더링 시간은 작업당 처음 그릴 때 한 번만 기록 (이후 재실행은 같은 결과를 다시 그리는 것)
+        trace = (current_job.result or {}).get("trace")
+        if trace is not None and st.session_state.get("rendered_job") != current_job.id:
+            get_telemetry().observe(trace, "render", time.perf_counter() - render_start)
+            st.session_state["rendered_job"] = current_job.id
+    else:
+        job_progress_section(current_job.id)
 
-                start_markers = [
-                    "2️⃣ 미드저니 사용 프롬프트",
-                    "### 2️⃣ 미드저니 사용 프롬프트",
-                    "미드저니 사용 프롬프트",
-                ]
 
-                start_index = -1
-                for marker in start_markers:
-                    if marker in text:
-                        start_index = text.index(marker) + len(marker)
-                        break
+def start_prefetch(briefs: list, structured: bool) -> None:
+    job = get_job_queue().submit(
+        prefetch_presets, briefs, structured, st.session_state.setdefault("usage_log", []),
+        st.session_state["session_key"], label="preset-prefetch",
+    )
+    st.session_state["prefetch_job"] = job.id
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def prefetch_progress_section(job_id: str):
+    job = get_job_queue().get(job_id)
+    if job is None or job.done:
+        # 캐시 표시(✅)를 갱신하기 위해 전체 재실행
+        st.rerun()
+    st.caption(f"⚡ 캐시 미리 생성 중... {job.progress.get('prefetch', '')} ({job.elapsed:.0f}초)")
+    if st.button("⏹ 미리 생성 중지", key="preset_prefetch_cancel"):
+        job.cancel()
+        st.rerun()
+
+
+@st.fragment
+def preset_section():
+    # 브랜드 / 태그 / 검색어로 목록을 좁히는 동안은 이 섹션만 다시 실행
+    library = get_preset_library()
+    errors_box = st.container()
+    if not len(library):
+        for error in library.errors:
+            st.warning(error)
+        st.caption(f"`{PRESETS_PATH}` 에 프리셋 파일(*.json)이 없습니다.")
+        return
+
+    brand = st.selectbox("브랜드", ["(전체)"] + library.brands(), key="preset_brand")
+    brand = None if brand == "(전체)" else brand
+    tags = st.multiselect("태그", library.tags(brand), key="preset_tags")
+    query = st.text_input("프리셋 검색", placeholder="이름 / id", key="preset_query")
+    presets = library.search(brand, tuple(tags), query)
+    page = presets[:PRESET_PAGE_SIZE]
+
+    # base 가 없거나 순환하는 프리셋은 오류 목록에 남기고 건너뜀 (다시 읽기 전까지 유지)
+    briefs = {}
+    for preset in page:
+        try:
+            briefs[preset.id] = library.brief(preset.id)
+        except PresetError as e:
+            error = f"{preset.source}: {e}"
+            if error not in library.errors:
+                library.errors.append(error)
+    page = [preset for preset in page if preset.id in briefs]
+
+    # 현재 생성 방식 / 긴 필드 자르기 설정 기준으로 이미 캐시된 프리셋 표시 (통계 / LRU 에는 반영하지 않음).
+    # 생성 버튼과 같은 키가 나오도록 토큰 예산을 적용한 브리프로 계산
+    structured = generation_mode == MODE_STRUCTURED
+    fitted = {
+        preset.id: fit_brief(briefs[preset.id], st.session_state["truncate_long_fields"])[0] for preset in page
+    }
+    keys = {preset.id: generation_cache_key(fitted[preset.id], structured)[0] for preset in page}
+    cached = get_response_cache().cached_keys(list(keys.values()))
+    st.caption(f"{len(presets)}개 중 {len(page)}개 표시 · 캐시됨 {sum(key in cached for key in keys.values())}개")
+
+    for preset in page:
+        name_col, apply_col = st.columns([3, 1])
+        with name_col:
+            st.markdown(
+                f"**{preset.name}**" + (" ✅" if keys[preset.id] in cached else "")
+                + (("  \n" + " ".join(f"`{tag}`" for tag in preset.tags)) if preset.tags else "")
+            )
+        with apply_col:
+            if st.button("적용", key=f"preset_apply_{preset.id}"):
+                # 모든 필드를 다음 실행 맨 위에서 한 번에 채움 (섹션 리셋은 이 프리셋 값으로 되돌림)
+                brief = briefs[preset.id]
+                st.session_state["pending_brief"] = brief
+                st.session_state["preset_brief"] = brief
+                st.rerun()
+
+    prefetch_job = get_job_queue().get(st.session_state.get("prefetch_job"))
+    missing = [preset for preset in page if keys[preset.id] not in cached]
+    if prefetch_job is not None and not prefetch_job.done:
+        prefetch_progress_section(prefetch_job.id)
+    else:
+        if prefetch_job is not None and prefetch_job.result and prefetch_job.result["failed"]:
+            st.warning("미리 생성 실패: " + "; ".join(prefetch_job.result["failed"]))
+        st.button(
+            f"⚡ 목록 캐시 미리 생성 ({len(missing)}개)",
+            key="preset_prefetch",
+            disabled=not missing,
+            on_click=start_prefetch,
+            args=([fitted[preset.id] for preset in missing], structured),
+        )
+    st.button("↻ 프리셋 파일 다시 읽기", key="preset_refresh", on_click=library.refresh)
+    with errors_box:
+        for error in library.errors:
+            st.warning(error)
+
+
+@st.fragment
+def history_section():
+    # 검색어 입력 / 페이지 이동은 이 섹션만 다시 실행
+    store = get_history_store()
+    query_col, brand_col = st.columns([3, 2])
+    with query_col:
+        query = st.text_input(
+            "기록 검색",
+            placeholder="프롬프트 이름, 브랜드, 브리프 내용, 미드저니 프롬프트",
+            key="history_query",
+            on_change=lambda: st.session_state.update(history_page=0),
+        )
+    with brand_col:
+        brand = st.selectbox(
+            "브랜드",
+            ["전체"] + store.brands(),
+            key="history_brand",
+            on_change=lambda: st.session_state.update(history_page=0),
+        )
 
-                if start_index == -1:
-                    st.info("미드저니 프롬프트 구간을 찾을 수 없습니다.")
-                    st.code(result_text, language="text")
-                else:
-                    mj = text[start_index:].strip()
+    page = st.session_state.get("history_page", 0)
+    start = time.perf_counter()
+    rows, total = store.search(
+        query,
+        None if brand == "전체" else brand,
+        limit=HISTORY_PAGE_SIZE,
+        offset=page * HISTORY_PAGE_SIZE,
+    )
+    pages = max(1, -(-total // HISTORY_PAGE_SIZE))
+    st.caption(f"{total:,}건 · {page + 1}/{pages} 페이지 · 검색 {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    for entry in rows:
+        created = time.strftime("%m-%d %H:%M", time.localtime(entry["created_at"]))
+        with st.expander(f"#{entry['id']} {entry['prompt_name']} · {entry['brand']} · {created}"):
+            st.caption(
+                f"{entry['mode']} · {entry['model']} · 입력 {entry['prompt_tokens'] or 0:,} / "
+                f"출력 {entry['completion_tokens'] or 0:,}"
+                + (f" · {entry['latency']:.2f}s" if entry["latency"] is not None else "")
+            )
+            if entry["midjourney_prompt"]:
+                st.code(entry["midjourney_prompt"], language="text")
+            view_col, load_col = st.columns(2)
+            with view_col:
+                if st.button("결과 보기", key=f"history_view_{entry['id']}"):
+                    st.session_state["history_view"] = entry["id"]
+                    st.rerun()
+            with load_col:
+                if st.button("폼에 불러오기", key=f"history_load_{entry['id']}"):
+                    # 폼 위젯보다 먼저 값을 채워야 하므로 전체 재실행 후 맨 위에서 적용
+                    st.session_state["pending_brief"] = entry["brief"]
+                    if entry["comfyui_json"] is not None:
+                        remember_generation(entry["brief"], entry["comfyui_json"], entry["midjourney_prompt"])
+                    st.session_state["history_view"] = entry["id"]
+                    st.rerun()
+
+    if st.button(f"📦 검색 결과 {total:,}건 ComfyUI 번들로 내보내기", key="history_export", disabled=not total):
+        # 기록을 나눠 읽으면서 바로 파일에 씀 (장면별 JSON + zip + 인덱스)
+        path = os.path.join(EXPORT_PATH, time.strftime("history-%Y%m%d-%H%M%S"))
+        with st.spinner("ComfyUI 번들을 만드는 중입니다..."):
+            with BundleWriter(path) as writer:
+                writer.add_all(store.iter_search(query, None if brand == "전체" else brand))
+        st.session_state["history_export_result"] = {"path": path, "scenes": writer.count, "skipped": writer.skipped}
+    export = st.session_state.get("history_export_result")
+    if export is not None and os.path.exists(os.path.join(export["path"], ARCHIVE_NAME)):
+        st.caption(
+            f"번들 `{export['path']}` · 장면 {export['scenes']}개"
+            + (f" (ComfyUI JSON 없음 {export['skipped']}건 제외)" if export["skipped"] else "")
+        )
+        with open(os.path.join(export["path"], ARCHIVE_NAME), "rb") as f:
+            st.download_button(
+                f"⬇ {ARCHIVE_NAME}", f, file_name=f"{os.path.basename(export['path'])}.zip",
+                mime="application/zip", key="history_export_download", on_click="ignore",
+            )
+
+    prev_col, next_col = st.columns(2)
+    with prev_col:
+        if st.button("◀ 이전", key="history_prev", disabled=page == 0):
+            st.session_state["history_page"] = page - 1
+            st.rerun(scope="fragment")
+    with next_col:
+        if st.button("다음 ▶", key="history_next", disabled=page + 1 >= pages):
+            st.session_state["history_page"] = page + 1
+            st.rerun(scope="fragment")
 
-                    end_markers = ["⚠️", "###", "1️⃣", "3️⃣"]
-                    end_index = len(mj)
-                    for end in end_markers:
-                        if end in mj:
-                            pos = mj.index(end)
-                            end_index = min(end_index, pos)
 
-                    mj = mj[:end_index].strip()
-                    mj = mj.replace("```", "").strip()
+# ==============================================================================
+# [5] 사이드바: 캐시 / 토큰 사용량 통계 (생성 후 수치가 반영되도록 맨 마지막에 렌더링)
+# ==============================================================================
+with st.sidebar:
+    cache_stats = get_response_cache().stats()
+    st.caption(
+        f"히트 {cache_stats['hits']} · 미스 {cache_stats['misses']} · "
+        f"히트율 {cache_stats['hit_rate']:.0%} · 저장 {cache_stats['entries']}건"
+    )
+    similarity_stats = get_similarity_index().stats()
+    st.caption(
+        f"유사 브리프 재사용 {similarity_stats['hits']} · 미적중 {similarity_stats['misses']} · "
+        f"재사용률 {similarity_stats['hit_rate']:.0%} · 인덱스 {similarity_stats['entries']}건"
+    )
+    if similarity_stats["hits"] + similarity_stats["misses"]:
+        # 조회별 최고 유사도 분포: 임계값 조정 참고용
+        st.caption(
+            "최고 유사도 분포: "
+            + " · ".join(f"{label} {count}" for label, count in similarity_stats["score_buckets"].items())
+        )
+    flight_stats = get_single_flight().stats()
+    if flight_stats["leaders"]:
+        st.caption(
+            f"동시 요청 합치기: API 호출 {flight_stats['leaders']} · 합류(절약) {flight_stats['coalesced']} · "
+            f"진행 중 {flight_stats['in_flight']}"
+        )
+    telemetry_counters = get_telemetry().counters()
+    if telemetry_counters.get("validated"):
+        # 전체 세션 누적: 검증한 응답 중 위반 비율, 부분 수리 요청 / 성공 횟수
+        st.caption(
+            f"출력 검증 {telemetry_counters['validated']} · "
+            f"위반 {telemetry_counters.get('validation_failed', 0)} "
+            f"({telemetry_counters.get('validation_failed', 0) / telemetry_counters['validated']:.0%}) · "
+            f"수리 요청 {telemetry_counters.get('repair_requests', 0)} · "
+            f"수리 성공 {telemetry_counters.get('repaired', 0)} · 미해결 {telemetry_counters.get('repair_unresolved', 0)}"
+        )
+    scheduler_stats = get_scheduler().stats()
+    if scheduler_stats["started"] or scheduler_stats["queued"]:
+        limits = [
+            f"분당 {label} {scheduler_stats[key]:,.0f}"
+            for key, label in (("requests_limit", "요청"), ("tokens_limit", "토큰"))
+            if scheduler_stats[key] is not None
+        ]
+        st.caption(
+            f"API 호출: 실행 중 {scheduler_stats['in_flight']}/{scheduler_stats['max_concurrent']} · "
+            f"대기 {scheduler_stats['queued']}"
+            + (
+                " (" + ", ".join(f"{name} {count}" for name, count in scheduler_stats["queued_by_priority"].items())
+                + f" · 세션 {scheduler_stats['queued_keys']}개)" if scheduler_stats["queued"] else ""
+            )
+            + f" · 대기 시간 p50 {format_duration(scheduler_stats['wait_p50'])} / "
+            f"p95 {format_duration(scheduler_stats['wait_p95'])}"
+            + (" · " + ", ".join(limits) if limits else "")
+            + (
+                f" · 429 응답 {scheduler_stats['throttled']}회 · 대기열 재시도 {scheduler_stats['retried']}회"
+                if scheduler_stats["throttled"] or scheduler_stats["retried"] else ""
+            )
+            + (f" · {scheduler_stats['paused_for']:.0f}초 후 재개" if scheduler_stats["paused_for"] > 0 else "")
+        )
+    if telemetry_counters.get("speculative_started"):
+        # 전체 세션 누적: 생성 클릭 중 미리 생성 결과를 쓴 비율, 버려진 미리 생성과 그 토큰
+        speculative_clicks = telemetry_counters.get("speculative_hit", 0) + telemetry_counters.get("speculative_miss", 0)
+        st.caption(
+            f"미리 생성 {telemetry_counters['speculative_started']} · "
+            f"적중 {telemetry_counters.get('speculative_hit', 0)}/{speculative_clicks} "
+            f"({telemetry_counters.get('speculative_hit', 0) / speculative_clicks if speculative_clicks else 0:.0%}) · "
+            f"버림 {telemetry_counters.get('speculative_wasted', 0)} · "
+            f"버린 토큰 {telemetry_counters.get('speculative_wasted_tokens', 0):,}"
+        )
+    job_stats = get_job_queue().stats()
+    if job_stats["running"] + job_stats["queued"]:
+        st.caption(
+            f"생성 작업: 실행 중 {job_stats['running']} · 대기 {job_stats['queued']} "
+            f"(워커 {job_stats['workers']}개)"
+        )
+    if st.button("🗑 캐시 비우기", key="clear_cache"):
+        get_response_cache().clear()
+        get_similarity_index.clear()
 
-                    lines = mj.splitlines()
-                    if len(lines) > 1:
-                        first_line = lines[0]
-                        if ("프롬프트" in first_line) or ("Prompt" in first_line):
-                            mj = "\n".join(lines[1:]).strip()
+    st.markdown("---")
+    st.subheader("📊 토큰 사용량 (이번 세션)")
+    st.caption(
+        f"시스템 프롬프트 해시 `{prompt_fingerprint(SYSTEM_INSTRUCTION)}` · {len(SYSTEM_INSTRUCTION):,}자 "
+        "(호출마다 동일해야 프롬프트 캐싱이 적용됩니다)"
+    )
+    usage_log = st.session_state.get("usage_log", [])
+    if usage_log:
+        last = usage_log[-1]
+        st.markdown(
+            f"**마지막 호출** ({last['mode']})\n"
+            f"- 입력 {last['prompt_tokens']:,} (캐시 {last['cached_tokens']:,}) · 출력 {last['completion_tokens']:,}\n"
+            f"- 지연 {last['latency']:.2f}s"
+            + (f" · 첫 토큰 {last['ttft']:.2f}s" if last["ttft"] is not None else "")
+            + f" · ${last['cost']:.4f}"
+        )
+        summary = summarize_usage(usage_log)
+        st.markdown(
+            f"**세션 합계** (API 호출 {summary['calls']}회)\n"
+            f"- 입력 {summary['prompt_tokens']:,} (캐시 적중 {summary['cached_ratio']:.0%}) · "
+            f"출력 {summary['completion_tokens']:,}\n"
+            f"- 예상 비용 ${summary['cost']:.4f} · 평균 지연 {summary['avg_latency']:.2f}s"
+            + (f" · 평균 첫 토큰 {summary['avg_ttft']:.2f}s" if summary["avg_ttft"] is not None else "")
+        )
+        repair_usage = summarize_usage([record for record in usage_log if record["mode"] == "repair"])
+        if repair_usage["calls"]:
+            st.caption(
+                f"규칙 위반 수리 요청 {repair_usage['calls']}회 · 입력 {repair_usage['prompt_tokens']:,} · "
+                f"출력 {repair_usage['completion_tokens']:,} · ${repair_usage['cost']:.4f} "
+                f"(세션 비용의 {repair_usage['cost'] / summary['cost'] if summary['cost'] else 0:.0%})"
+            )
+        if GEMINI_API_KEY or COMPATIBLE_BASE_URL:
+            st.markdown(
+                "**백엔드별 상태** (최근 호출 기준)\n"
+                + "\n".join(
+                    f"- `{row['backend']}` ({row['model']}) · 호출 {row['calls']} · 오류율 {row['error_rate']:.0%}"
+                    + (f" · p95 {row['p95']:.2f}s" if row["p95"] is not None else "")
+                    + f" · 헤징 {row['hedges']} · 채택 {row['wins']}"
+                    for row in get_router().stats()
+                )
+            )
+        if st.button("↺ 사용량 초기화", key="reset_usage"):
+            # 실행 중인 작업이 같은 리스트에 계속 기록하므로 새 리스트로 바꾸지 않고 비움
+            st.session_state["usage_log"].clear()
+    else:
+        st.caption("아직 API 호출 기록이 없습니다.")
+
+    recent_traces = get_telemetry().recent()
+    if recent_traces:
+        st.markdown("---")
+        st.subheader(f"⏱ 단계별 소요 시간 (최근 {len(recent_traces)}건 · 전체 세션)")
+        last_trace = recent_traces[-1]
+        st.caption(
+            f"마지막 생성 ({last_trace.kind} · {last_trace.outcome}): "
+            + " · ".join(
+                f"{name} {format_duration(seconds)}"
+                for name, seconds in sorted(last_trace.phases.items(), key=lambda item: phase_sort_key(item[0]))
+            )
+            + f" · 합계 {format_duration(last_trace.total)}"
+        )
+        st.markdown(
+            "| 단계 | 건수 | p50 | p95 |\n|---|---:|---:|---:|\n"
+            + "\n".join(
+                f"| {row['phase']} | {row['count']} | {format_duration(row['p50'])} | {format_duration(row['p95'])} |"
+                for row in get_telemetry().summary()
+            )
+        )
 
-                    st.code(mj, language="text")
+    st.markdown("---")
+    st.subheader("📚 장면 프리셋")
+    preset_section()
 
-        except Exception as e:
-            st.error(f"실행 중 오류가 발생했습니다: {e}")
+    st.markdown("---")
+    st.subheader("🕘 생성 기록")
+    history_section()
 
 # ==============================================================================
 # [Footer]
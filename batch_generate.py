@@ -0,0 +1,294 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import sys
+import time
+from typing import Optional, TextIO
+
+import openai
+
+from openai_client import ClientConfig, build_async_client
+from prompt_core import (
+    DEFAULT_BRIEF,
+    FORM_FIELDS,
+    MODEL_NAME,
+    STRUCTURED_SYSTEM_INSTRUCTION,
+    SYSTEM_INSTRUCTION,
+    TEMPERATURE,
+    StructuredOutputError,
+    apply_timeline,
+    build_combined_prompt,
+    build_messages,
+    extract_comfyui_json,
+    extract_midjourney,
+    parse_structured_output,
+    structured_response_format,
+)
+from output_validator import validate_output
+from timeline_parser import parse_timeline
+from token_budget import expected_output_tokens, fit_brief, plan_request
+from usage_stats import percentile, summarize_usage, usage_record
+from workflow_export import BundleWriter
+
+# ==============================================================================
+# 배치 / 헤드리스 생성
+#   - 입력: JSONL 또는 CSV (필드 이름은 Streamlit 폼 key 와 동일: brand, subject, action, ...)
+#   - 빠진 필드는 폼 기본값으로 채워짐
+#   - 출력: 완료되는 순서대로 JSONL 한 줄씩 기록 (--export 를 주면 ComfyUI JSON 번들도 같이 기록)
+# 실행: python batch_generate.py briefs.jsonl -o results.jsonl --concurrency 8 [--export comfyui_bundle]
+# ==============================================================================
+
+# 재시도 대상 오류 (레이트 리밋 / 일시적인 네트워크·서버 오류)
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+def load_briefs(path: str) -> list:
+    briefs = []
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+
+        for row in rows:
+            brief = {key: row[key] for key in FORM_FIELDS if row.get(key) not in (None, "")}
+            if "duration" in brief:
+                brief["duration"] = int(brief["duration"])
+            briefs.append(brief)
+    return briefs
+
+
+def retry_delay(error: Exception, attempt: int, base_delay: float = 1.0, max_delay: float = 60.0) -> float:
+    # 서버가 알려준 retry-after 가 있으면 그대로 따르고, 없으면 지수 백오프 + 지터
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after_ms = response.headers.get("retry-after-ms")
+        retry_after = response.headers.get("retry-after")
+        try:
+            if retry_after_ms is not None:
+                return min(float(retry_after_ms) / 1000, max_delay)
+            if retry_after is not None:
+                return min(float(retry_after), max_delay)
+        except ValueError:
+            pass
+
+    delay = min(base_delay * (2 ** (attempt - 1)), max_delay)
+    return delay * (0.5 + random.random() / 2)
+
+
+async def generate_one(
+    client: openai.AsyncOpenAI,
+    semaphore: asyncio.Semaphore,
+    index: int,
+    brief: dict,
+    model: str = MODEL_NAME,
+    max_attempts: int = 5,
+    structured: bool = False,
+    max_tokens: Optional[int] = None,
+) -> dict:
+    brief, budget_warnings = fit_brief(brief)
+    prompt = build_combined_prompt(brief)
+    response_format = structured_response_format(brief) if structured else None
+    system_instruction = STRUCTURED_SYSTEM_INSTRUCTION if structured else SYSTEM_INSTRUCTION
+    timeline_items = len(parse_timeline(brief.get("timeline_detail", DEFAULT_BRIEF["timeline_detail"]))) or 3
+    budget = plan_request(
+        system_instruction, prompt, expected_output_tokens(timeline_items=timeline_items), tuple(budget_warnings)
+    )
+    # 출력 상한은 사용자가 지정한 경우에만 보냄 (예상치는 근사라서 상한으로 쓰면 JSON 이 중간에 잘림)
+    request_options = {"messages": build_messages(prompt, system_instruction)}
+    if max_tokens is not None:
+        request_options["max_tokens"] = max_tokens
+    if structured:
+        request_options["response_format"] = response_format
+
+    record = {
+        "index": index,
+        "prompt_name": brief.get("prompt_name"),
+        "brand": brief.get("brand"),
+        "brief": brief,
+        "combined_prompt": prompt,
+        "budget_warnings": list(budget.warnings),
+    }
+
+    # 재시도 대기 중에도 슬롯을 쥐고 있어서, 레이트 리밋 상황에서 동시 요청 수가 늘어나지 않음
+    async with semaphore:
+        start = time.perf_counter()
+        for attempt in range(1, max_attempts + 1):
+            try:
+                response = await client.chat.completions.create(
+                    model=model,
+                    temperature=TEMPERATURE,
+                    **request_options,
+                )
+            except RETRYABLE_ERRORS as e:
+                if attempt == max_attempts:
+                    record.update(ok=False, error=str(e), attempts=attempt)
+                    break
+                await asyncio.sleep(retry_delay(e, attempt))
+                continue
+            except openai.OpenAIError as e:
+                record.update(ok=False, error=str(e), attempts=attempt)
+                break
+
+            result_text = response.choices[0].message.content
+            record.update(
+                attempts=attempt,
+                result_text=result_text,
+                usage=usage_record(response.usage, model, "batch", time.perf_counter() - start),
+            )
+            if response.choices[0].finish_reason == "length":
+                record.update(ok=False, error="출력이 max_tokens 상한에서 잘림")
+                break
+            if structured:
+                try:
+                    data = parse_structured_output(result_text, response_format["json_schema"]["schema"])
+                except StructuredOutputError as e:
+                    record.update(ok=False, error=str(e))
+                    break
+                record.update(
+                    ok=True,
+                    comfyui_json=apply_timeline(data["comfyui_json"], brief),
+                    comfyui_missing=data["comfyui_missing"],
+                    midjourney_prompt=data["midjourney_prompt"].strip(),
+                    midjourney_missing=data["midjourney_missing"],
+                )
+            else:
+                record.update(
+                    ok=True,
+                    comfyui_json=extract_comfyui_json(result_text),
+                    midjourney_prompt=extract_midjourney(result_text),
+                )
+            # 배치에서는 수리 요청 없이 규칙 위반만 기록 (결과 파일에서 골라 다시 생성)
+            record["violations"] = [
+                str(violation) for violation in validate_output(record["comfyui_json"], record["midjourney_prompt"], brief)
+            ]
+            break
+        record["latency"] = time.perf_counter() - start
+
+    return record
+
+
+async def run_batch(
+    briefs: list,
+    client: openai.AsyncOpenAI,
+    output: TextIO,
+    concurrency: int = 8,
+    model: str = MODEL_NAME,
+    max_attempts: int = 5,
+    structured: bool = False,
+    exporter: Optional[BundleWriter] = None,
+    max_tokens: Optional[int] = None,
+) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [
+        asyncio.create_task(generate_one(client, semaphore, i, brief, model, max_attempts, structured, max_tokens))
+        for i, brief in enumerate(briefs)
+    ]
+
+    start = time.perf_counter()
+    latencies = []
+    usage_log = []
+    failed = 0
+    invalid = 0
+    for future in asyncio.as_completed(tasks):
+        record = await future
+        output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        output.flush()
+        if "usage" in record:
+            usage_log.append(record["usage"])
+        if record["ok"]:
+            latencies.append(record["latency"])
+            invalid += bool(record["violations"])
+            if exporter is not None:
+                exporter.add(record)
+        else:
+            failed += 1
+    elapsed = time.perf_counter() - start
+    usage = summarize_usage(usage_log)
+
+    return {
+        "total": len(briefs),
+        "ok": len(latencies),
+        "failed": failed,
+        "invalid": invalid,
+        "elapsed": elapsed,
+        "briefs_per_min": (len(briefs) / elapsed * 60) if elapsed else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "prompt_tokens": usage["prompt_tokens"],
+        "cached_tokens": usage["cached_tokens"],
+        "completion_tokens": usage["completion_tokens"],
+        "cost": usage["cost"],
+    }
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="브리프 파일(JSONL/CSV)로 프롬프트를 일괄 생성합니다.")
+    parser.add_argument("input", help="브리프 파일 경로 (.jsonl 또는 .csv)")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="결과 JSONL 경로")
+    parser.add_argument("--concurrency", type=int, default=8, help="동시 요청 수")
+    parser.add_argument("--max-attempts", type=int, default=5, help="요청당 최대 시도 횟수")
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--structured", action="store_true", help="JSON 스키마 구조화 출력 모드 사용")
+    parser.add_argument("--base-url", default=None, help="OpenAI 호환 엔드포인트 (기본: api.openai.com)")
+    parser.add_argument("--max-tokens", type=int, default=None, help="응답당 출력 토큰 상한 (기본: 지정하지 않음)")
+    parser.add_argument("--export", default=None, help="ComfyUI JSON 번들 디렉터리 (장면별 파일 + zip + 인덱스)")
+    args = parser.parse_args(argv)
+
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        print("OPENAI_API_KEY 환경 변수가 설정되지 않았습니다.", file=sys.stderr)
+        return 1
+
+    briefs = load_briefs(args.input)
+    # 재시도는 run_batch 에서 직접 처리하므로 SDK 재시도는 끔
+    client = build_async_client(ClientConfig(
+        api_key=api_key,
+        base_url=args.base_url,
+        max_retries=0,
+        max_connections=max(args.concurrency, 1),
+        max_keepalive_connections=max(args.concurrency, 1),
+    ))
+
+    async def _run() -> dict:
+        exporter = BundleWriter(args.export) if args.export else None
+        try:
+            with open(args.output, "w", encoding="utf-8") as output:
+                summary = await run_batch(
+                    briefs, client, output, args.concurrency, args.model, args.max_attempts, args.structured,
+                    exporter, args.max_tokens,
+                )
+            if exporter is not None:
+                summary["export"] = exporter.close()
+            return summary
+        except BaseException:
+            if exporter is not None:
+                exporter.abort()
+            raise
+        finally:
+            await client.close()
+
+    summary = asyncio.run(_run())
+    print(
+        f"완료 {summary['ok']}/{summary['total']} (실패 {summary['failed']} · 규칙 위반 {summary['invalid']}) · "
+        f"{summary['elapsed']:.1f}s · {summary['briefs_per_min']:.1f} briefs/min · "
+        f"p50 {summary['p50']:.2f}s · p95 {summary['p95']:.2f}s\n"
+        f"토큰: 입력 {summary['prompt_tokens']:,} (캐시 {summary['cached_tokens']:,}) · "
+        f"출력 {summary['completion_tokens']:,} · 예상 비용 ${summary['cost']:.4f}",
+        file=sys.stderr,
+    )
+    if "export" in summary:
+        print(f"ComfyUI JSON 번들: 장면 {summary['export']['scenes']}개 → {summary['export']['path']}", file=sys.stderr)
+    return 0 if summary["failed"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
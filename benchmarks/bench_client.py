@@ -0,0 +1,71 @@
+import argparse
+import statistics
+import time
+
+from openai import OpenAI
+
+from benchmarks.mock_openai_server import MockOpenAIServer
+from openai_client import ClientConfig, build_client
+from usage_stats import percentile
+
+# ==============================================================================
+# 요청당 오버헤드 마이크로 벤치마크
+#   - per-call : 예전 ask_openai 처럼 호출마다 OpenAI() 를 새로 생성
+#   - pooled   : build_client() 로 만든 클라이언트 하나를 재사용
+# 실행: python -m benchmarks.bench_client --requests 200
+# ==============================================================================
+
+
+def _call(client: OpenAI) -> None:
+    client.chat.completions.create(
+        model="mock",
+        messages=[{"role": "user", "content": "ping"}],
+    )
+
+
+def run_per_call(base_url: str, n: int) -> list:
+    latencies = []
+    for _ in range(n):
+        start = time.perf_counter()
+        client = OpenAI(api_key="bench", base_url=base_url)
+        _call(client)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run_pooled(base_url: str, n: int) -> list:
+    client = build_client(ClientConfig(api_key="bench", base_url=base_url))
+    latencies = []
+    for _ in range(n):
+        start = time.perf_counter()
+        _call(client)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def _report(name: str, latencies: list, connections: int) -> None:
+    print(
+        f"{name:<9} n={len(latencies):<5} "
+        f"mean={statistics.mean(latencies) * 1000:7.2f}ms "
+        f"p50={percentile(latencies, 0.50) * 1000:7.2f}ms "
+        f"p95={percentile(latencies, 0.95) * 1000:7.2f}ms "
+        f"connections={connections}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="OpenAI 클라이언트 요청당 오버헤드 벤치마크 (로컬 목 서버)")
+    parser.add_argument("--requests", type=int, default=200, help="모드별 요청 수")
+    parser.add_argument("--warmup", type=int, default=10, help="측정 전 워밍업 요청 수")
+    args = parser.parse_args()
+
+    for name, runner in (("per-call", run_per_call), ("pooled", run_pooled)):
+        with MockOpenAIServer() as server:
+            runner(server.base_url, args.warmup)
+            before = server.connections
+            latencies = runner(server.base_url, args.requests)
+            _report(name, latencies, server.connections - before)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import time
+from contextlib import ExitStack
+
+from benchmarks.mock_openai_server import MockOpenAIServer
+from model_router import GeminiBackend, OpenAIBackend, Router
+from openai_client import ClientConfig, build_client
+from usage_stats import percentile
+
+# ==============================================================================
+# 라우터 벤치마크 (로컬 목 서버 2개: OpenAI 호환 + Gemini REST)
+#   - single   : 꼬리 지연이 있는 OpenAI 백엔드 하나만 사용
+#   - hedged   : 같은 백엔드 + Gemini 백엔드, hedge_delay 후 헤징
+#   - fallback : OpenAI 백엔드가 항상 429 → Gemini 로 폴백, 이후 순위가 뒤바뀌는지 확인
+# 실행: python -m benchmarks.bench_router --requests 200
+# ==============================================================================
+
+
+def _openai_backend(server: MockOpenAIServer) -> OpenAIBackend:
+    # 재시도는 라우터가 담당하므로 SDK 재시도는 끔
+    client = build_client(ClientConfig(api_key="bench", base_url=server.base_url, max_retries=0))
+    return OpenAIBackend("openai", client, "mock")
+
+
+def _gemini_backend(server: MockOpenAIServer) -> GeminiBackend:
+    return GeminiBackend("gemini", "bench", "mock", api_endpoint=server.root_url)
+
+
+def _run(router: Router, n: int) -> dict:
+    latencies, failures, winners = [], 0, {}
+    for _ in range(n):
+        start = time.perf_counter()
+        try:
+            completion = router.complete("system", "ping", 0.3)
+        except Exception:
+            failures += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+        winners[completion.backend] = winners.get(completion.backend, 0) + 1
+    return {
+        "ok": len(latencies),
+        "failures": failures,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "winners": winners,
+        "ranked": [backend.name for backend in router.ranked()],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="멀티 백엔드 라우터 벤치마크 (로컬 목 서버)")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02, help="기본 응답 지연 (초)")
+    parser.add_argument("--tail-rate", type=float, default=0.1, help="OpenAI 목 서버의 꼬리 지연 비율")
+    parser.add_argument("--tail-latency", type=float, default=0.5, help="꼬리 지연 (초)")
+    parser.add_argument("--secondary-latency", type=float, default=0.05, help="Gemini 목 서버 응답 지연 (초)")
+    parser.add_argument("--hedge-delay", type=float, default=0.1)
+    args = parser.parse_args()
+
+    scenarios = {
+        "single": dict(primary={}, backends=("openai",), hedge=None),
+        "hedged": dict(primary={}, backends=("openai", "gemini"), hedge=args.hedge_delay),
+        "fallback": dict(primary={"error_rate": 1.0}, backends=("openai", "gemini"), hedge=args.hedge_delay),
+    }
+
+    print(f"{'scenario':<9} {'ok':>5} {'fail':>5} {'p50':>9} {'p95':>9}  winners / 최종 순위")
+    for name, scenario in scenarios.items():
+        with ExitStack() as stack:
+            primary = stack.enter_context(MockOpenAIServer(
+                latency=args.latency,
+                tail_rate=args.tail_rate,
+                tail_latency=args.tail_latency,
+                **scenario["primary"],
+            ))
+            secondary = stack.enter_context(MockOpenAIServer(latency=args.secondary_latency))
+            available = {"openai": _openai_backend(primary), "gemini": _gemini_backend(secondary)}
+            router = Router([available[key] for key in scenario["backends"]], hedge_delay=scenario["hedge"])
+            result = _run(router, args.requests)
+
+        print(
+            f"{name:<9} {result['ok']:>5} {result['failures']:>5} "
+            f"{result['p50'] * 1000:>7.1f}ms {result['p95'] * 1000:>7.1f}ms  "
+            f"{result['winners']} / {result['ranked']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# ==============================================================================
+# Streamlit 앱 콜드 스타트 / 재실행(rerun) 시간 측정 (AppTest 사용, API 호출 없음)
+#   - cold  : 새 프로세스에서 첫 실행 (앱 모듈 import + 전체 스크립트 실행)
+#   - rerun : 같은 프로세스에서 위젯 변경 후 재실행
+# 실행: python -m benchmarks.bench_startup --runs 5 --reruns 20
+# ==============================================================================
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_CHILD = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+
+script, reruns = sys.argv[1], int(sys.argv[2])
+at = AppTest.from_file(script, default_timeout=60)
+at.secrets["openai_api_key"] = "bench"
+
+start = time.perf_counter()
+at.run()
+cold = time.perf_counter() - start
+assert not at.exception, at.exception
+
+rerun_times = []
+for i in range(reruns):
+    at.text_input(key="subject").set_value(f"bench subject {i}")
+    start = time.perf_counter()
+    at.run()
+    rerun_times.append(time.perf_counter() - start)
+
+print(json.dumps({"cold": cold, "reruns": rerun_times, "openai_loaded": "openai" in sys.modules}))
+"""
+
+
+def measure(script: str, reruns: int) -> dict:
+    # 매번 새 프로세스 + 빈 작업 디렉터리에서 실행해야 import / 캐시가 데워지지 않은 상태가 됨
+    with tempfile.TemporaryDirectory() as workdir:
+        output = subprocess.run(
+            [sys.executable, "-c", _CHILD, script, str(reruns)],
+            cwd=workdir,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Streamlit 앱 콜드 스타트 / 재실행 시간 측정")
+    parser.add_argument("--script", default=os.path.join(ROOT, "Prompt.py"))
+    parser.add_argument("--runs", type=int, default=5, help="콜드 스타트 측정 횟수 (프로세스 수)")
+    parser.add_argument("--reruns", type=int, default=20, help="프로세스당 재실행 측정 횟수")
+    args = parser.parse_args()
+
+    colds, reruns, openai_loaded = [], [], []
+    for _ in range(args.runs):
+        result = measure(os.path.abspath(args.script), args.reruns)
+        colds.append(result["cold"])
+        reruns.extend(result["reruns"])
+        openai_loaded.append(result["openai_loaded"])
+
+    print(f"cold start : median {statistics.median(colds) * 1000:8.1f}ms  (n={len(colds)})")
+    print(f"rerun      : median {statistics.median(reruns) * 1000:8.1f}ms  (n={len(reruns)})")
+    print(f"openai SDK imported before first generation: {any(openai_loaded)}")
+
+
+if __name__ == "__main__":
+    main()
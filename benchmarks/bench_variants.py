@@ -0,0 +1,93 @@
+import argparse
+import time
+
+from benchmarks.mock_openai_server import DEFAULT_RESPONSE_TEXT, MockOpenAIServer
+from openai_client import ClientConfig, build_client
+from prompt_core import (
+    DEFAULT_BRIEF,
+    MODEL_NAME,
+    TEMPERATURE,
+    VARIANT_TEMPERATURE,
+    build_combined_prompt,
+    build_messages,
+    extract_midjourney,
+)
+from response_cache import dedupe_similar
+
+# ==============================================================================
+# 후보 N개 생성 비용 비교 (로컬 목 서버)
+#   - sequential : '생성' 버튼을 N번 누른 것과 같음 (요청 N번, 입력 토큰 N번 과금)
+#   - fan-out    : n=N 으로 한 번 요청 (입력 토큰 한 번, 후보는 서버에서 병렬 생성)
+# 목 서버는 후보 4종을 돌려주며 그중 하나는 거의 같은 미드저니 프롬프트 (중복 제거 확인용)
+# 실행: python -m benchmarks.bench_variants --variants 4 --tokens-per-second 200
+# ==============================================================================
+VARIANT_LINES = [
+    "a smiling Korean woman in her 20s, working on a laptop at a sunlit cafe terrace",
+    "a smiling Korean woman in her 20s, working on a laptop at a sunlit cafe terrace.",
+    "close-up of a Korean woman typing on a laptop, warm afternoon light, shallow depth of field",
+    "wide shot of a cafe terrace, a young Korean woman focused on her laptop, soft film look",
+]
+
+
+def _responses() -> list:
+    default_line = VARIANT_LINES[0]
+    return [DEFAULT_RESPONSE_TEXT.replace(default_line, line) for line in VARIANT_LINES]
+
+
+def _usage_totals(responses: list) -> tuple:
+    return (
+        sum(response.usage.prompt_tokens for response in responses),
+        sum(response.usage.completion_tokens for response in responses),
+    )
+
+
+def run_sequential(client, prompt: str, n: int) -> dict:
+    start = time.perf_counter()
+    responses = [
+        client.chat.completions.create(model=MODEL_NAME, messages=build_messages(prompt), temperature=TEMPERATURE)
+        for _ in range(n)
+    ]
+    elapsed = time.perf_counter() - start
+    texts = [response.choices[0].message.content for response in responses]
+    return {"elapsed": elapsed, "usage": _usage_totals(responses), "texts": texts}
+
+
+def run_fanout(client, prompt: str, n: int) -> dict:
+    start = time.perf_counter()
+    response = client.chat.completions.create(
+        model=MODEL_NAME, messages=build_messages(prompt), temperature=VARIANT_TEMPERATURE, n=n
+    )
+    elapsed = time.perf_counter() - start
+    texts = [choice.message.content for choice in response.choices]
+    return {"elapsed": elapsed, "usage": _usage_totals([response]), "texts": texts}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="후보 N개 생성: 순차 요청 vs n 파라미터 (로컬 목 서버)")
+    parser.add_argument("--variants", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.3, help="첫 토큰까지 지연 (초)")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--dedupe-threshold", type=float, default=0.9)
+    args = parser.parse_args()
+
+    prompt = build_combined_prompt(DEFAULT_BRIEF)
+    print(f"{'mode':<11} {'requests':>8} {'prompt':>8} {'compl.':>8} {'wall':>8}  distinct MJ")
+    for name, run in (("sequential", run_sequential), ("fan-out", run_fanout)):
+        with MockOpenAIServer(
+            latency=args.latency, tokens_per_second=args.tokens_per_second, responses=_responses()
+        ) as server:
+            client = build_client(ClientConfig(api_key="bench", base_url=server.base_url))
+            result = run(client, prompt, args.variants)
+            requests = server.requests
+
+        lines = [extract_midjourney(text) or "" for text in result["texts"]]
+        distinct = len(dedupe_similar(lines, args.dedupe_threshold))
+        prompt_tokens, completion_tokens = result["usage"]
+        print(
+            f"{name:<11} {requests:>8} {prompt_tokens:>8,} {completion_tokens:>8,} "
+            f"{result['elapsed']:>7.2f}s  {distinct}/{len(lines)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,418 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Optional
+
+from streamlit.proto.Alert_pb2 import Alert
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+from benchmarks.mock_openai_server import MockOpenAIServer
+from usage_stats import percentile
+
+# ==============================================================================
+# 동시 세션 부하 테스트: 실제 Streamlit 서버(Prompt.py) 하나에 헤드리스 웹소켓 클라이언트 N 개를 붙여
+# 브라우저처럼 폼 수정(fragment 재실행) → 생성 클릭(전체 재실행) → 진행 상황 폴링(run_every 자동 재실행)을 반복
+#   - 서버는 단계(세션 수)마다 새 프로세스로 띄움 (메모리 / CPU 를 단계별로 깨끗하게 측정)
+#   - OpenAI 호출은 로컬 목 서버로 보냄 (OPENAI_BASE_URL). 캐시 우회를 켜서 생성마다 실제 호출이 나감
+#   - 측정: 재실행 지연(보내고 script_finished 까지), 생성 지연(클릭부터 완료 알림까지), 처리량,
+#           서버 프로세스 CPU(코어 수 단위) / RSS 증가분(세션당), 목 서버 요청 수
+#   - 포화 지점: 세션 수를 늘려도 처리량이 --min-gain 이상 늘지 않거나, 재실행 p95 가 --max-rerun-p95 를 넘는 첫 단계
+# AppTest 는 런타임 / secrets 를 프로세스 전역으로 바꿔 끼우므로 여러 세션을 동시에 돌릴 수 없어 쓰지 않음.
+# Streamlit 프로세스 하나는 GIL 때문에 코어를 사실상 하나만 쓰므로, 여러 코어에서는 프로세스를 여러 개 띄워야 함.
+# 클라이언트(이 프로세스)도 같은 장비의 CPU 를 쓰므로 코어가 하나뿐이면 포화 지점이 실제보다 앞당겨짐
+# 준비: pip install -r requirements-dev.txt (websockets)
+# 실행: python -m benchmarks.load_test --sessions 1 2 4 8 16 32 --generations 3 --latency 1.0
+# ==============================================================================
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 세션마다 번갈아 고치는 폼 필드 (모두 fragment 안의 text_input)
+EDIT_FIELDS = ("subject", "emotion", "lighting", "style", "audio_bgm")
+GENERATE_LABEL = "🚀 프롬프트 생성하기 (텍스트 기반)"
+DONE_TEXT = "프롬프트 생성 완료"
+
+SERVER_START_TIMEOUT = 60.0
+# 자동 재실행(run_every) 간격을 못 받았을 때 생성 완료를 확인하는 간격 (초)
+DEFAULT_POLL_SECONDS = 0.5
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ==============================================================================
+# 서버 프로세스 (Linux 의 /proc 으로 CPU / 메모리 측정, 다른 OS 에서는 None)
+# ==============================================================================
+def _cpu_seconds(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    # utime, stime (clock tick 단위)
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def _rss_bytes(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class AppServer:
+    # 빈 작업 디렉터리(캐시 / 생성 기록 없음)에서 streamlit run 으로 앱을 띄움
+    def __init__(self, script: str, base_url: str, secrets: dict):
+        self.script = script
+        self.base_url = base_url
+        self.secrets = secrets
+        self.port = _free_port()
+        self.process: Optional[subprocess.Popen] = None
+        self._workdir: Optional[tempfile.TemporaryDirectory] = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://127.0.0.1:{self.port}/_stcore/stream"
+
+    def start(self) -> "AppServer":
+        self._workdir = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self._workdir.name, ".streamlit"))
+        with open(os.path.join(self._workdir.name, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as f:
+            for key, value in self.secrets.items():
+                f.write(f"{key} = {json.dumps(value)}\n")
+        self.process = subprocess.Popen(
+            [
+                sys.executable, "-m", "streamlit", "run", self.script,
+                "--server.headless", "true",
+                "--server.port", str(self.port),
+                "--server.address", "127.0.0.1",
+                "--server.fileWatcherType", "none",
+                "--browser.gatherUsageStats", "false",
+            ],
+            cwd=self._workdir.name,
+            env={**os.environ, "OPENAI_BASE_URL": self.base_url},
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Streamlit 서버가 시작하지 못했습니다 (exit {self.process.returncode})")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{self.port}/_stcore/health", timeout=1) as response:
+                    if response.status == 200:
+                        return self
+            except OSError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"Streamlit 서버가 {SERVER_START_TIMEOUT:.0f}초 안에 응답하지 않았습니다")
+
+    def stop(self) -> None:
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self._workdir is not None:
+            self._workdir.cleanup()
+            self._workdir = None
+
+    def cpu_seconds(self) -> Optional[float]:
+        return _cpu_seconds(self.process.pid)
+
+    def rss_bytes(self) -> Optional[int]:
+        return _rss_bytes(self.process.pid)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# ==============================================================================
+# 헤드리스 세션 (브라우저 프런트엔드가 주고받는 BackMsg / ForwardMsg 를 그대로 사용)
+# ==============================================================================
+class Session:
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.widgets = {}  # key(또는 라벨) -> (위젯 id, fragment id)
+        self.states = {}  # 위젯 id -> WidgetState (브라우저처럼 바꾼 값을 매번 다시 보냄)
+        self.auto_reruns = {}  # fragment id -> 간격(초)
+        self.alerts = []  # 마지막 재실행에서 받은 (format, body)
+        self.failed = False
+
+    async def rerun(self, fragment_id: str = "", trigger: Optional[str] = None, auto: bool = False) -> float:
+        message = BackMsg()
+        state = message.rerun_script
+        state.fragment_id = fragment_id
+        state.is_auto_rerun = auto
+        state.widget_states.widgets.extend(self.states.values())
+        if trigger is not None:
+            widget = state.widget_states.widgets.add()
+            widget.id = trigger
+            widget.trigger_value = True
+        self.alerts = []
+        start = time.perf_counter()
+        await self.websocket.send(message.SerializeToString())
+        await self._read_until_finished()
+        return time.perf_counter() - start
+
+    async def _read_until_finished(self) -> None:
+        while True:
+            message = ForwardMsg()
+            message.ParseFromString(await self.websocket.recv())
+            kind = message.WhichOneof("type")
+            if kind == "new_session" and not message.new_session.fragment_ids_this_run:
+                # 전체 재실행이 시작되면 프런트엔드처럼 자동 재실행 타이머를 모두 지움 (다시 그려진 fragment 가 새로 등록)
+                self.auto_reruns.clear()
+            elif kind == "auto_rerun":
+                self.auto_reruns[message.auto_rerun.fragment_id] = message.auto_rerun.interval
+            elif kind == "stop_auto_rerun":
+                for fragment_id in message.stop_auto_rerun.fragment_ids:
+                    self.auto_reruns.pop(fragment_id, None)
+            elif kind == "delta" and message.delta.WhichOneof("type") == "new_element":
+                element = message.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type == "alert":
+                    self.alerts.append((element.alert.format, element.alert.body))
+                elif element_type in ("text_input", "button", "checkbox"):
+                    widget = getattr(element, element_type)
+                    key = widget.id.rsplit("-", 1)[1]
+                    self.widgets[widget.label if key == "None" else key] = (widget.id, message.delta.fragment_id)
+            elif kind == "script_finished":
+                # st.rerun() 으로 끊긴 실행은 이어지는 실행이 끝날 때까지 기다림
+                if message.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    self.failed = self.error_message() is not None
+                    return
+
+    def set_text(self, key: str, value: str) -> str:
+        widget_id, fragment_id = self.widgets[key]
+        self.states[widget_id] = WidgetState(id=widget_id, string_value=value)
+        return fragment_id
+
+    def set_checkbox(self, key: str, value: bool) -> str:
+        widget_id, fragment_id = self.widgets[key]
+        self.states[widget_id] = WidgetState(id=widget_id, bool_value=value)
+        return fragment_id
+
+    def done_message(self) -> Optional[str]:
+        for _, body in self.alerts:
+            if DONE_TEXT in body:
+                return body
+        return None
+
+    def error_message(self) -> Optional[str]:
+        for format, body in self.alerts:
+            if format == Alert.ERROR:
+                return body
+        return None
+
+
+async def _run_session(url: str, index: int, args, results: dict) -> None:
+    try:
+        from websockets.asyncio.client import connect
+    except ImportError:
+        raise SystemExit("websockets 패키지가 필요합니다: pip install -r requirements-dev.txt")
+
+    rng = random.Random(args.seed + index)
+    await asyncio.sleep(rng.uniform(0, args.ramp))
+    async with connect(url, subprotocols=["streamlit"], max_size=None, open_timeout=30) as websocket:
+        session = Session(websocket)
+        results["reruns"].append(await session.rerun())
+        # 캐시 우회: 같은 브리프가 없어도 세션 간 응답 캐시 / 유사 결과 재사용이 끼지 않도록
+        session.set_checkbox("bypass_cache", True)
+        results["reruns"].append(await session.rerun())
+
+        for generation in range(args.generations):
+            for edit in range(args.edits):
+                field = EDIT_FIELDS[edit % len(EDIT_FIELDS)]
+                fragment_id = session.set_text(field, f"load {index}-{generation}-{edit} {rng.random():.6f}")
+                await asyncio.sleep(args.think_time)
+                results["reruns"].append(await session.rerun(fragment_id))
+
+            start = time.perf_counter()
+            widget_id, _ = session.widgets[GENERATE_LABEL]
+            results["reruns"].append(await session.rerun(trigger=widget_id))
+            timed_out = False
+            while session.done_message() is None and not session.failed:
+                if time.perf_counter() - start > args.timeout:
+                    timed_out = True
+                    break
+                # 진행 상황 fragment 의 run_every 에 맞춰 자동 재실행 (끝나면 fragment 가 전체 재실행을 부름)
+                interval = min(session.auto_reruns.values(), default=DEFAULT_POLL_SECONDS)
+                await asyncio.sleep(interval)
+                for fragment_id in list(session.auto_reruns):
+                    results["polls"].append(await session.rerun(fragment_id, auto=True))
+                    if session.done_message() is not None or session.failed:
+                        break
+                else:
+                    if not session.auto_reruns:
+                        results["reruns"].append(await session.rerun())
+            if timed_out or session.failed:
+                results["errors"].append("timeout" if timed_out else session.error_message())
+            else:
+                results["generations"].append(time.perf_counter() - start)
+
+
+async def _drive(url: str, sessions: int, args) -> dict:
+    results = {"reruns": [], "polls": [], "generations": [], "errors": [], "exceptions": []}
+    outcomes = await asyncio.gather(
+        *(_run_session(url, index, args, results) for index in range(sessions)), return_exceptions=True
+    )
+    results["exceptions"] = [repr(outcome) for outcome in outcomes if isinstance(outcome, BaseException)]
+    return results
+
+
+# ==============================================================================
+# 단계 실행 / 포화 판정
+# ==============================================================================
+def run_level(sessions: int, mock: MockOpenAIServer, args) -> dict:
+    secrets = {"openai_api_key": "bench"}
+    if args.max_concurrent_requests:
+        secrets["max_concurrent_requests"] = args.max_concurrent_requests
+    with AppServer(os.path.abspath(args.script), mock.base_url, secrets) as server:
+        # 세션 하나로 import / 캐시 자원을 데운 뒤의 상태를 기준으로 삼음
+        asyncio.run(_drive(server.url, 1, argparse.Namespace(**{**vars(args), "generations": 1, "ramp": 0})))
+        rss_before = server.rss_bytes()
+        cpu_before = server.cpu_seconds()
+        requests_before = mock.requests
+        start = time.perf_counter()
+        results = asyncio.run(_drive(server.url, sessions, args))
+        elapsed = time.perf_counter() - start
+        cpu_after = server.cpu_seconds()
+        rss_after = server.rss_bytes()
+
+    reruns = results["reruns"]
+    generations = results["generations"]
+    cpu = (cpu_after - cpu_before) if cpu_before is not None and cpu_after is not None else None
+    return {
+        "sessions": sessions,
+        "generations": len(generations),
+        "errors": len(results["errors"]) + len(results["exceptions"]),
+        # 원인 확인용 (같은 메시지는 한 번만)
+        "error_samples": list(dict.fromkeys(results["errors"] + results["exceptions"]))[:3],
+        "api_requests": mock.requests - requests_before,
+        "elapsed": elapsed,
+        "throughput": len(generations) / elapsed if elapsed else 0.0,
+        "rerun_count": len(reruns),
+        "rerun_p50": percentile(reruns, 0.50),
+        "rerun_p95": percentile(reruns, 0.95),
+        "rerun_p99": percentile(reruns, 0.99),
+        "poll_p95": percentile(results["polls"], 0.95),
+        "generation_p50": percentile(generations, 0.50),
+        "generation_p95": percentile(generations, 0.95),
+        "generation_p99": percentile(generations, 0.99),
+        "cpu_cores": cpu / elapsed if cpu is not None and elapsed else None,
+        "rss_mb": rss_after / 2**20 if rss_after is not None else None,
+        "rss_per_session_mb": (
+            (rss_after - rss_before) / 2**20 / sessions if rss_before is not None and rss_after is not None else None
+        ),
+    }
+
+
+def find_saturation(rows: list, min_gain: float, max_rerun_p95: Optional[float]) -> Optional[dict]:
+    # 처리량이 이전 단계보다 min_gain 이상 늘지 않거나 재실행 p95 가 한도를 넘는 첫 단계
+    for previous, row in zip([None, *rows], rows):
+        if max_rerun_p95 is not None and row["rerun_p95"] > max_rerun_p95:
+            return {"sessions": row["sessions"], "reason": f"재실행 p95 {row['rerun_p95']:.3f}s > {max_rerun_p95:.3f}s"}
+        if row["errors"]:
+            return {"sessions": row["sessions"], "reason": f"오류 {row['errors']}건"}
+        if previous is not None and row["throughput"] < previous["throughput"] * (1 + min_gain):
+            return {
+                "sessions": row["sessions"],
+                "reason": (
+                    f"처리량 {previous['throughput']:.2f} → {row['throughput']:.2f} 생성/s "
+                    f"(증가 {min_gain:.0%} 미만)"
+                ),
+            }
+    return None
+
+
+def _print_table(rows: list) -> None:
+    print(
+        f"{'sessions':>8}{'gen':>6}{'err':>5}{'gen/s':>8}{'rerun p50':>11}{'rerun p95':>11}"
+        f"{'gen p50':>9}{'gen p95':>9}{'cpu':>7}{'rss(MB)':>9}{'MB/sess':>9}"
+    )
+    for r in rows:
+        cpu = f"{r['cpu_cores']:.2f}" if r["cpu_cores"] is not None else "-"
+        rss = f"{r['rss_mb']:.0f}" if r["rss_mb"] is not None else "-"
+        per_session = f"{r['rss_per_session_mb']:.2f}" if r["rss_per_session_mb"] is not None else "-"
+        print(
+            f"{r['sessions']:>8}{r['generations']:>6}{r['errors']:>5}{r['throughput']:>8.2f}"
+            f"{r['rerun_p50'] * 1000:>9.0f}ms{r['rerun_p95'] * 1000:>9.0f}ms"
+            f"{r['generation_p50']:>8.2f}s{r['generation_p95']:>8.2f}s{cpu:>7}{rss:>9}{per_session:>9}"
+        )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Streamlit 앱 동시 세션 부하 테스트 (로컬 목 OpenAI 서버)")
+    parser.add_argument("--script", default=os.path.join(ROOT, "Prompt.py"))
+    parser.add_argument("--sessions", nargs="+", type=int, default=[1, 2, 4, 8, 16, 32], help="단계별 동시 세션 수")
+    parser.add_argument("--generations", type=int, default=3, help="세션당 생성 횟수")
+    parser.add_argument("--edits", type=int, default=5, help="생성 한 번 전 폼 수정 횟수")
+    parser.add_argument("--think-time", type=float, default=0.3, help="폼 수정 사이 대기 (초)")
+    parser.add_argument("--ramp", type=float, default=1.0, help="세션 시작을 흩뿌리는 구간 (초)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="생성 한 번의 최대 대기 (초)")
+    parser.add_argument("--latency", type=float, default=1.0, help="목 서버 첫 토큰 지연 (초)")
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0, help="목 서버 토큰 생성 속도")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="목 서버 429 응답 비율 (0~1)")
+    parser.add_argument("--max-concurrent-requests", type=int, help="앱 secrets 의 max_concurrent_requests")
+    parser.add_argument("--min-gain", type=float, default=0.1, help="포화 판정: 단계당 최소 처리량 증가율")
+    parser.add_argument("--max-rerun-p95", type=float, default=1.0, help="포화 판정: 재실행 p95 한도 (초)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="결과를 JSON 으로 저장할 경로")
+    args = parser.parse_args(argv)
+
+    rows = []
+    with MockOpenAIServer(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    ) as mock:
+        for sessions in sorted(set(args.sessions)):
+            row = run_level(sessions, mock, args)
+            rows.append(row)
+            print(
+                f"[{sessions} sessions] {row['generations']} generations, {row['errors']} errors, "
+                f"{row['elapsed']:.1f}s",
+                file=sys.stderr,
+            )
+            for sample in row["error_samples"]:
+                print(f"  {sample}", file=sys.stderr)
+
+    _print_table(rows)
+    saturation = find_saturation(rows, args.min_gain, args.max_rerun_p95)
+    print(f"CPU cores: {os.cpu_count()} (Streamlit 서버 프로세스 1개)")
+    if saturation is None:
+        print(f"포화 지점: {rows[-1]['sessions']} 세션까지 포화 없음" if rows else "포화 지점: -")
+    else:
+        print(f"포화 지점: {saturation['sessions']} 세션 ({saturation['reason']})")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"levels": rows, "saturation": saturation, "cpu_count": os.cpu_count()}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+import json
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+# ==============================================================================
+# 로컬 OpenAI 호환 스텁 서버 (네트워크 없이 벤치마크용)
+#   - latency          : 첫 토큰까지 대기 시간 (초)
+#   - tail_rate / tail_latency : tail_rate 비율의 요청에 tail_latency 만큼 추가 지연 (꼬리 지연 재현)
+#   - tokens_per_second: 토큰 생성 속도 (0 이면 즉시). 스트리밍이면 청크 간격, 아니면 전체 응답 시간에 반영
+#   - responses        : 돌아가며 응답할 정상 응답 목록
+#   - malformed_rate   : 마커/JSON 이 깨진 응답(MALFORMED_RESPONSES)을 섞는 비율
+#   - error_rate       : 429 (retry-after 포함) 로 응답하는 비율
+#   - n (요청 파라미터)  : 비스트리밍 요청이면 responses 를 돌아가며 n 개 choices 로 응답
+#   - /v1beta/models/{model}:generateContent 로 오면 Gemini REST 형식으로 응답
+# ==============================================================================
+DEFAULT_RESPONSE_TEXT = (
+    "1️⃣ ComfyUI 사용 json 프롬프트\n"
+    "```json\n{\"topic_and_content\": {\"topic\": \"cafe\"}}\n```\n\n"
+    "⚠️ ComfyUI 사용 json 프롬프트 중 누락 / none 부분\n- none\n\n"
+    "2️⃣ 미드저니 사용 프롬프트\n"
+    "a smiling Korean woman in her 20s, working on a laptop at a sunlit cafe terrace\n\n"
+    "⚠️ 미드저니 사용 프롬프트 중 누락부분\n- none\n"
+)
+
+# 파싱 실패를 유도하는 응답: 미드저니 구간 없음 / 중간에 끊긴 응답
+MALFORMED_RESPONSES = [
+    "1️⃣ ComfyUI 사용 json 프롬프트\n```json\n{\"topic_and_content\": {}}\n```\n",
+    "1️⃣ ComfyUI 사용 json 프롬프트\n```json\n{\"topic_and_content\": {\"desc",
+]
+
+# 구조화 출력(response_format) 요청에 대한 기본 응답
+DEFAULT_STRUCTURED_TEXT = json.dumps({
+    "comfyui_json": {},
+    "comfyui_missing": [],
+    "midjourney_prompt": "a smiling Korean woman in her 20s, working on a laptop at a sunlit cafe terrace",
+    "midjourney_missing": [],
+}, ensure_ascii=False)
+
+# 토큰 수 근사치 (영문 기준 대략 4글자 = 1토큰)
+CHARS_PER_TOKEN = 4
+
+
+def _split_tokens(text: str) -> list:
+    return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive 를 위해 HTTP/1.1 사용
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # 헤더/바디가 나뉘어 전송될 때 Nagle + delayed ACK 로 40ms 씩 지연되는 것을 방지
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+
+        with server.lock:
+            server.requests += 1
+            index = server.requests
+            roll = server.random.random()
+            malformed_roll = server.random.random()
+            tail_roll = server.random.random()
+
+        if roll < server.error_rate:
+            with server.lock:
+                server.errors += 1
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}},
+                {"retry-after-ms": str(int(server.retry_after * 1000))},
+            )
+            return
+
+        gemini = ":generateContent" in self.path
+
+        if "response_format" in request:
+            text = server.structured_text
+        elif malformed_roll < server.malformed_rate:
+            text = MALFORMED_RESPONSES[index % len(MALFORMED_RESPONSES)]
+        else:
+            text = server.responses[index % len(server.responses)]
+
+        tokens = _split_tokens(text)
+        n = request.get("n") or 1
+        choice_texts = [text] + [
+            server.responses[(index + i) % len(server.responses)] for i in range(1, n)
+        ]
+        if gemini:
+            prompt_chars = sum(
+                len(part.get("text") or "")
+                for content in [request.get("systemInstruction") or {}, *request.get("contents", [])]
+                for part in content.get("parts", [])
+            )
+        else:
+            prompt_chars = sum(len(m.get("content") or "") for m in request.get("messages", []))
+        usage = {
+            "prompt_tokens": prompt_chars // CHARS_PER_TOKEN,
+            "completion_tokens": sum(len(_split_tokens(choice)) for choice in choice_texts),
+            "total_tokens": prompt_chars // CHARS_PER_TOKEN + sum(len(_split_tokens(choice)) for choice in choice_texts),
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+        token_delay = (1.0 / server.tokens_per_second) if server.tokens_per_second else 0.0
+
+        if server.latency:
+            time.sleep(server.latency)
+        if tail_roll < server.tail_rate:
+            time.sleep(server.tail_latency)
+
+        if gemini:
+            if token_delay:
+                time.sleep(token_delay * len(tokens))
+            self._send_json(200, {
+                "candidates": [{
+                    "content": {"parts": [{"text": text}], "role": "model"},
+                    "finishReason": "STOP",
+                    "index": 0,
+                }],
+                "usageMetadata": {
+                    "promptTokenCount": usage["prompt_tokens"],
+                    "candidatesTokenCount": usage["completion_tokens"],
+                    "totalTokenCount": usage["total_tokens"],
+                },
+            })
+            return
+
+        base = {"id": f"chatcmpl-mock-{index}", "created": int(time.time()), "model": request.get("model", "mock")}
+
+        if not request.get("stream"):
+            if token_delay:
+                # n 개 후보는 병렬로 생성되므로 가장 긴 후보 기준으로 대기
+                time.sleep(token_delay * max(len(_split_tokens(choice)) for choice in choice_texts))
+            self._send_json(200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [
+                    {
+                        "index": i,
+                        "message": {"role": "assistant", "content": choice},
+                        "finish_reason": "stop",
+                    }
+                    for i, choice in enumerate(choice_texts)
+                ],
+                "usage": usage,
+            })
+            return
+
+        # 스트리밍: SSE 를 chunked 인코딩으로 전송
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(payload) -> None:
+            data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+            self._write_chunk(f"data: {data}\n\n".encode("utf-8"))
+
+        for token in tokens:
+            event({
+                **base,
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            })
+            if token_delay:
+                time.sleep(token_delay)
+        event({
+            **base,
+            "object": "chat.completion.chunk",
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        })
+        if (request.get("stream_options") or {}).get("include_usage"):
+            event({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+        event("[DONE]")
+        self._write_chunk(b"")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 클라이언트가 keep-alive 커넥션을 먼저 끊는 경우는 정상 종료로 간주
+        pass
+
+
+class MockOpenAIServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        response_text: str = DEFAULT_RESPONSE_TEXT,
+        latency: float = 0.0,
+        tokens_per_second: float = 0.0,
+        responses: Optional[list] = None,
+        structured_text: str = DEFAULT_STRUCTURED_TEXT,
+        malformed_rate: float = 0.0,
+        error_rate: float = 0.0,
+        retry_after: float = 0.05,
+        tail_rate: float = 0.0,
+        tail_latency: float = 0.0,
+        seed: int = 0,
+    ):
+        self._httpd = _Server((host, port), _Handler)
+        self._httpd.lock = threading.Lock()
+        self._httpd.random = random.Random(seed)
+        self._httpd.connections = 0
+        self._httpd.requests = 0
+        self._httpd.errors = 0
+        self._httpd.responses = responses or [response_text]
+        self._httpd.structured_text = structured_text
+        self._httpd.latency = latency
+        self._httpd.tokens_per_second = tokens_per_second
+        self._httpd.malformed_rate = malformed_rate
+        self._httpd.error_rate = error_rate
+        self._httpd.retry_after = retry_after
+        self._httpd.tail_rate = tail_rate
+        self._httpd.tail_latency = tail_latency
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def root_url(self) -> str:
+        # Gemini REST 클라이언트의 api_endpoint 용 (경로 없이 호스트까지만)
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def connections(self) -> int:
+        return self._httpd.connections
+
+    @property
+    def requests(self) -> int:
+        return self._httpd.requests
+
+    @property
+    def errors(self) -> int:
+        return self._httpd.errors
+
+    def start(self) -> "MockOpenAIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
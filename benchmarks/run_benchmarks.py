@@ -0,0 +1,192 @@
+import argparse
+import asyncio
+import io
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from batch_generate import run_batch
+from benchmarks.mock_openai_server import MockOpenAIServer
+from openai_client import ClientConfig, build_async_client, build_client
+from prompt_core import (
+    DEFAULT_BRIEF,
+    MODEL_NAME,
+    TEMPERATURE,
+    build_combined_prompt,
+    build_messages,
+    extract_midjourney,
+)
+from usage_stats import percentile
+
+# ==============================================================================
+# 오프라인 벤치마크: 프롬프트 조립 → OpenAI 호출 → 미드저니 추출 파이프라인
+#   - single     : 한 번에 하나씩 (Streamlit 한 세션의 '생성' 클릭)
+#   - stream     : 스트리밍 한 번에 하나씩 (첫 토큰 시간 측정)
+#   - concurrent : 스레드 여러 개가 공유 클라이언트로 동시에 호출 (여러 세션)
+#   - batch      : batch_generate.run_batch (비동기 배치)
+# 실행: python -m benchmarks.run_benchmarks --requests 100 --concurrency 8 --malformed-rate 0.1
+# ==============================================================================
+WORKLOADS = ("single", "stream", "concurrent", "batch")
+
+
+def _briefs(n: int) -> list:
+    return [{**DEFAULT_BRIEF, "prompt_name": f"bench-{i}"} for i in range(n)]
+
+
+def _run_pipeline(client, brief: dict, stream: bool = False) -> dict:
+    start = time.perf_counter()
+    ttft = None
+    try:
+        prompt = build_combined_prompt(brief)
+        if stream:
+            chunks = []
+            for chunk in client.chat.completions.create(
+                model=MODEL_NAME,
+                messages=build_messages(prompt),
+                temperature=TEMPERATURE,
+                stream=True,
+            ):
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    chunks.append(chunk.choices[0].delta.content)
+            text = "".join(chunks)
+        else:
+            response = client.chat.completions.create(
+                model=MODEL_NAME,
+                messages=build_messages(prompt),
+                temperature=TEMPERATURE,
+            )
+            text = response.choices[0].message.content
+    except Exception as e:
+        return {"ok": False, "error": str(e), "latency": time.perf_counter() - start, "ttft": ttft}
+
+    return {
+        "ok": True,
+        "parsed": extract_midjourney(text) is not None,
+        "latency": time.perf_counter() - start,
+        "ttft": ttft,
+    }
+
+
+def _summarize(name: str, results: list, elapsed: float) -> dict:
+    ok = [r for r in results if r["ok"]]
+    latencies = [r["latency"] for r in ok]
+    ttfts = [r["ttft"] for r in ok if r.get("ttft") is not None]
+    parse_failures = sum(1 for r in ok if not r["parsed"])
+    return {
+        "workload": name,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "elapsed": elapsed,
+        "throughput": (len(results) / elapsed) if elapsed else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "ttft_p50": percentile(ttfts, 0.50) if ttfts else None,
+        "parse_failure_rate": (parse_failures / len(ok)) if ok else 0.0,
+    }
+
+
+def run_workload(name: str, base_url: str, n: int, concurrency: int) -> dict:
+    briefs = _briefs(n)
+    config = ClientConfig(api_key="bench", base_url=base_url, max_connections=max(concurrency, 1))
+
+    if name == "batch":
+        async def _run() -> list:
+            client = build_async_client(config)
+            output = io.StringIO()
+            try:
+                await run_batch(briefs, client, output, concurrency, MODEL_NAME, max_attempts=5)
+            finally:
+                await client.close()
+            records = [json.loads(line) for line in output.getvalue().splitlines()]
+            return [
+                {
+                    "ok": r["ok"],
+                    "parsed": r.get("midjourney_prompt") is not None,
+                    "latency": r["latency"],
+                }
+                for r in records
+            ]
+
+        start = time.perf_counter()
+        results = asyncio.run(_run())
+        return _summarize(name, results, time.perf_counter() - start)
+
+    client = build_client(config)
+    start = time.perf_counter()
+    if name == "concurrent":
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda brief: _run_pipeline(client, brief), briefs))
+    else:
+        results = [_run_pipeline(client, brief, stream=(name == "stream")) for brief in briefs]
+    elapsed = time.perf_counter() - start
+    client.close()
+    return _summarize(name, results, elapsed)
+
+
+def _print_table(rows: list) -> None:
+    print(
+        f"{'workload':<11}{'n':>6}{'err':>5}{'req/s':>9}{'p50(ms)':>10}{'p95(ms)':>10}"
+        f"{'p99(ms)':>10}{'ttft(ms)':>10}{'parse-fail':>12}"
+    )
+    for r in rows:
+        ttft = f"{r['ttft_p50'] * 1000:.1f}" if r["ttft_p50"] is not None else "-"
+        print(
+            f"{r['workload']:<11}{r['requests']:>6}{r['errors']:>5}{r['throughput']:>9.1f}"
+            f"{r['p50'] * 1000:>10.1f}{r['p95'] * 1000:>10.1f}{r['p99'] * 1000:>10.1f}"
+            f"{ttft:>10}{r['parse_failure_rate']:>12.1%}"
+        )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="로컬 목 서버를 이용한 오프라인 벤치마크")
+    parser.add_argument("--workloads", nargs="+", choices=WORKLOADS, default=list(WORKLOADS))
+    parser.add_argument("--requests", type=int, default=50, help="워크로드별 요청 수")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="목 서버 첫 토큰 지연 (초)")
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0, help="목 서버 토큰 생성 속도")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="깨진 응답 비율 (0~1)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="429 응답 비율 (0~1)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="결과를 JSON 으로 저장할 경로")
+    parser.add_argument("--max-p95", type=float, help="p95 지연(초)이 이 값을 넘으면 실패 처리")
+    parser.add_argument("--max-parse-failure-rate", type=float, help="파싱 실패율이 이 값을 넘으면 실패 처리")
+    args = parser.parse_args(argv)
+
+    rows = []
+    for name in args.workloads:
+        with MockOpenAIServer(
+            latency=args.latency,
+            tokens_per_second=args.tokens_per_second,
+            malformed_rate=args.malformed_rate,
+            error_rate=args.error_rate,
+            seed=args.seed,
+        ) as server:
+            rows.append(run_workload(name, server.base_url, args.requests, args.concurrency))
+
+    _print_table(rows)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+    # 회귀 판정 (CI 용)
+    failed = False
+    for r in rows:
+        if args.max_p95 is not None and r["p95"] > args.max_p95:
+            print(f"[FAIL] {r['workload']}: p95 {r['p95']:.3f}s > {args.max_p95:.3f}s", file=sys.stderr)
+            failed = True
+        if args.max_parse_failure_rate is not None and r["parse_failure_rate"] > args.max_parse_failure_rate:
+            print(
+                f"[FAIL] {r['workload']}: parse failure {r['parse_failure_rate']:.1%} "
+                f"> {args.max_parse_failure_rate:.1%}",
+                file=sys.stderr,
+            )
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+# ==============================================================================
+# 생성 기록 저장소 (SQLite, 추가 전용 + FTS5 전문 검색)
+#   - 한국어는 띄어쓰기 단위 토큰화가 잘 맞지 않아 trigram 토크나이저로 부분 문자열 검색
+#   - FTS5 / trigram 을 지원하지 않는 SQLite 에서는 LIKE 검색으로 대체
+# ==============================================================================
+HISTORY_COLUMNS = (
+    "id",
+    "created_at",
+    "prompt_name",
+    "brand",
+    "mode",
+    "model",
+    "brief_json",
+    "combined_prompt",
+    "result_text",
+    "comfyui_json",
+    "midjourney_prompt",
+    "prompt_tokens",
+    "cached_tokens",
+    "completion_tokens",
+    "latency",
+)
+
+# 검색 대상 컬럼
+SEARCH_COLUMNS = ("prompt_name", "brand", "combined_prompt", "midjourney_prompt")
+
+
+class HistoryStore:
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                prompt_name TEXT,
+                brand TEXT,
+                mode TEXT,
+                model TEXT,
+                brief_json TEXT NOT NULL,
+                combined_prompt TEXT NOT NULL,
+                result_text TEXT NOT NULL,
+                comfyui_json TEXT,
+                midjourney_prompt TEXT,
+                prompt_tokens INTEGER,
+                cached_tokens INTEGER,
+                completion_tokens INTEGER,
+                latency REAL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_history_brand_name ON history(brand, prompt_name)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_history_created_at ON history(created_at)")
+
+        try:
+            self._conn.execute(
+                f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+                    {", ".join(SEARCH_COLUMNS)},
+                    content='history', content_rowid='id', tokenize='trigram'
+                )
+                """
+            )
+            self.fts_enabled = True
+        except sqlite3.OperationalError:
+            self.fts_enabled = False
+        self._conn.commit()
+
+    def add(self, record: dict) -> int:
+        row = {column: record.get(column) for column in HISTORY_COLUMNS if column != "id"}
+        row["created_at"] = row["created_at"] or time.time()
+        row["brief_json"] = json.dumps(record.get("brief") or {}, ensure_ascii=False)
+        if record.get("comfyui_json") is not None:
+            row["comfyui_json"] = json.dumps(record["comfyui_json"], ensure_ascii=False)
+
+        with self._lock:
+            cursor = self._conn.execute(
+                f"INSERT INTO history ({', '.join(row)}) VALUES ({', '.join('?' for _ in row)})",
+                tuple(row.values()),
+            )
+            history_id = cursor.lastrowid
+            if self.fts_enabled:
+                self._conn.execute(
+                    f"INSERT INTO history_fts (rowid, {', '.join(SEARCH_COLUMNS)}) "
+                    f"VALUES (?, {', '.join('?' for _ in SEARCH_COLUMNS)})",
+                    (history_id, *(row[column] or "" for column in SEARCH_COLUMNS)),
+                )
+            self._conn.commit()
+        return history_id
+
+    def _where(self, query: str, brand: Optional[str]) -> tuple:
+        clauses, params = [], []
+        query = query.strip()
+        if query:
+            # trigram 은 3글자 이상부터 색인을 탈 수 있으므로 짧은 검색어는 LIKE 로 처리
+            if self.fts_enabled and len(query) >= 3:
+                clauses.append("h.id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)")
+                params.append('"' + query.replace('"', '""') + '"')
+            else:
+                like = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                clauses.append(
+                    "(" + " OR ".join(f"h.{column} LIKE ? ESCAPE '\\'" for column in SEARCH_COLUMNS) + ")"
+                )
+                params.extend([like] * len(SEARCH_COLUMNS))
+        if brand:
+            clauses.append("h.brand = ?")
+            params.append(brand)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def search(self, query: str = "", brand: Optional[str] = None, limit: int = 10, offset: int = 0) -> tuple:
+        # (최신순 결과 목록, 전체 건수)
+        where, params = self._where(query, brand)
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM history h{where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT {', '.join('h.' + c for c in HISTORY_COLUMNS)} FROM history h{where} "
+                "ORDER BY h.id DESC LIMIT ? OFFSET ?",
+                (*params, limit, offset),
+            ).fetchall()
+        return [self._to_dict(row) for row in rows], total
+
+    def iter_search(self, query: str = "", brand: Optional[str] = None, batch_size: int = 200):
+        # search 와 같은 조건의 전체 결과를 최신순으로 batch_size 건씩 읽음 (내보내기 등 전체를 메모리에 두지 않을 때)
+        where, params = self._where(query, brand)
+        last_id = None
+        while True:
+            clause = where + ((" AND " if where else " WHERE ") + "h.id < ?" if last_id is not None else "")
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT {', '.join('h.' + c for c in HISTORY_COLUMNS)} FROM history h{clause} "
+                    "ORDER BY h.id DESC LIMIT ?",
+                    (*params, *([last_id] if last_id is not None else []), batch_size),
+                ).fetchall()
+            for row in rows:
+                yield self._to_dict(row)
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+    def get(self, history_id: int) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(HISTORY_COLUMNS)} FROM history WHERE id = ?", (history_id,)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def brands(self) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT brand FROM history WHERE brand IS NOT NULL ORDER BY brand"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        record = dict(zip(HISTORY_COLUMNS, row))
+        record["brief"] = json.loads(record.pop("brief_json"))
+        if record["comfyui_json"] is not None:
+            record["comfyui_json"] = json.loads(record["comfyui_json"])
+        return record
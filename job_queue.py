@@ -0,0 +1,159 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+# ==============================================================================
+# 백그라운드 생성 작업 큐 (Streamlit 스크립트 스레드를 막지 않도록 워커 풀에서 실행)
+#   - 세션은 job id 만 들고 있고, 재실행 / 위젯 조작이 있어도 작업과 결과는 큐에 남아 있음
+#   - 취소는 협조적: 작업 함수가 check_cancelled() 를 부르는 지점(스트리밍 청크 사이 등)에서 중단,
+#     이미 시작된 단일 API 호출은 끝까지 기다리되 결과는 버림
+# ==============================================================================
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_ERROR = "error"
+STATUS_CANCELLED = "cancelled"
+FINISHED_STATUSES = frozenset({STATUS_DONE, STATUS_ERROR, STATUS_CANCELLED})
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id: str, label: str = ""):
+        self.id = job_id
+        self.label = label
+        self.status = STATUS_QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # 워커가 갱신하는 중간 상태 (안내 문구, 부분 결과 등). 쓰기 / 읽기 모두 _lock 안에서 (progress 는 복사본)
+        self._progress = {}
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self._cancel = threading.Event()
+        self._on_cancel = []
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def elapsed(self) -> float:
+        with self._lock:
+            start = self.started_at or self.created_at
+            finished_at = self.finished_at
+        return (finished_at or time.time()) - start
+
+    @property
+    def progress(self) -> dict:
+        # 화면(fragment)에서 읽는 시점의 복사본. 여러 값을 함께 쓸 때는 한 번만 읽어서 사용
+        with self._lock:
+            return dict(self._progress)
+
+    def update(self, **progress) -> None:
+        with self._lock:
+            self._progress.update(progress)
+
+    def check_cancelled(self) -> None:
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def cancel(self) -> None:
+        # 화면에는 바로 취소로 표시 (실행 중인 워커는 다음 확인 지점에서 멈추고 결과는 버려짐).
+        # 이미 끝난 작업이면 상태는 그대로 두고 결과를 버린 것으로만 취급 (on_cancel 콜백 호출)
+        with self._lock:
+            self._cancel.set()
+            callbacks, self._on_cancel = self._on_cancel, []
+        self._finish(STATUS_CANCELLED)
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        # 취소(버림)될 때 한 번 호출. 이미 취소됐으면 바로 호출
+        with self._lock:
+            if not self._cancel.is_set():
+                self._on_cancel.append(callback)
+                return
+        callback()
+
+    def _finish(self, status: str, result=None, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            if self.done:
+                return
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+
+
+class JobQueue:
+    def __init__(self, max_workers: int = 4, max_jobs: int = 200):
+        self.max_workers = max_workers
+        self.max_jobs = max_jobs
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generation-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable, *args, label: str = "") -> Job:
+        # fn(job, *args) 를 워커에서 실행
+        job = self._add(label)
+        self._pool.submit(self._run, job, fn, args)
+        return job
+
+    def run(self, fn: Callable, *args, label: str = "") -> Job:
+        # fn(job, *args) 를 호출한 스레드에서 바로 실행하고 끝난 작업으로 반환 (캐시 히트처럼 금방 끝나는 작업용)
+        job = self._add(label)
+        self._run(job, fn, args)
+        return job
+
+    def _add(self, label: str) -> Job:
+        job = Job(uuid.uuid4().hex[:12], label)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+        return job
+
+    def _run(self, job: Job, fn: Callable, args: tuple) -> None:
+        with job._lock:
+            if job.done:
+                return
+            job.started_at = time.time()
+            job.status = STATUS_RUNNING
+        try:
+            result = fn(job, *args)
+        except JobCancelled:
+            job._finish(STATUS_CANCELLED)
+        except Exception as e:
+            job._finish(STATUS_ERROR, error=e)
+        else:
+            job._finish(STATUS_DONE, result=result)
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        if job_id is None:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _evict(self) -> None:
+        # 끝난 작업부터 오래된 순으로 정리 (실행 중인 작업은 남김)
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[: max(0, len(self._jobs) - self.max_jobs)]:
+            del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        counts = {status: 0 for status in (STATUS_QUEUED, STATUS_RUNNING, STATUS_DONE, STATUS_ERROR, STATUS_CANCELLED)}
+        for job in jobs:
+            counts[job.status] += 1
+        return {"workers": self.max_workers, **counts}
@@ -0,0 +1,324 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Callable, Optional
+
+from prompt_core import build_messages
+from usage_stats import percentile
+
+# ==============================================================================
+# 여러 모델 / 공급자(OpenAI, Gemini, OpenAI 호환 로컬 서버)를 같은 인터페이스로 호출
+#   - 백엔드 선택: 최근 호출의 p95 지연 시간과 오류율 기준
+#   - 헤징: 첫 백엔드가 hedge_delay 안에 끝나지 않으면 다음 백엔드에도 같은 요청을 보내고 먼저 온 응답 사용.
+#           헤지 요청도 비용이 나가므로 호출한 쪽 스케줄러의 슬롯을 따로 잡고(acquire_hedge),
+#           진 요청의 응답은 on_discarded 로 넘겨서 사용량에 반영
+#   - 폴백: 실패하면 다음 순위 백엔드로 재요청
+# ==============================================================================
+
+
+@dataclass(frozen=True)
+class Completion:
+    text: str
+    # usage_record() 가 읽는 형태 (prompt_tokens / completion_tokens / prompt_tokens_details.cached_tokens)
+    usage: object
+    backend: str
+    model: str
+    latency: float
+
+
+class Backend(ABC):
+    name: str
+    model: str
+
+    @abstractmethod
+    def complete(
+        self, system_instruction: str, prompt: str, temperature: float, max_tokens: Optional[int] = None
+    ) -> Completion:
+        # max_tokens: 출력 토큰 상한 (None 이면 백엔드 기본값)
+        ...
+
+
+class OpenAIBackend(Backend):
+    # OpenAI 및 OpenAI 호환 엔드포인트 (vLLM, Ollama, LM Studio 등) 공용
+    def __init__(self, name: str, client, model: str):
+        self.name = name
+        self.client = client
+        self.model = model
+
+    def complete(
+        self, system_instruction: str, prompt: str, temperature: float, max_tokens: Optional[int] = None
+    ) -> Completion:
+        start = time.perf_counter()
+        extra = {"max_tokens": max_tokens} if max_tokens is not None else {}
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=build_messages(prompt, system_instruction),
+            temperature=temperature,
+            **extra,
+        )
+        return Completion(
+            text=response.choices[0].message.content,
+            usage=response.usage,
+            backend=self.name,
+            model=self.model,
+            latency=time.perf_counter() - start,
+        )
+
+
+class GeminiBackend(Backend):
+    def __init__(
+        self,
+        name: str,
+        api_key: str,
+        model: str = "gemini-2.0-flash",
+        api_endpoint: Optional[str] = None,
+        timeout: float = 120.0,
+    ):
+        # google-generativeai 의 전역 설정(genai.configure) 대신 백엔드마다 클라이언트를 따로 만듦.
+        # REST 전송을 쓰면 api_endpoint 에 로컬 스텁 서버(http://...) 를 지정할 수 있음
+        from google.ai import generativelanguage as glm
+
+        self.name = name
+        self.model = model
+        self.timeout = timeout
+        self._glm = glm
+        client_options = {"api_key": api_key}
+        if api_endpoint:
+            client_options["api_endpoint"] = api_endpoint
+        self._client = glm.GenerativeServiceClient(transport="rest", client_options=client_options)
+
+    def complete(
+        self, system_instruction: str, prompt: str, temperature: float, max_tokens: Optional[int] = None
+    ) -> Completion:
+        glm = self._glm
+        start = time.perf_counter()
+        response = self._client.generate_content(
+            glm.GenerateContentRequest(
+                model=f"models/{self.model}",
+                system_instruction=glm.Content(parts=[glm.Part(text=system_instruction)]),
+                contents=[glm.Content(role="user", parts=[glm.Part(text=prompt)])],
+                generation_config=glm.GenerationConfig(temperature=temperature, max_output_tokens=max_tokens),
+            ),
+            timeout=self.timeout,
+        )
+        if not response.candidates:
+            raise RuntimeError(f"{self.name}: 응답 후보가 없습니다 ({response.prompt_feedback})")
+        text = "".join(part.text for part in response.candidates[0].content.parts)
+        metadata = response.usage_metadata
+        usage = SimpleNamespace(
+            prompt_tokens=metadata.prompt_token_count,
+            completion_tokens=metadata.candidates_token_count,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=metadata.cached_content_token_count),
+        )
+        return Completion(
+            text=text,
+            usage=usage,
+            backend=self.name,
+            model=self.model,
+            latency=time.perf_counter() - start,
+        )
+
+
+class LatencyTracker:
+    # 최근 window 개 호출의 (지연 시간, 성공 여부)
+    def __init__(self, window: int = 50):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.hedges = 0
+        self.wins = 0
+
+    def record(self, latency: float, ok: bool) -> None:
+        with self._lock:
+            self._samples.append((latency, ok))
+            self.calls += 1
+            self.errors += not ok
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def p95(self) -> float:
+        # 실패한 호출도 걸린 시간만큼은 지연으로 반영
+        with self._lock:
+            return percentile([latency for latency, _ in self._samples], 0.95)
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._samples:
+                return 0.0
+            return sum(not ok for _, ok in self._samples) / len(self._samples)
+
+
+class AllBackendsFailed(RuntimeError):
+    pass
+
+
+class _HedgeSlots:
+    # 헤지 요청용으로 추가로 잡은 슬롯. 호출이 반환될 때까지는 모두 유지하고(호출한 쪽 슬롯 + 헤지 슬롯),
+    # 반환된 뒤에는 아직 실행 중인 요청(헤지에서 진 요청) 수만큼만 남겼다가 끝날 때마다 반납
+    def __init__(self):
+        self._leases = []
+        self._running = 0
+        self._primary = True
+        self._lock = threading.Lock()
+
+    def add(self, lease) -> None:
+        with self._lock:
+            self._leases.append(lease)
+
+    def started(self) -> None:
+        with self._lock:
+            self._running += 1
+
+    def finished(self, _future=None) -> None:
+        with self._lock:
+            self._running -= 1
+            self._balance()
+
+    def release_primary(self) -> None:
+        with self._lock:
+            self._primary = False
+            self._balance()
+
+    def _balance(self) -> None:
+        # 호출한 쪽 슬롯이 남아 있는 동안은 반납하지 않음 (이긴 요청이 끝난 직후 반납하면
+        # 반환과 함께 호출한 쪽 슬롯도 풀려서 진 요청이 슬롯 없이 실행됨)
+        while not self._primary and len(self._leases) > self._running:
+            self._leases.pop().release()
+
+
+class Router:
+    def __init__(
+        self,
+        backends: list,
+        hedge_delay: Optional[float] = None,
+        window: int = 50,
+        min_samples: int = 5,
+        max_error_rate: float = 0.5,
+    ):
+        # hedge_delay=None 이면 헤징 없이 실패 시 폴백만 함
+        self.backends = list(backends)
+        self.hedge_delay = hedge_delay
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.trackers = {backend.name: LatencyTracker(window) for backend in self.backends}
+        # 헤징으로 진 요청도 끝까지 실행되어 통계에 반영되도록 별도 풀에서 실행
+        self._pool = ThreadPoolExecutor(max_workers=max(4, 4 * len(self.backends)), thread_name_prefix="router")
+
+    def ranked(self) -> list:
+        # 1) 오류율이 높은 백엔드는 뒤로  2) 측정된 백엔드는 p95 가 낮은 순
+        # 3) 측정치가 부족한 백엔드는 측정된 백엔드 뒤에 설정 순서대로 (아무것도 측정 전이면 설정 순서 그대로)
+        def sort_key(item):
+            position, backend = item
+            tracker = self.trackers[backend.name]
+            measured = len(tracker) >= self.min_samples
+            unhealthy = measured and tracker.error_rate() > self.max_error_rate
+            return unhealthy, not measured, tracker.p95() if measured else 0.0, position
+
+        return [backend for _, backend in sorted(enumerate(self.backends), key=sort_key)]
+
+    def _call(
+        self, backend: Backend, system_instruction: str, prompt: str, temperature: float, max_tokens: Optional[int]
+    ) -> Completion:
+        start = time.perf_counter()
+        try:
+            completion = backend.complete(system_instruction, prompt, temperature, max_tokens)
+        except Exception:
+            self.trackers[backend.name].record(time.perf_counter() - start, ok=False)
+            raise
+        self.trackers[backend.name].record(completion.latency, ok=True)
+        return completion
+
+    def complete(
+        self,
+        system_instruction: str,
+        prompt: str,
+        temperature: float,
+        max_tokens: Optional[int] = None,
+        acquire_hedge: Optional[Callable[[], Optional[object]]] = None,
+        on_discarded: Optional[Callable[[Completion], None]] = None,
+    ) -> Completion:
+        # acquire_hedge: 헤지 요청을 보내기 직전에 호출. 바로 잡을 수 있는 슬롯(release() 가 있는 lease)이 없으면
+        #                None 을 반환하고, 그러면 이번에는 헤지하지 않고 다음 hedge_delay 뒤에 다시 시도.
+        #                None 이면(인자 생략) 슬롯 없이 헤지
+        # on_discarded : 이긴 응답 말고 성공한 응답(헤지에서 진 요청)마다 호출. 반환 뒤에 끝나는 요청도 포함
+        candidates = self.ranked()
+        pending = {}
+        errors = []
+        last_error: Optional[BaseException] = None
+        slots = _HedgeSlots()
+
+        def launch(hedged: bool = False) -> None:
+            backend = candidates.pop(0)
+            if hedged:
+                self.trackers[backend.name].hedges += 1
+            slots.started()
+            future = self._pool.submit(self._call, backend, system_instruction, prompt, temperature, max_tokens)
+            future.add_done_callback(slots.finished)
+            pending[future] = backend
+
+        def discard(future) -> None:
+            if on_discarded is not None and future.exception() is None:
+                on_discarded(future.result())
+
+        try:
+            launch()
+            while pending:
+                timeout = self.hedge_delay if (self.hedge_delay is not None and candidates) else None
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    # 헤지 지연 시간 안에 응답이 없으면 다음 순위 백엔드에도 요청 (슬롯을 잡을 수 있을 때만)
+                    if acquire_hedge is not None:
+                        lease = acquire_hedge()
+                        if lease is None:
+                            continue
+                        slots.add(lease)
+                    launch(hedged=True)
+                    continue
+                winner = None
+                for future in done:
+                    backend = pending.pop(future)
+                    try:
+                        completion = future.result()
+                    except Exception as e:
+                        errors.append(f"{backend.name}: {e}")
+                        last_error = e
+                        continue
+                    if winner is None:
+                        winner = completion
+                        self.trackers[backend.name].wins += 1
+                    else:
+                        discard(future)
+                if winner is not None:
+                    for future in pending:
+                        future.add_done_callback(discard)
+                    return winner
+                if not pending and candidates:
+                    # 실행 중인 요청이 모두 실패했으면 다음 백엔드로 폴백
+                    launch()
+        finally:
+            slots.release_primary()
+
+        # 마지막 오류를 원인으로 연결 (429 면 호출한 쪽 스케줄러가 retry-after 를 읽을 수 있도록)
+        raise AllBackendsFailed("모든 백엔드 호출에 실패했습니다 - " + "; ".join(errors)) from last_error
+
+    def stats(self) -> list:
+        rows = []
+        for backend in self.backends:
+            tracker = self.trackers[backend.name]
+            rows.append({
+                "backend": backend.name,
+                "model": backend.model,
+                "calls": tracker.calls,
+                "errors": tracker.errors,
+                "error_rate": tracker.error_rate(),
+                "p95": tracker.p95() if len(tracker) else None,
+                "hedges": tracker.hedges,
+                "wins": tracker.wins,
+            })
+        return rows
@@ -0,0 +1,69 @@
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+
+# ==============================================================================
+# OpenAI 클라이언트 설정 (커넥션 풀 / 타임아웃 / 재시도)
+# ==============================================================================
+@dataclass(frozen=True)
+class ClientConfig:
+    api_key: str
+    base_url: Optional[str] = None
+
+    # 타임아웃 (초): 긴 JSON 응답을 고려해 read 는 넉넉하게
+    timeout: float = 120.0
+    connect_timeout: float = 10.0
+
+    # 재시도: 429 / 5xx / 연결 오류 시 SDK 가 지수 백오프로 재시도
+    # (RateLimitScheduler 를 거치는 클라이언트는 0 으로 두고 스케줄러가 재시도)
+    max_retries: int = 3
+
+    # keep-alive 커넥션 풀
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 60.0
+
+
+def build_client(
+    config: ClientConfig, on_response: Optional[Callable[[httpx.Response], None]] = None
+) -> OpenAI:
+    # 하나의 httpx 클라이언트(=커넥션 풀)를 만들어 두고 모든 요청이 재사용하도록 함.
+    # on_response 는 SDK 재시도를 포함한 모든 HTTP 응답마다 호출됨 (rate limit 헤더 수집용)
+    http_client = DefaultHttpxClient(
+        event_hooks={"response": [on_response]} if on_response is not None else None,
+        limits=httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(config.timeout, connect=config.connect_timeout),
+    )
+    return OpenAI(
+        api_key=config.api_key,
+        base_url=config.base_url,
+        max_retries=config.max_retries,
+        timeout=httpx.Timeout(config.timeout, connect=config.connect_timeout),
+        http_client=http_client,
+    )
+
+
+def build_async_client(config: ClientConfig) -> AsyncOpenAI:
+    # 배치 생성용 비동기 클라이언트 (같은 풀 설정 사용)
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(config.timeout, connect=config.connect_timeout),
+    )
+    return AsyncOpenAI(
+        api_key=config.api_key,
+        base_url=config.base_url,
+        max_retries=config.max_retries,
+        timeout=httpx.Timeout(config.timeout, connect=config.connect_timeout),
+        http_client=http_client,
+    )
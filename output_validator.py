@@ -0,0 +1,221 @@
+import json
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+from prompt_core import (
+    COMFYUI_JSON_TEMPLATE,
+    DEFAULT_BRIEF,
+    STRUCTURED_OUTPUT_SCHEMA,
+    build_combined_prompt,
+    replace_comfyui_json,
+    schema_errors,
+)
+from timeline_parser import parse_timeline
+
+# ==============================================================================
+# 생성 결과 검증 (API 호출 없이 로컬에서, 모든 응답에 대해 실행)
+#   - 스키마 : [JSON 템플릿] 구조 그대로인지 (timeline 항목 / audio 의 key 등)
+#   - 규칙   : SYSTEM_INSTRUCTION 의 규칙 중 기계적으로 확인할 수 있는 것
+#              ("___" 잔여, 한글, camera_work 의 샷 타입 / 카메라 움직임, voice_over → speaking, 타임라인 구간)
+# 위반이 있으면 해당 최상위 섹션만 "이 항목을 고쳐 달라"는 짧은 후속 요청으로 다시 받음 (부분 재생성 스키마 재사용)
+# ==============================================================================
+COMFYUI_JSON_SCHEMA = STRUCTURED_OUTPUT_SCHEMA["properties"]["comfyui_json"]
+MIDJOURNEY_SECTION = "midjourney_prompt"
+
+_HANGUL = re.compile(r"[가-힣ㄱ-ㅎㅏ-ㅣ]")
+# camera_work.notes / effects 에 들어가면 안 되는 씬별 카메라 표현 (조건 1 중요 규칙)
+_CAMERA_TERMS = re.compile(
+    r"\b(dolly(?:[- ]?(?:in|out))?|zoom(?:s|ed|ing)?(?:[- ]?(?:in|out))?|pan(?:s|ned|ning)?|tilt(?:s|ed|ing)?"
+    r"|tracking shot|crane shot|(?:extreme )?wide shot|medium shot|close[- ]?ups?|long shot|establishing shot"
+    r"|over[- ]the[- ]shoulder|(?:high|low)[- ]angle)\b",
+    re.IGNORECASE,
+)
+_SPEAKING = re.compile(r"\b(speak|speaks|speaking|talk|talks|talking|says|saying|mouth|lips|narrat\w*)\b", re.IGNORECASE)
+_TIMESTAMP = re.compile(r"^\d{2}:\d{2}(?:\.\d)?-\d{2}:\d{2}(?:\.\d)?$")
+
+
+@dataclass(frozen=True)
+class Violation:
+    path: str
+    message: str
+
+    @property
+    def section(self) -> Optional[str]:
+        # 수리 요청 단위인 최상위 섹션 key. 응답 전체 문제(JSON 파싱 실패 등)는 None
+        if self.path == MIDJOURNEY_SECTION:
+            return MIDJOURNEY_SECTION
+        key = re.match(r"\$\.([^.\[]+)", self.path)
+        return key.group(1) if key else None
+
+    def __str__(self) -> str:
+        return f"{self.path}: {self.message}"
+
+
+def _strings(value, path: str):
+    # (경로, 문자열) 을 전부 나열
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _strings(item, f"{path}.{key}")
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            yield from _strings(item, f"{path}[{index}]")
+    elif isinstance(value, str):
+        yield path, value
+
+
+def _split_error(error: str) -> Violation:
+    path, _, message = error.partition(": ")
+    return Violation(path, message)
+
+
+def validate_comfyui_json(comfyui_json: Optional[dict], brief: dict) -> list:
+    if comfyui_json is None:
+        return [Violation("$", "ComfyUI JSON 코드 블록을 찾거나 파싱할 수 없음")]
+
+    violations = [_split_error(error) for error in schema_errors(comfyui_json, COMFYUI_JSON_SCHEMA)]
+
+    for path, text in _strings(comfyui_json, "$"):
+        if "___" in text:
+            violations.append(Violation(path, "템플릿 자리표시자(___)가 남아 있음"))
+        elif _HANGUL.search(text):
+            violations.append(Violation(path, "영어로 작성해야 함 (한글 포함)"))
+
+    camera_work = comfyui_json.get("camera_work")
+    if isinstance(camera_work, dict):
+        global_fields = {key: camera_work[key] for key in ("notes", "effects") if key in camera_work}
+        for path, text in _strings(global_fields, "$.camera_work"):
+            terms = sorted({match.group(0).lower() for match in _CAMERA_TERMS.finditer(text)})
+            if terms:
+                violations.append(Violation(
+                    path, f"샷 타입 / 카메라 움직임 / 앵글({', '.join(terms)})은 timeline[*].action 에만 써야 함"
+                ))
+
+    timeline = comfyui_json.get("timeline")
+    if isinstance(timeline, list):
+        fields = {**DEFAULT_BRIEF, **brief}
+        segments = parse_timeline(fields["timeline_detail"])
+        if segments and len(timeline) != len(segments):
+            violations.append(
+                Violation("$.timeline", f"입력 타임라인은 {len(segments)}개 구간인데 {len(timeline)}개 항목임")
+            )
+        speaking_required = bool(str(fields["audio_voice"]).strip())
+        for index, item in enumerate(timeline):
+            if not isinstance(item, dict):
+                continue
+            if item.get("sequence") != index + 1:
+                violations.append(Violation(f"$.timeline[{index}].sequence", f"{index + 1} 이어야 함"))
+            if isinstance(item.get("timestamp"), str) and not _TIMESTAMP.match(item["timestamp"]):
+                violations.append(Violation(f"$.timeline[{index}].timestamp", "\"00:00-03:00\" 형식이 아님"))
+            action = item.get("action")
+            if speaking_required and isinstance(action, str) and not _SPEAKING.search(action):
+                violations.append(Violation(
+                    f"$.timeline[{index}].action", "voice_over 가 있으므로 말하고 있는 동작(speaking 등)을 포함해야 함"
+                ))
+
+    requirements = COMFYUI_JSON_TEMPLATE["requirements"]
+    if isinstance(comfyui_json.get("requirements"), str) and comfyui_json["requirements"] != requirements:
+        violations.append(Violation("$.requirements", f"\"{requirements}\" 그대로여야 함"))
+    return violations
+
+
+def validate_midjourney(mj: Optional[str]) -> list:
+    if not mj:
+        return [Violation(MIDJOURNEY_SECTION, "미드저니 프롬프트가 비어 있거나 구간을 찾을 수 없음")]
+    violations = []
+    if len(mj.strip().splitlines()) > 1:
+        violations.append(Violation(MIDJOURNEY_SECTION, "한 줄이어야 함"))
+    if _HANGUL.search(mj):
+        violations.append(Violation(MIDJOURNEY_SECTION, "영문으로 작성해야 함 (한글 포함)"))
+    return violations
+
+
+def validate_output(comfyui_json: Optional[dict], mj: Optional[str], brief: dict) -> list:
+    return validate_comfyui_json(comfyui_json, brief) + validate_midjourney(mj)
+
+
+def repair_targets(violations: list) -> tuple:
+    # (다시 받을 ComfyUI 섹션 목록 (템플릿 순서), 미드저니 프롬프트도 다시 받을지).
+    # 응답 전체가 깨진 경우는 부분 수리 대상이 아니므로 ([], False)
+    if any(violation.section is None for violation in violations):
+        return [], False
+    sections = {violation.section for violation in violations}
+    return [key for key in COMFYUI_JSON_TEMPLATE if key in sections], MIDJOURNEY_SECTION in sections
+
+
+def drop_unknown_sections(comfyui_json: dict) -> dict:
+    # 템플릿에 없는 최상위 key 는 다시 생성할 곳이 없으므로 로컬에서 제거
+    return {key: value for key, value in comfyui_json.items() if key in COMFYUI_JSON_TEMPLATE}
+
+
+REPAIR_PROMPT_TEMPLATE = """
+[규칙 위반 수정 요청]
+이전에 생성한 결과 중 아래 항목이 [조건] / [JSON 템플릿] 규칙을 어겼습니다.
+위반 항목만 규칙에 맞게 고치고, 나머지 내용과 표현은 가능한 한 그대로 유지해서 요청된 섹션을 다시 작성하세요.
+
+[위반 항목]
+{violations}
+
+[이전에 생성한 섹션]
+{previous}
+
+[다시 작성할 섹션]
+{sections}
+"""
+
+
+def build_repair_prompt(
+    brief: dict,
+    comfyui_json: dict,
+    mj: Optional[str],
+    violations: list,
+    sections: list,
+    include_midjourney: bool,
+) -> str:
+    # 위반이 있는 섹션과 위반 목록만 보냄. 섹션 자체가 빠진 경우에만 입력 전체를 붙임
+    previous = {key: comfyui_json[key] for key in sections if key in comfyui_json}
+    if include_midjourney:
+        previous[MIDJOURNEY_SECTION] = mj or ""
+    prompt = REPAIR_PROMPT_TEMPLATE.format(
+        violations="\n".join(f"- {violation}" for violation in violations),
+        previous=json.dumps(previous, ensure_ascii=False, indent=2),
+        sections=", ".join(sections + ([MIDJOURNEY_SECTION] if include_midjourney else [])),
+    ).strip()
+    if any(key not in comfyui_json for key in sections):
+        prompt += f"\n\n[입력 전체]\n{build_combined_prompt(brief)}"
+    return prompt
+
+
+def _project(value, schema: dict):
+    # 스키마에 있는 key 만 남김 (로컬에서 채운 timeline sequence / timestamp 를 응답 형식에 맞게 뺄 때)
+    if schema.get("type") == "object" and isinstance(value, dict):
+        return {key: _project(value[key], sub) for key, sub in schema["properties"].items() if key in value}
+    if schema.get("type") == "array" and isinstance(value, list):
+        return [_project(item, schema["items"]) for item in value]
+    return value
+
+
+def replace_midjourney(text: str, previous_mj: Optional[str], mj: str) -> str:
+    if mj == previous_mj:
+        return text
+    if previous_mj and previous_mj in text:
+        return text.replace(previous_mj, mj, 1)
+    return text.rstrip() + f"\n\n### 2️⃣ 미드저니 사용 프롬프트\n{mj}"
+
+
+def rewrite_response(
+    response_text: str,
+    comfyui_json: dict,
+    mj: Optional[str],
+    previous_mj: Optional[str],
+    structured_schema: Optional[dict] = None,
+) -> str:
+    # 수리된 결과를 원래 응답 형식으로 되돌림 (캐시에 저장해 다음 히트부터는 수리 없이 사용)
+    if structured_schema is not None:
+        data = json.loads(response_text)
+        data["comfyui_json"] = _project(comfyui_json, structured_schema["properties"]["comfyui_json"])
+        data["midjourney_prompt"] = mj or ""
+        return json.dumps(data, ensure_ascii=False)
+
+    text = replace_comfyui_json(response_text, comfyui_json)
+    return replace_midjourney(text, previous_mj, mj) if mj else text
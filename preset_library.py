@@ -0,0 +1,188 @@
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Optional
+
+from prompt_core import DEFAULT_BRIEF, FORM_FIELDS
+
+# ==============================================================================
+# 장면 프리셋 라이브러리 (파일 하나 또는 디렉터리 아래의 *.json)
+#   - 프리셋은 기본 브리프와 다른 필드만 적음. 파일 공통값(defaults) / 다른 프리셋(base)을 이어받을 수 있음
+#       {"brand": "니코모리", "tags": ["cafe"], "defaults": {...},
+#        "presets": [{"id": "cafe-day", "name": "...", "tags": [...], "fields": {...}},
+#                    {"id": "cafe-night", "base": "cafe-day", "fields": {"lighting": "..."}}]}
+#   - 파일은 처음 조회할 때 읽고, refresh() 는 수정 시간이 바뀐 파일만 다시 읽음
+#   - 브랜드 / 태그별 인덱스는 메모리에 두고, 전체 브리프는 요청 시 계산해서 캐시
+# ==============================================================================
+
+
+class PresetError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Preset:
+    id: str
+    name: str
+    brand: str
+    tags: tuple
+    # 이 프리셋에서 직접 지정한 필드 (파일 defaults / base 적용 전)
+    fields: dict = field(hash=False)
+    base: Optional[str] = None
+    source: str = ""
+
+
+def _parse_file(path: str) -> tuple:
+    # (프리셋 목록, 파일 공통 defaults)
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {"presets": data}
+
+    file_brand = data.get("brand", "")
+    file_tags = tuple(data.get("tags", ()))
+    defaults = {key: value for key, value in data.get("defaults", {}).items() if key in FORM_FIELDS}
+    presets = []
+    for item in data.get("presets", []):
+        if "id" not in item:
+            raise PresetError(f"{path}: id 가 없는 프리셋이 있습니다")
+        fields = {key: value for key, value in item.get("fields", {}).items() if key in FORM_FIELDS}
+        presets.append(Preset(
+            id=item["id"],
+            name=item.get("name") or fields.get("prompt_name") or item["id"],
+            brand=item.get("brand") or fields.get("brand") or defaults.get("brand") or file_brand,
+            tags=tuple(dict.fromkeys(file_tags + tuple(item.get("tags", ())))),
+            fields=fields,
+            base=item.get("base"),
+            source=path,
+        ))
+    return presets, defaults
+
+
+class PresetLibrary:
+    def __init__(self, path: str):
+        self.path = path
+        self.errors = []
+        self._files = {}  # path -> (mtime, presets, defaults)
+        self._presets = {}
+        self._defaults = {}  # preset id -> 파일 defaults
+        self._by_brand = {}
+        self._by_tag = {}
+        self._briefs = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _paths(self) -> list:
+        if os.path.isfile(self.path):
+            return [self.path]
+        if not os.path.isdir(self.path):
+            return []
+        paths = []
+        for root, _, names in os.walk(self.path):
+            paths.extend(os.path.join(root, name) for name in names if name.endswith(".json"))
+        return sorted(paths)
+
+    def refresh(self) -> None:
+        with self._lock:
+            self._load()
+
+    def _ensure_loaded(self) -> None:
+        with self._lock:
+            if not self._loaded:
+                self._load()
+
+    def _load(self) -> None:
+        errors = []
+        files = {}
+        for path in self._paths():
+            mtime = os.path.getmtime(path)
+            cached = self._files.get(path)
+            if cached is not None and cached[0] == mtime:
+                files[path] = cached
+                continue
+            try:
+                presets, defaults = _parse_file(path)
+            except (OSError, ValueError) as e:
+                errors.append(f"{path}: {e}")
+                continue
+            files[path] = (mtime, presets, defaults)
+
+        presets, preset_defaults, by_brand, by_tag = {}, {}, {}, {}
+        for path, (_, file_presets, defaults) in files.items():
+            for preset in file_presets:
+                if preset.id in presets:
+                    errors.append(f"{path}: 프리셋 id '{preset.id}' 가 {presets[preset.id].source} 에도 있습니다")
+                    continue
+                presets[preset.id] = preset
+                preset_defaults[preset.id] = defaults
+                by_brand.setdefault(preset.brand, []).append(preset.id)
+                for tag in preset.tags:
+                    by_tag.setdefault(tag, set()).add(preset.id)
+
+        self._files = files
+        self._presets = presets
+        self._defaults = preset_defaults
+        self._by_brand = by_brand
+        self._by_tag = by_tag
+        self._briefs = {}
+        self.errors = errors
+        self._loaded = True
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._presets)
+
+    def brands(self) -> list:
+        self._ensure_loaded()
+        return sorted(self._by_brand)
+
+    def tags(self, brand: Optional[str] = None) -> list:
+        self._ensure_loaded()
+        if brand is None:
+            return sorted(self._by_tag)
+        return sorted({tag for preset_id in self._by_brand.get(brand, []) for tag in self._presets[preset_id].tags})
+
+    def get(self, preset_id: str) -> Optional[Preset]:
+        self._ensure_loaded()
+        return self._presets.get(preset_id)
+
+    def search(self, brand: Optional[str] = None, tags: tuple = (), query: str = "") -> list:
+        # 브랜드 / 태그(모두 포함)는 인덱스로 좁히고, 검색어는 이름 / id 부분 일치
+        self._ensure_loaded()
+        ids = list(self._by_brand.get(brand, [])) if brand else list(self._presets)
+        for tag in tags:
+            tagged = self._by_tag.get(tag, set())
+            ids = [preset_id for preset_id in ids if preset_id in tagged]
+        query = query.strip().casefold()
+        presets = [self._presets[preset_id] for preset_id in ids]
+        if query:
+            presets = [p for p in presets if query in p.name.casefold() or query in p.id.casefold()]
+        return presets
+
+    def brief(self, preset_id: str) -> dict:
+        # 기본 브리프 ← 파일 defaults ← base 프리셋 ← 프리셋 필드 순으로 덮어쓴 전체 브리프
+        self._ensure_loaded()
+        with self._lock:
+            return dict(self._resolve(preset_id, ()))
+
+    def _resolve(self, preset_id: str, chain: tuple) -> dict:
+        if preset_id in self._briefs:
+            return self._briefs[preset_id]
+        preset = self._presets.get(preset_id)
+        if preset is None:
+            raise PresetError(f"프리셋 '{preset_id}' 를 찾을 수 없습니다")
+        if preset_id in chain:
+            raise PresetError("프리셋 base 가 순환합니다: " + " → ".join(chain + (preset_id,)))
+
+        brief = dict(DEFAULT_BRIEF)
+        brief.update(self._defaults[preset_id])
+        if preset.base:
+            brief.update(self._resolve(preset.base, chain + (preset_id,)))
+        brief.update(preset.fields)
+        # 프롬프트 이름 / 브랜드는 base 에서 물려받지 않고 이 프리셋 기준으로 맞춤
+        brief["prompt_name"] = preset.fields.get("prompt_name", preset.name)
+        if preset.brand:
+            brief["brand"] = preset.brand
+        self._briefs[preset_id] = brief
+        return brief
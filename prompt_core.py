@@ -0,0 +1,787 @@
+import copy
+import json
+import re
+from typing import Optional
+
+from timeline_parser import fill_timeline, parse_timeline
+
+# ✅ 모델 설정
+MODEL_NAME = "gpt-4.1-mini"  # 필요하면 gpt-4.1 / gpt-4.1-mini 등으로 변경 가능
+TEMPERATURE = 0.3
+# 변형(여러 후보) 생성 시에는 후보끼리 달라지도록 온도를 높임
+VARIANT_TEMPERATURE = 0.9
+MAX_VARIANTS = 4
+
+# ✅ 기본값 상수 (리셋 시 여기에 적힌 값으로 돌아감)
+DEFAULT_BRAND = "니코모리"
+DEFAULT_ASPECT = "16:9"
+DEFAULT_DURATION = 8
+
+DEFAULT_SUBJECT = "밝게 미소 짓는 20대 한국인 여성"
+DEFAULT_CHARACTER_DETAIL = "긴 생머리, 깔끔한 셔츠와 데님, 자연스러운 메이크업"
+DEFAULT_ACTION = "카페 테라스에서 노트북으로 작업하며, 가끔 창밖을 보며 미소 짓는다"
+DEFAULT_EMOTION = "집중 + 여유 + 작은 설렘"
+
+DEFAULT_BACKGROUND = "햇살이 들어오는 도심 카페 테라스, 주변에 화분과 나무, 뒤로 흐릿한 도시 풍경"
+DEFAULT_LIGHTING = "golden hour, soft natural light"
+DEFAULT_CAMERA_MOVE = "slow dolly-in, medium shot, 약간 높은 앵글"
+DEFAULT_STYLE = "cinematic, realistic, soft color grading"
+DEFAULT_COMPOSITION = "rule of thirds, subject slightly off-center"
+
+DEFAULT_BGM = "warm lo-fi beat, soft piano, medium tempo"
+DEFAULT_SFX = "카페 사람들 소음, 잔잔한 대화 소리, 컵 부딪히는 소리"
+DEFAULT_VOICE = ""
+
+DEFAULT_TIMELINE_OVERVIEW = "총 8초, 3개의 주요 구간으로 구성"
+DEFAULT_TIMELINE_DETAIL = (
+    "0-3초: 카페 전경, 테라스와 도시 배경을 보여주는 와이드 샷\n"
+    "3-6초: 노트북으로 작업 중인 인물을 중심으로 미디엄 샷, 화면에 집중하는 표정\n"
+    "6-8초: 살짝 카메라가 줌인되며 창밖을 보며 미소 짓는 클로즈업"
+)
+DEFAULT_EXTRA = ""
+DEFAULT_PROMPT_NAME = "카페 테라스 작업 씬"
+
+# ✅ 입력 폼 필드 (Streamlit 위젯 key 와 동일) + 기본 브리프
+FORM_FIELDS = (
+    "brand",
+    "aspect",
+    "duration",
+    "prompt_name",
+    "subject",
+    "character_detail",
+    "action",
+    "emotion",
+    "background",
+    "lighting",
+    "camera_move",
+    "style",
+    "composition",
+    "audio_bgm",
+    "audio_sfx",
+    "audio_voice",
+    "timeline_overview",
+    "timeline_detail",
+    "extra",
+)
+
+DEFAULT_BRIEF = {
+    "brand": DEFAULT_BRAND,
+    "aspect": DEFAULT_ASPECT,
+    "duration": DEFAULT_DURATION,
+    "prompt_name": DEFAULT_PROMPT_NAME,
+    "subject": DEFAULT_SUBJECT,
+    "character_detail": DEFAULT_CHARACTER_DETAIL,
+    "action": DEFAULT_ACTION,
+    "emotion": DEFAULT_EMOTION,
+    "background": DEFAULT_BACKGROUND,
+    "lighting": DEFAULT_LIGHTING,
+    "camera_move": DEFAULT_CAMERA_MOVE,
+    "style": DEFAULT_STYLE,
+    "composition": DEFAULT_COMPOSITION,
+    "audio_bgm": DEFAULT_BGM,
+    "audio_sfx": DEFAULT_SFX,
+    "audio_voice": DEFAULT_VOICE,
+    "timeline_overview": DEFAULT_TIMELINE_OVERVIEW,
+    "timeline_detail": DEFAULT_TIMELINE_DETAIL,
+    "extra": DEFAULT_EXTRA,
+}
+
+# ==============================================================================
+# [1] System Instruction 설정 (역할 + 규칙)
+# ==============================================================================
+SYSTEM_INSTRUCTION = """
+당신은 입력된 내용을 분석하여 'ComfyUI JSON 프롬프트'와 '미드저니 프롬프트'로 변환하는 전문 AI입니다.
+사용자가 입력한 내용을 바탕으로 아래의 [조건]과 [양식]을 완벽하게 준수하여 답변하세요.
+
+[전체 역할]
+- 사용자는 한국어로 장면/인물/배경/오디오/타임라인 정보를 입력합니다.
+- 당신은 이를 토대로:
+  1) ComfyUI에서 사용할 수 있는 JSON 프롬프트
+  2) Midjourney에서 사용할 수 있는 한 줄짜리 영문 프롬프트
+  를 생성해야 합니다.
+
+[조건 1: ComfyUI JSON 작성]
+- 아래 [JSON 템플릿]의 구조와 key 이름, 계층 구조를 절대 변경하지 마세요.
+- "___" 부분을 입력 내용을 기반으로 모두 영어로 채우세요.
+- 입력으로 제공되는 [오디오 / 사운드], [타임라인 / 씬 분할] 정보는 반드시 JSON의 "audio"와 "timeline" 섹션에 반영해야 합니다.
+- "timeline" 필드는 반드시 배열 형태여야 하며, 각 요소는 다음 네 개의 key만 사용합니다:
+  - "sequence" : 정수, 1부터 시작하는 씬 번호
+  - "timestamp" : 예) "00:00-03:00" 형식의 문자열
+  - "action" : 해당 구간에서 화면에 보이는 내용, 카메라 움직임, 분위기를 모두 포함하는 설명 (영어)
+  - "audio" : 해당 구간에서 들리는 사운드/효과음/음악 관련 설명 (영어)
+- "timeline" 안에는 shot_type, camera_movement 등 다른 key를 추가로 만들지 마세요. 필요한 정보는 모두 "action" 텍스트 안에 녹여서 작성합니다.
+- "audio" 필드는 반드시 아래 두 개의 key만 사용합니다:
+  - "voice_over" : 내레이션/대사/보이스 관련 요약 (영어)
+  - "music" : BGM 또는 음악 스타일, 분위기 (영어)
+- "audio" 안에 bgm, sfx 같은 다른 key 이름을 만들지 말고, 모든 음악/사운드 정보는:
+  - 전반적인 음악/톤 → "music"
+  - 내레이션/보이스 → "voice_over"
+  로만 정리합니다.
+- "camera_work" 섹션은 전체 영상에 공통으로 적용되는 렌즈, 전역적인 카메라 스타일, 효과 정도만 간단히 채우세요.
+  - 씬별 카메라 움직임, 샷 타입, 구체적인 화면 설명은 모두 "timeline" 배열의 "action" 텍스트 안에 포함합니다.
+- 카메라, 렌즈, 조명 등은 설명이 없을 때는 당신이 장면에 어울리는 값을 "추천"해서 채우고, 정말 결정하기 어려운 경우에만 "none"을 사용하세요.
+
+※ 중요 규칙:
+- 카메라 움직임, 샷 타입, 앵글, 화면 묘사 등 모든 카메라 관련 구체 정보는 반드시 timeline[*].action 내부 문장으로만 표현해야 합니다.
+camera_work.notes 또는 camera_work.effects 안에는 절대로 구체적인 카메라 움직임(dolly, zoom, pan, tilt), 샷 타입(wide, medium, close-up), 앵글(high-angle, low-angle) 정보를 넣지 마세요.
+
+※ Voice Over 관련 중요 규칙:
+- 만약 사용자가 voice_over 또는 대사(말한 문장)를 제공한 경우,
+timeline[*].action 안에는 반드시 '말하고 있는 동작'을 포함해야 합니다.
+
+예:
+"speaking softly",
+"mouth moving naturally while talking",
+"subtle talking motion",
+"talking while smiling"
+
+voice_over는 단순 내레이션이 아니라,
+인물이 직접 말하고 있는 경우라면 반드시 스타일을 반영해 주세요.
+
+즉, voice_over가 있을 경우:
+- timeline[*].action 문장 안에 'speaking' 관련 묘사를 추가해야 합니다.
+- 해당 컷에서 인물이 말하고 있는 모습이 시각적으로 묘사되도록 작성하세요.
+
+camera_work 섹션에는 아래와 같은 "전역적인 설정"만 포함해야 합니다:
+- 전체 영상에 공통으로 사용되는 렌즈 정보 (예: 35mm, 50mm 등)
+- 전체 영상에 공통으로 적용되는 색보정/효과 (예: soft bloom, cinematic grading)
+- 전체적인 카메라 톤 (예: overall cinematic tone)
+
+모든 장면별 카메라 동작, 샷 구성, 화면 내용은 timeline[*].action 문장 안에 포함하세요.
+
+[조건 2: 누락 데이터 처리]
+- 입력 내용에서 찾을 수 없는 정보는 "none"이라고 기입하세요.
+- 단, 가능한 경우에는 입력된 키워드와 전체 분위기를 바탕으로 합리적인 값을 추론해 채우려고 노력한 뒤, 정말 정보가 없을 때만 "none"을 사용합니다.
+- JSON 작성 후, 하단에 'ComfyUI 사용 json 프롬프트 중 누락 / none 부분'을 마크다운 리스트로 정리하세요.
+  - 예: "- character.appearance.eye_color : 눈 색상 정보 없음"
+
+[조건 3: 미드저니 프롬프트 작성]
+- 모든 내용은 영문으로 작성합니다.
+- 다음 순서를 반드시 지켜서 한 줄 프롬프트를 구성하세요:
+  주제(Topic) → 액션(Action) → 배경(Background) → 카메라 움직임(Camera movement) → 스타일(Style) → 구도(Composition)
+- 각 요소는 쉼표(,)로 구분합니다.
+- 오디오 / 타임라인에서 유추되는 분위기, 리듬감(느린 롱테이크, 빠른 컷 편집 등)은 Style, Camera movement, Mood 표현에 자연스럽게 반영하세요.
+- 출력 예시는 다음과 같은 형식입니다(예시는 그대로 복사하지 말고, 상황에 맞게 새로 작성하세요):
+
+  "a smiling Korean woman in her 20s, working on a laptop at a sunlit cafe terrace, soft camera dolly-in with medium shot, cinematic realistic style with warm tones, rule of thirds composition"
+
+[조건 4: 미드저니 누락 확인]
+- 미드저니 프롬프트 작성 후, 부족하거나 빠진 요소(예: 카메라 움직임이 모호함, 조명 스타일이 구체적이지 않음 등)를 하단에 리스트로 정리하세요.
+  - 예: "- 카메라 움직임이 구체적이지 않음 (어떤 방향으로 이동하는지 불명확)"
+
+[출력 양식 – 반드시 이 순서를 지키세요]
+
+1️⃣ ComfyUI 사용 json 프롬프트
+- 아래 [JSON 템플릿]을 기반으로 한 JSON을, 코드 블럭(```json ... ```) 형식으로 출력합니다.
+
+⚠️ ComfyUI 사용 json 프롬프트 중 누락 / none 부분
+- JSON 내에서 "none"으로 남은 항목들을 마크다운 리스트로 정리합니다.
+
+2️⃣ 미드저니 사용 프롬프트
+- 한 줄짜리 영문 프롬프트로 출력합니다.
+- 구성 순서: Topic, Action, Background, Camera movement, Style, Composition (각 요소는 쉼표로 구분)
+
+⚠️ 미드저니 사용 프롬프트 중 누락부분
+- 부족하거나 빠진 요소를 리스트로 정리합니다.
+
+[JSON 템플릿]
+
+{
+  "topic_and_content": {
+    "description": "___"
+  },
+  "character": {
+    "gender": "___",
+    "appearance": {
+      "nationality": "___",
+      "age": "___",
+      "eye_color": "___",
+      "scar": "___",
+      "hair": "___"
+    },
+    "clothing": "___",
+    "emotions_sequence": [
+      "___",
+      "___",
+      "___"
+    ]
+  },
+  "action": {
+    "sequence": [
+      "___",
+      "___",
+      "___",
+      "___"
+    ],
+    "object_interaction": [
+      "___",
+      "___",
+      "___"
+    ]
+  },
+  "background": {
+    "location": "___",
+    "time_of_day": "___",
+    "elements": [
+      "___",
+      "___"
+    ],
+    "weather": "___",
+      "scene_lighting": "___"
+  },
+  "camera_work": {
+    "lens": "___",
+    "effects": [
+      "___",
+      "___"
+    ],
+    "notes": "___"
+  },
+  "style": {
+    "genre": "___",
+    "style_lighting": "___",
+    "film_grain": "___",
+    "color_palette": "___",
+    "mood": "___"
+  },
+
+  "timeline": [
+    {
+      "sequence": 1,
+      "timestamp": "00:00-03:00",
+      "action": "___",
+      "audio": "___"
+    },
+    {
+      "sequence": 2,
+      "timestamp": "03:00-06:00",
+      "action": "___",
+      "audio": "___"
+    },
+    {
+      "sequence": 3,
+      "timestamp": "06:00-08:00",
+      "action": "___",
+      "audio": "___"
+    }
+  ],
+
+  "audio": {
+    "voice_over": "___",
+    "music": "___"
+  },
+
+  "aspect_ratio": "___",
+  "requirements": "full-size video without letterboxes"
+}
+
+[ComfyUI 사용 json 프롬프트 중 누락 / none 부분 예시]
+
+- character.appearance.eye_color : 눈 색상 정보 없음
+- character.appearance.scar : 흉터 유무 정보 없음
+
+[미드저니 사용 프롬프트 출력 예시]
+
+Topic, Action, Background, Camera movement, Style, Composition
+
+[미드저니 사용 프롬프트 중 누락부분 예시]
+
+- 카메라 움직임 관련 구체적인 표현 부족
+- 조명 스타일 구체 정보 부족
+"""
+
+# ==============================================================================
+# [2] 입력 브리프 → 사용자 프롬프트 조립
+# ==============================================================================
+# (제목, 줄 목록). 값이 빈 줄 / 모든 줄이 빈 섹션은 프롬프트에서 빠짐 (build_combined_prompt)
+PROMPT_SECTIONS = (
+    ("브랜드/프로젝트", ("{brand}",)),
+    ("프롬프트 이름", ("{prompt_name}",)),
+    ("영상 정보", ("- Aspect Ratio: {aspect}", "- Duration: {duration}초")),
+    ("주제 / 메인 인물", ("{subject}",)),
+    ("캐릭터 디테일", ("{character_detail}",)),
+    ("액션 / 행동", ("{action}",)),
+    ("감정 / 분위기", ("{emotion}",)),
+    ("배경 / 장소", ("{background}",)),
+    ("조명 / 분위기", ("{lighting}",)),
+    ("카메라 움직임 / 샷 타입", ("{camera_move}",)),
+    ("스타일", ("{style}",)),
+    ("구도", ("{composition}",)),
+    ("오디오 / 사운드", ("- BGM: {audio_bgm}", "- SFX: {audio_sfx}", "- Voice / Narration: {audio_voice}")),
+    ("타임라인 / 씬 분할", ("- 요약: {timeline_overview}", "- 상세:\n{timeline_detail}")),
+    ("추가 메모", ("{extra}",)),
+)
+
+def _section(instruction: str, start_line: str, end_line: Optional[str] = None) -> str:
+    # 줄 맨 앞에 오는 제목을 기준으로 구간을 잘라냄 (본문 중간에 언급된 같은 문구는 무시)
+    start = instruction.index("\n" + start_line) + 1
+    end = instruction.index("\n" + end_line, start) + 1 if end_line else len(instruction)
+    return instruction[start:end]
+
+
+# ✅ 분리 병렬 모드용 지시문: SYSTEM_INSTRUCTION 을 조건 1–2 (ComfyUI) / 조건 3–4 (미드저니) 로 나눔
+COMFYUI_SYSTEM_INSTRUCTION = (
+    "\n당신은 입력된 내용을 분석하여 'ComfyUI JSON 프롬프트'로 변환하는 전문 AI입니다.\n"
+    "사용자가 입력한 내용을 바탕으로 아래의 [조건]과 [양식]을 완벽하게 준수하여 답변하세요.\n"
+    "미드저니 프롬프트는 작성하지 마세요.\n\n"
+    + _section(SYSTEM_INSTRUCTION, "[조건 1: ComfyUI JSON 작성]", "[조건 3: 미드저니 프롬프트 작성]")
+    + "[출력 양식 – 반드시 이 순서를 지키세요]\n\n"
+    + _section(SYSTEM_INSTRUCTION, "1️⃣ ComfyUI 사용 json 프롬프트", "2️⃣ 미드저니 사용 프롬프트")
+    + _section(SYSTEM_INSTRUCTION, "[JSON 템플릿]", "[미드저니 사용 프롬프트 출력 예시]")
+)
+
+MIDJOURNEY_SYSTEM_INSTRUCTION = (
+    "\n당신은 입력된 내용을 분석하여 '미드저니 프롬프트'로 변환하는 전문 AI입니다.\n"
+    "사용자가 입력한 내용을 바탕으로 아래의 [조건]과 [양식]을 완벽하게 준수하여 답변하세요.\n"
+    "ComfyUI JSON 은 작성하지 마세요.\n\n"
+    + _section(SYSTEM_INSTRUCTION, "[조건 3: 미드저니 프롬프트 작성]", "[출력 양식 – 반드시 이 순서를 지키세요]")
+    + "[출력 양식 – 반드시 이 순서를 지키세요]\n\n"
+    + _section(SYSTEM_INSTRUCTION, "2️⃣ 미드저니 사용 프롬프트", "[JSON 템플릿]")
+    + _section(SYSTEM_INSTRUCTION, "[미드저니 사용 프롬프트 출력 예시]")
+)
+
+
+TIMELINE_STRUCTURE_TEMPLATE = """
+
+[타임라인 구조 (입력에서 자동 계산됨 – timeline 배열의 sequence / timestamp 는 아래 값을 그대로 사용)]
+{segments}"""
+
+
+def _is_empty(value) -> bool:
+    # 공백뿐인 필드만 뺌. "none" / "-" / "없음" 처럼 직접 적은 값은 사용자 의도이므로 그대로 보냄
+    return not str(value).strip()
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+def build_combined_prompt(brief: dict) -> str:
+    # 빠진 필드는 폼 기본값으로 채움 (폼을 열고 일부만 수정한 것과 동일)
+    fields = {**DEFAULT_BRIEF, **brief}
+    # 빈 값의 줄 / 빈 섹션은 빼고, 앞 섹션과 내용이 같은 섹션은 참조로 대신함 (입력 토큰 절약)
+    blocks = []
+    seen = {}
+    for title, lines in PROMPT_SECTIONS:
+        body = "\n".join(
+            line.format(**fields) for line in lines
+            if not any(_is_empty(fields[key]) for key in re.findall(r"{(\w+)}", line))
+        )
+        if not body:
+            continue
+        previous_title = seen.setdefault(_normalize(body), title)
+        if previous_title != title:
+            body = f"(위 [{previous_title}] 와 같음)"
+        blocks.append(f"[{title}]\n{body}")
+    prompt = "\n\n".join(blocks).strip()
+    # 씬 구간을 로컬에서 계산해 두면 모델은 각 구간의 action / audio 만 작성하면 됨
+    segments = parse_timeline(fields["timeline_detail"])
+    if segments:
+        prompt += TIMELINE_STRUCTURE_TEMPLATE.format(
+            segments="\n".join(
+                f"- sequence {number}: {segment.timestamp}" for number, segment in enumerate(segments, start=1)
+            )
+        )
+    return prompt
+
+
+def build_messages(prompt: str, system_instruction: str = SYSTEM_INSTRUCTION) -> list:
+    # 프롬프트 캐싱(prefix cache)을 위해 고정된 system 블록을 항상 맨 앞에 그대로 두고,
+    # 입력마다 바뀌는 내용은 전부 user 턴에만 넣음
+    return [
+        {"role": "system", "content": system_instruction},
+        {"role": "user", "content": prompt},
+    ]
+
+
+# ==============================================================================
+# [3] 결과 텍스트에서 미드저니 프롬프트 구간 추출
+# ==============================================================================
+MJ_START_MARKERS = [
+    "2️⃣ 미드저니 사용 프롬프트",
+    "### 2️⃣ 미드저니 사용 프롬프트",
+    "미드저니 사용 프롬프트",
+]
+MJ_END_MARKERS = ["⚠️", "###", "1️⃣", "3️⃣"]
+
+
+def extract_midjourney(text: str) -> Optional[str]:
+    # 시작 마커가 없으면 None (스트리밍 중이라면 아직 해당 구간이 도착하지 않은 것)
+    start_index = -1
+    for marker in MJ_START_MARKERS:
+        if marker in text:
+            start_index = text.index(marker) + len(marker)
+            break
+
+    if start_index == -1:
+        return None
+
+    mj = text[start_index:].strip()
+
+    end_index = len(mj)
+    for end in MJ_END_MARKERS:
+        if end in mj:
+            pos = mj.index(end)
+            end_index = min(end_index, pos)
+
+    mj = mj[:end_index].strip()
+    mj = mj.replace("```", "").strip()
+
+    lines = mj.splitlines()
+    if len(lines) > 1:
+        first_line = lines[0]
+        if ("프롬프트" in first_line) or ("Prompt" in first_line):
+            mj = "\n".join(lines[1:]).strip()
+
+    return mj
+
+
+def extract_comfyui_json(text: str) -> Optional[dict]:
+    # 첫 번째 ```json 코드 블록을 파싱. 블록이 없거나 JSON 이 깨져 있으면 None
+    start = text.find("```json")
+    if start == -1:
+        return None
+    start += len("```json")
+    end = text.find("```", start)
+    if end == -1:
+        return None
+    try:
+        data = json.loads(text[start:end])
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def replace_comfyui_json(text: str, comfyui_json: dict) -> str:
+    # 첫 번째 ```json 코드 블록의 내용을 교체 (블록이 없으면 맨 앞에 새로 붙임)
+    block = f"```json\n{json.dumps(comfyui_json, ensure_ascii=False, indent=2)}\n```"
+    start = text.find("```json")
+    end = text.find("```", start + len("```json")) if start != -1 else -1
+    if end == -1:
+        return f"### 1️⃣ ComfyUI 사용 json 프롬프트\n{block}\n\n{text}"
+    return text[:start] + block + text[end + len("```"):]
+
+
+# ==============================================================================
+# [4] 구조화 출력 모드 (JSON 스키마 기반, 마커 스크래핑 대신 사용)
+# ==============================================================================
+class StructuredOutputError(ValueError):
+    pass
+
+
+def _extract_json_template(instruction: str) -> dict:
+    # SYSTEM_INSTRUCTION 안의 [JSON 템플릿] 블록을 그대로 파싱해서 스키마의 기준으로 사용
+    block = _section(instruction, "[JSON 템플릿]", "[ComfyUI 사용 json 프롬프트 중 누락 / none 부분 예시]")
+    return json.loads(block[block.index("{"):])
+
+
+def _schema_from_template(value) -> dict:
+    if isinstance(value, dict):
+        return {
+            "type": "object",
+            "properties": {key: _schema_from_template(item) for key, item in value.items()},
+            "required": list(value),
+            "additionalProperties": False,
+        }
+    if isinstance(value, list):
+        return {"type": "array", "items": _schema_from_template(value[0])}
+    if isinstance(value, bool):
+        return {"type": "boolean"}
+    if isinstance(value, int):
+        return {"type": "integer"}
+    return {"type": "string"}
+
+
+COMFYUI_JSON_TEMPLATE = _extract_json_template(SYSTEM_INSTRUCTION)
+
+STRUCTURED_OUTPUT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "comfyui_json": _schema_from_template(COMFYUI_JSON_TEMPLATE),
+        "comfyui_missing": {"type": "array", "items": {"type": "string"}},
+        "midjourney_prompt": {"type": "string"},
+        "midjourney_missing": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["comfyui_json", "comfyui_missing", "midjourney_prompt", "midjourney_missing"],
+    "additionalProperties": False,
+}
+
+STRUCTURED_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "comfyui_midjourney_prompt",
+        "strict": True,
+        "schema": STRUCTURED_OUTPUT_SCHEMA,
+    },
+}
+
+def _with_prose_timeline(comfyui_schema: dict) -> dict:
+    # timeline 항목에서 로컬에서 채울 sequence / timestamp 를 뺀 스키마 (모델은 action / audio 만 작성)
+    schema = copy.deepcopy(comfyui_schema)
+    item = schema["properties"]["timeline"]["items"]
+    item["properties"] = {key: item["properties"][key] for key in ("action", "audio")}
+    item["required"] = ["action", "audio"]
+    return schema
+
+
+STRUCTURED_PROSE_TIMELINE_SCHEMA = copy.deepcopy(STRUCTURED_OUTPUT_SCHEMA)
+STRUCTURED_PROSE_TIMELINE_SCHEMA["properties"]["comfyui_json"] = _with_prose_timeline(
+    STRUCTURED_OUTPUT_SCHEMA["properties"]["comfyui_json"]
+)
+
+STRUCTURED_PROSE_TIMELINE_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "comfyui_midjourney_prompt_prose_timeline",
+        "strict": True,
+        "schema": STRUCTURED_PROSE_TIMELINE_SCHEMA,
+    },
+}
+
+STRUCTURED_SYSTEM_INSTRUCTION = SYSTEM_INSTRUCTION + """
+[출력 양식 변경 – JSON 모드]
+- 위의 [출력 양식] 대신, 아래 4개의 key 를 가진 하나의 JSON 객체로만 응답하세요. 마크다운, 코드 블럭, 설명 문장은 쓰지 마세요.
+  - "comfyui_json" : [JSON 템플릿] 구조 그대로 채운 ComfyUI JSON 객체
+  - "comfyui_missing" : ComfyUI JSON 중 누락 / none 부분 설명 문자열 배열 (예: "character.appearance.eye_color : 눈 색상 정보 없음")
+  - "midjourney_prompt" : 미드저니 한 줄 영문 프롬프트 문자열
+  - "midjourney_missing" : 미드저니 프롬프트 중 부족하거나 빠진 요소 설명 문자열 배열
+"""
+
+
+def _validate(value, schema: dict, path: str, errors: list) -> None:
+    expected = schema["type"]
+    if expected == "object":
+        if not isinstance(value, dict):
+            errors.append(f"{path}: object 가 아님")
+            return
+        for key in schema["required"]:
+            if key not in value:
+                errors.append(f"{path}.{key}: 누락")
+        if not schema.get("additionalProperties", True):
+            for key in value:
+                if key not in schema["properties"]:
+                    errors.append(f"{path}.{key}: 템플릿에 없는 key")
+        for key, sub_schema in schema["properties"].items():
+            if key in value:
+                _validate(value[key], sub_schema, f"{path}.{key}", errors)
+    elif expected == "array":
+        if not isinstance(value, list):
+            errors.append(f"{path}: array 가 아님")
+            return
+        for i, item in enumerate(value):
+            _validate(item, schema["items"], f"{path}[{i}]", errors)
+    elif expected == "integer":
+        if not isinstance(value, int) or isinstance(value, bool):
+            errors.append(f"{path}: integer 가 아님")
+    elif expected == "boolean":
+        if not isinstance(value, bool):
+            errors.append(f"{path}: boolean 이 아님")
+    elif not isinstance(value, str):
+        errors.append(f"{path}: string 이 아님")
+
+
+def parse_structured_output(text: str, schema: dict = STRUCTURED_OUTPUT_SCHEMA) -> dict:
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise StructuredOutputError(f"JSON 파싱 실패: {e}") from e
+
+    errors = []
+    _validate(data, schema, "$", errors)
+    if errors:
+        raise StructuredOutputError("스키마 검증 실패: " + "; ".join(errors[:10]))
+    return data
+
+
+def schema_errors(value, schema: dict, path: str = "$") -> list:
+    # 예외 대신 위반 목록을 돌려주는 검증 (출력 검증기에서 규칙 검사와 함께 사용)
+    errors = []
+    _validate(value, schema, path, errors)
+    return errors
+
+
+def structured_response_format(brief: dict) -> dict:
+    # 타임라인 구간을 로컬에서 계산할 수 있으면 sequence / timestamp 를 출력에서 제외 (출력 토큰 절약)
+    timeline_detail = {**DEFAULT_BRIEF, **brief}["timeline_detail"]
+    if parse_timeline(timeline_detail):
+        return STRUCTURED_PROSE_TIMELINE_RESPONSE_FORMAT
+    return STRUCTURED_RESPONSE_FORMAT
+
+
+def apply_timeline(comfyui_json: dict, brief: dict) -> dict:
+    # 로컬에서 계산한 sequence / timestamp 로 timeline 을 채움 (모델이 쓴 값은 무시)
+    segments = parse_timeline({**DEFAULT_BRIEF, **brief}["timeline_detail"])
+    if segments and isinstance(comfyui_json.get("timeline"), list):
+        comfyui_json = {**comfyui_json, "timeline": fill_timeline(segments, comfyui_json["timeline"])}
+    return comfyui_json
+
+
+def structured_to_markdown(data: dict) -> str:
+    # 기존 마크다운 모드와 같은 순서/제목으로 보여주기 위한 변환
+    comfyui_missing = "\n".join(f"- {item}" for item in data["comfyui_missing"]) or "- 없음"
+    midjourney_missing = "\n".join(f"- {item}" for item in data["midjourney_missing"]) or "- 없음"
+    comfyui_json = json.dumps(data["comfyui_json"], ensure_ascii=False, indent=2)
+    return (
+        "### 1️⃣ ComfyUI 사용 json 프롬프트\n"
+        f"```json\n{comfyui_json}\n```\n\n"
+        "### ⚠️ ComfyUI 사용 json 프롬프트 중 누락 / none 부분\n"
+        f"{comfyui_missing}\n\n"
+        "### 2️⃣ 미드저니 사용 프롬프트\n"
+        f"{data['midjourney_prompt']}\n\n"
+        "### ⚠️ 미드저니 사용 프롬프트 중 누락부분\n"
+        f"{midjourney_missing}"
+    )
+
+
+# ==============================================================================
+# [5] 부분 재생성 모드 (바뀐 입력 필드에 해당하는 JSON 섹션만 다시 생성해서 병합)
+# ==============================================================================
+# 입력 필드 → 영향을 받는 ComfyUI JSON 최상위 섹션
+FIELD_SECTIONS = {
+    "brand": ("topic_and_content",),
+    "aspect": ("aspect_ratio",),
+    "duration": ("timeline",),
+    "prompt_name": (),
+    "subject": ("topic_and_content", "character"),
+    "character_detail": ("character",),
+    "action": ("action", "timeline"),
+    "emotion": ("character", "style"),
+    "background": ("background",),
+    "lighting": ("background", "style"),
+    # 씬별 카메라 움직임 / 샷 구성은 timeline[*].action 에 들어감 (조건 1)
+    "camera_move": ("camera_work", "timeline"),
+    "style": ("style",),
+    "composition": ("camera_work", "timeline"),
+    "audio_bgm": ("audio", "timeline"),
+    "audio_sfx": ("audio", "timeline"),
+    "audio_voice": ("audio", "timeline"),
+    "timeline_overview": ("timeline",),
+    "timeline_detail": ("timeline",),
+    # 자유 메모는 어느 섹션에 반영될지 알 수 없으므로 전체 재생성
+    "extra": None,
+}
+
+# 미드저니(정지 이미지) 프롬프트에 반영되는 필드. 오디오 / 타임라인만 바뀌면 이전 프롬프트 유지
+MIDJOURNEY_FIELDS = frozenset({
+    "aspect", "subject", "character_detail", "action", "emotion",
+    "background", "lighting", "camera_move", "style", "composition",
+})
+
+# 섹션이 이 비율 이상 바뀌면 부분 재생성 대신 전체 재생성이 더 단순하고 일관됨
+PATCH_MAX_SECTION_RATIO = 0.6
+
+
+def changed_fields(previous: dict, current: dict) -> list:
+    # 앞뒤 공백만 다른 값은 같은 것으로 봄
+    return [
+        key for key in FORM_FIELDS
+        if str(previous.get(key, "")).strip() != str(current.get(key, "")).strip()
+    ]
+
+
+def sections_to_regenerate(fields: list) -> Optional[list]:
+    # 다시 만들 섹션 목록 (JSON 템플릿 순서). 전체 재생성이 필요하면 None
+    sections = set()
+    for key in fields:
+        if FIELD_SECTIONS.get(key) is None:
+            return None
+        sections.update(FIELD_SECTIONS[key])
+    if len(sections) > len(COMFYUI_JSON_TEMPLATE) * PATCH_MAX_SECTION_RATIO:
+        return None
+    return [key for key in COMFYUI_JSON_TEMPLATE if key in sections]
+
+
+def patch_response_format(sections: list, include_midjourney: bool, prose_timeline: bool = False) -> dict:
+    comfyui_schema = STRUCTURED_OUTPUT_SCHEMA["properties"]["comfyui_json"]
+    if prose_timeline:
+        comfyui_schema = STRUCTURED_PROSE_TIMELINE_SCHEMA["properties"]["comfyui_json"]
+    properties = {key: comfyui_schema["properties"][key] for key in sections}
+    if include_midjourney:
+        properties["midjourney_prompt"] = {"type": "string"}
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "comfyui_section_patch",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": properties,
+                "required": list(properties),
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+# 시스템 지시문은 모든 부분 재생성 요청에서 동일하게 유지 (프롬프트 캐싱), 요청별 내용은 user 턴에
+PATCH_SYSTEM_INSTRUCTION = SYSTEM_INSTRUCTION + """
+[출력 양식 변경 – 부분 재생성 모드]
+- 이전에 생성한 ComfyUI JSON 과 수정된 입력이 함께 주어집니다.
+- 위의 [출력 양식] 대신, 요청된 섹션 key (와 요청된 경우 "midjourney_prompt") 만 가진 하나의 JSON 객체로만 응답하세요.
+- 각 섹션은 [JSON 템플릿] 의 해당 부분 구조를 그대로 따르고, 수정된 입력을 반영해 새로 작성하세요.
+- 요청되지 않은 섹션은 출력하지 마세요. 이전 JSON 의 나머지 섹션과 내용이 어긋나지 않게 작성하세요.
+"""
+
+PATCH_PROMPT_TEMPLATE = """
+[수정된 입력 전체]
+{combined_prompt}
+
+[변경된 입력 항목]
+{changed}
+
+[이전에 생성한 ComfyUI JSON]
+{previous_json}
+
+[다시 작성할 섹션]
+{sections}
+"""
+
+
+def build_patch_prompt(
+    brief: dict,
+    previous_json: dict,
+    fields: list,
+    sections: list,
+    include_midjourney: bool,
+    previous_midjourney: Optional[str] = None,
+) -> str:
+    prompt = PATCH_PROMPT_TEMPLATE.format(
+        combined_prompt=build_combined_prompt(brief),
+        changed=", ".join(fields),
+        previous_json=json.dumps(previous_json, ensure_ascii=False, indent=2),
+        sections=", ".join(sections),
+    ).strip()
+    if include_midjourney:
+        if previous_midjourney:
+            prompt += f"\n\n[이전 미드저니 프롬프트]\n{previous_midjourney}"
+        prompt += "\n\n변경된 입력을 반영해 \"midjourney_prompt\" 도 다시 작성하세요."
+    return prompt
+
+
+def parse_patch_output(text: str, response_format: dict) -> dict:
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise StructuredOutputError(f"JSON 파싱 실패: {e}") from e
+
+    errors = []
+    _validate(data, response_format["json_schema"]["schema"], "$", errors)
+    if errors:
+        raise StructuredOutputError("스키마 검증 실패: " + "; ".join(errors[:10]))
+    return data
+
+
+def merge_patch(previous_json: dict, patch: dict) -> dict:
+    # 기존 key 순서를 유지한 채 다시 생성된 섹션만 교체 (midjourney_prompt 는 JSON 에 넣지 않음)
+    return {**previous_json, **{key: value for key, value in patch.items() if key in COMFYUI_JSON_TEMPLATE}}
+
+
+def patched_to_markdown(comfyui_json: dict, midjourney_prompt: str, sections: list) -> str:
+    return (
+        "### 1️⃣ ComfyUI 사용 json 프롬프트\n"
+        f"```json\n{json.dumps(comfyui_json, ensure_ascii=False, indent=2)}\n```\n\n"
+        "### ♻️ 부분 재생성된 섹션\n"
+        + ("\n".join(f"- {key}" for key in sections) or "- 없음")
+        + "\n\n### 2️⃣ 미드저니 사용 프롬프트\n"
+        f"{midjourney_prompt}"
+    )
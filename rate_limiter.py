@@ -0,0 +1,361 @@
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from usage_stats import percentile
+
+# ==============================================================================
+# 프로세스 전체 API 호출 스케줄러 (모든 세션이 공유)
+#   - 토큰 버킷 두 개(분당 요청 수 / 분당 토큰 수)와 동시 실행 수 상한. 한도는 응답의
+#     x-ratelimit-* 헤더로 맞추고, 헤더를 받기 전에는 설정값(없으면 무제한)을 씀
+#   - 대기열은 우선순위(대화형 > 배치) → 같은 우선순위 안에서는 세션(key)별 라운드 로빈.
+#     한 세션이 요청을 몰아서 보내도 다른 세션의 요청이 사이사이 먼저 나감
+#   - 429 를 받으면 retry-after 만큼 모든 호출을 멈추고, run() / open() 은 같은 자리에서 다시 시도.
+#     5xx / 연결 오류 / 타임아웃은 그 호출만 지수 백오프 후 다시 시도.
+#     재시도는 여기서만 함 (스케줄러를 거치는 클라이언트는 SDK 재시도를 끔)
+# ==============================================================================
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "대화형", PRIORITY_BATCH: "배치"}
+
+# retry-after 가 없을 때 429 후 쉬는 시간 (초)
+DEFAULT_RETRY_AFTER = 2.0
+MAX_RETRY_AFTER = 60.0
+# 5xx / 연결 오류 후 첫 재시도 대기 (초, 시도마다 두 배 + 지터)
+TRANSIENT_RETRY_BASE = 1.0
+# 대기 중 취소 확인 / 진행 상황 알림 간격 (초)
+WAIT_POLL_SECONDS = 0.5
+# 호출당 최대 시도 횟수 (SDK 기본 재시도 3회와 같은 수준)
+DEFAULT_MAX_ATTEMPTS = 4
+
+
+def retry_after_seconds(error: Optional[BaseException]) -> Optional[float]:
+    # 429 오류 응답의 retry-after(-ms) 헤더. 429 가 아니면 None (라우터처럼 감싼 오류는 원인을 따라감)
+    while error is not None and getattr(error, "status_code", None) != 429:
+        error = error.__cause__
+    if error is None:
+        return None
+    response = getattr(error, "response", None)
+    return _header_retry_after(getattr(response, "headers", None) or {})
+
+
+def transient_retry_delay(error: Optional[BaseException], attempt: int) -> Optional[float]:
+    # 5xx 응답 / 연결 오류 / 타임아웃이면 attempt 번째 시도 후 기다릴 시간, 아니면 None
+    while error is not None and not _is_transient(error):
+        error = error.__cause__
+    if error is None:
+        return None
+    delay = min(TRANSIENT_RETRY_BASE * 2 ** (attempt - 1), MAX_RETRY_AFTER)
+    return delay * (0.5 + random.random() / 2)
+
+
+def _is_transient(error: BaseException) -> bool:
+    status_code = getattr(error, "status_code", None)
+    if isinstance(status_code, int):
+        return status_code >= 500
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # openai SDK 는 import 비용이 커서 오류가 난 뒤에만 불러옴 (APITimeoutError 는 APIConnectionError 의 하위 클래스)
+    try:
+        from openai import APIConnectionError
+    except ImportError:
+        return False
+    return isinstance(error, APIConnectionError)
+
+
+def _header_retry_after(headers) -> float:
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return min(float(headers["retry-after-ms"]) / 1000, MAX_RETRY_AFTER)
+        if headers.get("retry-after") is not None:
+            return min(float(headers["retry-after"]), MAX_RETRY_AFTER)
+    except ValueError:
+        pass
+    return DEFAULT_RETRY_AFTER
+
+
+class TokenBucket:
+    # 분당 limit 만큼 일정하게 채워지는 버킷. limit 이 None 이면 무제한
+    def __init__(self, limit_per_minute: Optional[float] = None):
+        self.limit: Optional[float] = None
+        self.level = 0.0
+        self._updated = time.monotonic()
+        self.resize(limit_per_minute)
+
+    def _refill(self, now: float) -> None:
+        if self.limit is not None:
+            self.level = min(self.limit, self.level + (now - self._updated) * self.limit / 60.0)
+        self._updated = now
+
+    def resize(self, limit_per_minute: Optional[float]) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        if limit_per_minute is None or limit_per_minute <= 0:
+            self.limit = None
+        elif self.limit is None:
+            # 처음 한도를 알게 된 시점에는 가득 찬 상태에서 시작
+            self.limit = float(limit_per_minute)
+            self.level = self.limit
+        else:
+            self.limit = float(limit_per_minute)
+            self.level = min(self.level, self.limit)
+
+    def sync(self, remaining: float) -> None:
+        # 서버가 알려준 남은 양이 더 적으면 그쪽을 따름 (다른 프로세스 / 배치 CLI 가 같은 키를 쓰는 경우)
+        self._refill(time.monotonic())
+        if self.limit is not None:
+            self.level = min(self.level, float(remaining))
+
+    def delay(self, amount: float, now: float) -> float:
+        # amount 를 꺼낼 수 있을 때까지 남은 시간 (한도보다 큰 요청은 가득 찼을 때 보냄)
+        self._refill(now)
+        if self.limit is None:
+            return 0.0
+        amount = min(amount, self.limit)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60.0 / self.limit
+
+    def take(self, amount: float) -> None:
+        if self.limit is not None:
+            self.level -= min(amount, self.limit)
+
+
+@dataclass(frozen=True)
+class Lane:
+    # 대기열 자리: key(세션 등) 별로 공정하게 돌아가며 처리
+    key: str
+    priority: int = PRIORITY_INTERACTIVE
+    # 대기 중 주기적으로 호출 (취소되었으면 예외를 던져서 대기열에서 빠짐)
+    check_cancelled: Optional[Callable[[], None]] = None
+    # 대기 중 주기적으로 대기 순번(1부터)을 알림. 차례가 와서 시작하면 0
+    on_wait: Optional[Callable[[int], None]] = None
+
+
+class _Waiter:
+    def __init__(self, lane: Lane, tokens: int):
+        self.lane = lane
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+
+
+class _Lease:
+    def __init__(self, scheduler: "RateLimitScheduler"):
+        self._scheduler = scheduler
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._scheduler._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class RateLimitScheduler:
+    def __init__(
+        self,
+        max_concurrent: int = 8,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        window: int = 200,
+    ):
+        self.max_concurrent = max_concurrent
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.started = 0
+        self.throttled = 0
+        self.retried = 0
+        self._queues = {}  # priority -> OrderedDict(key -> deque[_Waiter]), key 순서가 라운드 로빈 순서
+        self._waits = deque(maxlen=window)  # (대기 시간, 우선순위)
+        self._condition = threading.Condition()
+
+    # ---------------------------------------------------------------- 한도 갱신
+    def update_from_headers(self, headers, status_code: int = 200) -> None:
+        # OpenAI 응답 헤더: x-ratelimit-limit-{requests,tokens}, x-ratelimit-remaining-{requests,tokens}.
+        # 429 면 retry-after 동안 전체를 멈춤
+        with self._condition:
+            if status_code == 429:
+                self.throttled += 1
+                self._pause(_header_retry_after(headers))
+            for bucket, name in ((self.requests, "requests"), (self.tokens, "tokens")):
+                limit = headers.get(f"x-ratelimit-limit-{name}")
+                remaining = headers.get(f"x-ratelimit-remaining-{name}")
+                try:
+                    if limit is not None and float(limit) != bucket.limit:
+                        bucket.resize(float(limit))
+                    if remaining is not None:
+                        bucket.sync(float(remaining))
+                except ValueError:
+                    continue
+            self._condition.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        # seconds 동안 새 호출을 시작하지 않음 (이미 실행 중인 호출은 그대로)
+        with self._condition:
+            self._pause(seconds)
+            self._condition.notify_all()
+
+    def _pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    # ---------------------------------------------------------------- 대기열
+    def _head(self) -> Optional[_Waiter]:
+        for priority in sorted(self._queues):
+            lanes = self._queues[priority]
+            if lanes:
+                return next(iter(lanes.values()))[0]
+        return None
+
+    def _ahead_of(self, waiter: _Waiter) -> int:
+        # 대략적인 대기 순번: 더 높은 우선순위 전체 + 같은 우선순위에서 먼저 온 요청
+        ahead = 0
+        for priority, lanes in self._queues.items():
+            for waiters in lanes.values():
+                if priority < waiter.lane.priority:
+                    ahead += len(waiters)
+                elif priority == waiter.lane.priority:
+                    ahead += sum(other.enqueued_at < waiter.enqueued_at for other in waiters)
+        return ahead
+
+    def _remove(self, waiter: _Waiter, served: bool) -> None:
+        lanes = self._queues[waiter.lane.priority]
+        waiters = lanes[waiter.lane.key]
+        waiters.remove(waiter)
+        if not waiters:
+            del lanes[waiter.lane.key]
+        elif served:
+            # 처리된 key 는 맨 뒤로 (라운드 로빈)
+            lanes.move_to_end(waiter.lane.key)
+
+    def _delay(self, tokens: int, now: float) -> float:
+        return max(self.paused_until - now, self.requests.delay(1, now), self.tokens.delay(tokens, now))
+
+    def acquire(self, lane: Lane, tokens: int) -> _Lease:
+        # 차례가 오고 한도 / 동시 실행 수에 여유가 생길 때까지 기다림. 반환된 lease 를 release 해야 슬롯이 풀림
+        waiter = _Waiter(lane, tokens)
+        with self._condition:
+            self._queues.setdefault(lane.priority, OrderedDict()).setdefault(lane.key, deque()).append(waiter)
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = WAIT_POLL_SECONDS
+                    if self._head() is waiter and self.in_flight < self.max_concurrent:
+                        delay = self._delay(tokens, now)
+                        if delay <= 0:
+                            break
+                    if lane.check_cancelled is not None:
+                        lane.check_cancelled()
+                    if lane.on_wait is not None:
+                        lane.on_wait(self._ahead_of(waiter) + 1)
+                    self._condition.wait(min(delay, WAIT_POLL_SECONDS))
+            except BaseException:
+                self._remove(waiter, served=False)
+                self._condition.notify_all()
+                raise
+
+            self._remove(waiter, served=True)
+            self._start(tokens, time.monotonic() - waiter.enqueued_at, lane.priority)
+        if lane.on_wait is not None:
+            lane.on_wait(0)
+        return _Lease(self)
+
+    def try_acquire(self, lane: Lane, tokens: int) -> Optional[_Lease]:
+        # 기다리지 않고 바로 시작할 수 있을 때만 lease 를 반환 (헤지 요청 등 보내지 않아도 되는 호출용).
+        # 대기 중인 요청이 있으면 새치기하지 않고 None
+        with self._condition:
+            if (
+                self._head() is not None
+                or self.in_flight >= self.max_concurrent
+                or self._delay(tokens, time.monotonic()) > 0
+            ):
+                return None
+            self._start(tokens, 0.0, lane.priority)
+        return _Lease(self)
+
+    def _start(self, tokens: int, waited: float, priority: int) -> None:
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.in_flight += 1
+        self.started += 1
+        self._waits.append((waited, priority))
+        self._condition.notify_all()
+
+    def _release(self) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def open(self, lane: Lane, tokens: int, fn: Callable, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> tuple:
+        # fn() 을 스케줄러 슬롯 안에서 실행. 429 로 끝나면 retry-after 만큼 전체를 멈추고, 5xx / 연결 오류면
+        # 슬롯을 놓고 이 호출만 백오프한 뒤 대기열에 다시 섬.
+        # 성공하면 슬롯을 쥔 채로 (lease, 결과) 를 반환 (스트림처럼 결과를 다 읽을 때까지 슬롯을 잡는 호출용)
+        for attempt in range(1, max_attempts + 1):
+            lease = self.acquire(lane, tokens)
+            try:
+                return lease, fn()
+            except BaseException as e:
+                lease.release()
+                retry_after = retry_after_seconds(e)
+                backoff = transient_retry_delay(e, attempt) if retry_after is None else None
+                if (retry_after is None and backoff is None) or attempt == max_attempts:
+                    raise
+            with self._condition:
+                self.retried += 1
+            if retry_after is not None:
+                self.pause(retry_after)
+            else:
+                self._backoff(lane, backoff)
+
+    def _backoff(self, lane: Lane, seconds: float) -> None:
+        # 이 호출만 기다림 (다른 호출은 계속 진행). 기다리는 중에도 취소 확인
+        deadline = time.monotonic() + seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if lane.check_cancelled is not None:
+                lane.check_cancelled()
+            time.sleep(min(remaining, WAIT_POLL_SECONDS))
+
+    def run(self, lane: Lane, tokens: int, fn: Callable, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        lease, result = self.open(lane, tokens, fn, max_attempts)
+        lease.release()
+        return result
+
+    # ---------------------------------------------------------------- 통계
+    def stats(self) -> dict:
+        with self._condition:
+            now = time.monotonic()
+            queued = {
+                priority: sum(len(waiters) for waiters in lanes.values())
+                for priority, lanes in self._queues.items()
+            }
+            keys = sum(len(lanes) for lanes in self._queues.values())
+            waits = list(self._waits)
+            return {
+                "in_flight": self.in_flight,
+                "max_concurrent": self.max_concurrent,
+                "queued": sum(queued.values()),
+                "queued_by_priority": {PRIORITY_NAMES.get(p, str(p)): n for p, n in sorted(queued.items()) if n},
+                "queued_keys": keys,
+                "started": self.started,
+                "throttled": self.throttled,
+                "retried": self.retried,
+                "paused_for": max(0.0, self.paused_until - now),
+                "wait_p50": percentile([w for w, _ in waits], 0.50),
+                "wait_p95": percentile([w for w, _ in waits], 0.95),
+                "requests_limit": self.requests.limit,
+                "tokens_limit": self.tokens.limit,
+                "requests_available": self.requests.level if self.requests.limit is not None else None,
+                "tokens_available": self.tokens.level if self.tokens.limit is not None else None,
+            }
@@ -0,0 +1,292 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, deque
+from typing import Optional
+
+
+# ==============================================================================
+# 응답 캐시 키: (모델, temperature, 시스템 지시문, 사용자 프롬프트) 의 해시
+# ==============================================================================
+def make_cache_key(model: str, temperature: float, system_instruction: str, prompt: str) -> str:
+    payload = json.dumps(
+        [model, temperature, system_instruction, prompt],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ==============================================================================
+# 브리프 정규화: 사소한 차이(공백, 유니코드 조합형, 브랜드 대소문자, 프롬프트 이름)는 같은 키로
+# ==============================================================================
+# 결과에 영향을 주지 않는 구분용 필드
+COSMETIC_FIELDS = frozenset({"prompt_name"})
+# 대소문자만 다른 경우 같은 값으로 보는 필드
+CASE_INSENSITIVE_FIELDS = frozenset({"brand"})
+
+_INLINE_SPACE = re.compile(r"[ \t\u00a0\u3000]+")
+
+
+def normalize_text(value) -> str:
+    text = unicodedata.normalize("NFC", str(value))
+    lines = (_INLINE_SPACE.sub(" ", line).strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def _normalized_fields(brief: dict) -> dict:
+    fields = {}
+    for key in sorted(brief):
+        if key in COSMETIC_FIELDS:
+            continue
+        value = normalize_text(brief[key])
+        if key in CASE_INSENSITIVE_FIELDS:
+            value = value.casefold()
+        fields[key] = value
+    return fields
+
+
+def canonical_brief(brief: dict) -> str:
+    # 캐시 키 계산용: 필드 순서 고정 + 정규화된 값
+    return json.dumps(_normalized_fields(brief), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def similarity_text(brief: dict) -> str:
+    # 유사도 인덱스용: key 이름처럼 모든 브리프에 공통인 부분은 빼고 값만 이어 붙임
+    return "\n".join(_normalized_fields(brief).values())
+
+
+# ==============================================================================
+# SQLite 기반 응답 캐시 (LRU 개수 제한 + TTL 만료)
+# ==============================================================================
+class ResponseCache:
+    def __init__(self, path: str, max_entries: int = 500, ttl_seconds: float = 7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Streamlit 은 세션마다 다른 스레드에서 스크립트를 실행하므로 락으로 보호
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)"
+        )
+        # 유사도 인덱스를 재시작 후에도 복원할 수 있도록 정규화된 브리프 텍스트를 함께 보관
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS prompts (
+                key TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                text TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, key: str, record_stats: bool = True) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += record_stats
+                return None
+
+            value, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += record_stats
+                return None
+
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += record_stats
+            return value
+
+    def set(self, key: str, value: str, text: Optional[str] = None, namespace: str = "") -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            if text is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO prompts (key, namespace, text) VALUES (?, ?, ?)",
+                    (key, namespace, text),
+                )
+            self._evict(now)
+            self._conn.commit()
+
+    def cached_keys(self, keys: list) -> set:
+        # 목록 표시용: 통계 / LRU 순서를 건드리지 않고 만료되지 않은 key 만 한 번에 확인
+        if not keys:
+            return set()
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key FROM responses WHERE key IN ({placeholders}) AND created_at >= ?",
+                (*keys, time.time() - self.ttl_seconds),
+            ).fetchall()
+        return {key for key, in rows}
+
+    def load_prompts(self) -> list:
+        # [(key, namespace, text), ...] 오래된 것부터
+        with self._lock:
+            return self._conn.execute(
+                "SELECT p.key, p.namespace, p.text FROM prompts p "
+                "JOIN responses r ON r.key = p.key ORDER BY r.last_access"
+            ).fetchall()
+
+    def _evict(self, now: float) -> None:
+        # 1) TTL 이 지난 항목 삭제
+        self._conn.execute(
+            "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+        )
+        # 2) 최근 사용 순으로 max_entries 개만 남기고 나머지 삭제 (LRU)
+        self._conn.execute(
+            """
+            DELETE FROM responses WHERE key IN (
+                SELECT key FROM responses
+                ORDER BY last_access DESC
+                LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_entries,),
+        )
+        self._conn.execute("DELETE FROM prompts WHERE key NOT IN (SELECT key FROM responses)")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.execute("DELETE FROM prompts")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "entries": len(self),
+        }
+
+
+# ==============================================================================
+# 유사 브리프 인덱스 (문자 n-gram 집합의 Jaccard 유사도)
+# ==============================================================================
+def _shingles(text: str, n: int) -> frozenset:
+    if len(text) <= n:
+        return frozenset([text])
+    return frozenset(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+def dedupe_similar(texts: list, threshold: float, ngram: int = 3) -> list:
+    # 앞에서부터 보면서, 이미 남긴 텍스트와 유사도가 임계값 이상인 텍스트는 버림 (남긴 인덱스 목록 반환)
+    kept, kept_shingles = [], []
+    for index, text in enumerate(texts):
+        shingles = _shingles(normalize_text(text), ngram)
+        if any(
+            len(shingles & other) / len(shingles | other) >= threshold
+            for other in kept_shingles
+        ):
+            continue
+        kept.append(index)
+        kept_shingles.append(shingles)
+    return kept
+
+
+class SimilarityIndex:
+    def __init__(self, ngram: int = 3, max_entries: int = 5000, score_history: int = 500):
+        self.ngram = ngram
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # 조회마다 가장 높았던 유사도를 남겨 두고 임계값 튜닝에 사용
+        self.scores = deque(maxlen=score_history)
+        self._entries = OrderedDict()  # (namespace, key) -> (shingles, len(shingles))
+        self._lock = threading.Lock()
+
+    def add(self, key: str, text: str, namespace: str = "") -> None:
+        with self._lock:
+            shingles = _shingles(text, self.ngram)
+            self._entries[(namespace, key)] = (shingles, len(shingles))
+            self._entries.move_to_end((namespace, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def lookup(self, text: str, threshold: float, namespace: str = "") -> Optional[tuple]:
+        # 임계값 이상인 가장 비슷한 항목의 (key, score), 없으면 None
+        query = _shingles(text, self.ngram)
+        query_size = len(query)
+        best_key, best_score = None, 0.0
+        with self._lock:
+            for (entry_namespace, key), (shingles, size) in self._entries.items():
+                if entry_namespace != namespace:
+                    continue
+                overlap = len(query & shingles)
+                score = overlap / (query_size + size - overlap)
+                if score > best_score:
+                    best_key, best_score = key, score
+
+            self.scores.append(best_score)
+            if best_key is not None and best_score >= threshold:
+                self.hits += 1
+                return best_key, best_score
+            self.misses += 1
+            return None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        buckets = {"≥0.95": 0, "0.90–0.95": 0, "0.80–0.90": 0, "<0.80": 0}
+        for score in self.scores:
+            if score >= 0.95:
+                buckets["≥0.95"] += 1
+            elif score >= 0.90:
+                buckets["0.90–0.95"] += 1
+            elif score >= 0.80:
+                buckets["0.80–0.90"] += 1
+            else:
+                buckets["<0.80"] += 1
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "entries": len(self),
+            "score_buckets": buckets,
+        }
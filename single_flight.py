@@ -0,0 +1,148 @@
+import threading
+from typing import Callable, Iterator
+
+# ==============================================================================
+# 동시에 들어온 같은 요청을 하나의 API 호출로 합치기 (프로세스 전체, 세션 간 공유)
+#   - do()     : 먼저 온 호출(대표)이 직접 실행하고, 같은 key 로 기다리던 호출은 같은 결과를 받음
+#   - stream() : 스트림은 백그라운드 스레드가 끝까지 읽어 버퍼에 쌓고, 모든 호출자가 처음부터 재생
+#                (대표 세션이 중간에 재실행/이탈해도 합류한 세션의 스트림은 끊기지 않음).
+#                받는 쪽이 모두 떠나면(취소) 다음 청크에서 업스트림 스트림을 닫음 (슬롯 / 토큰 낭비 방지)
+# ==============================================================================
+
+
+class _Call:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.chunks = []
+        self.done = False
+        self.result = None
+        self.error = None
+        # 결과를 기다리는 호출 수 (_lock 안에서 갱신). 스트림을 받는 쪽이 0 이 되면 abandoned
+        self.subscribers = 0
+        self.abandoned = False
+
+    def finish(self, result=None, error=None) -> None:
+        with self.condition:
+            self.result = result
+            self.error = error
+            self.done = True
+            self.condition.notify_all()
+
+    def wait(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.done)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def replay(self) -> Iterator[str]:
+        index = 0
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.done or index < len(self.chunks))
+                chunks = self.chunks[index:]
+                done = self.done
+            index += len(chunks)
+            yield from chunks
+            if done and index >= len(self.chunks):
+                break
+        if self.error is not None:
+            raise self.error
+        if not self.chunks and self.result:
+            # 같은 key 의 비스트리밍 호출(do)에 합류한 경우: 완성된 결과를 한 번에 전달
+            yield self.result
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _join(self, key: str) -> tuple:
+        # (call, 대표 여부)
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+            call.subscribers += 1
+            return call, leader
+
+    def _leave(self, key: str, call: _Call) -> None:
+        # 스트림을 끝까지 받지 않고 떠남. 남은 호출이 없으면 업스트림을 멈추도록 표시 (새 호출은 새로 시작)
+        with self._lock:
+            call.subscribers -= 1
+            if call.subscribers == 0 and not call.done:
+                call.abandoned = True
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+
+    def _forget(self, key: str, call: _Call) -> None:
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def do(self, key: str, fn: Callable) -> tuple:
+        # (결과, 다른 호출의 결과를 공유받았는지 여부)
+        # 대표는 fn 이 끝날 때까지 자리를 지키므로 subscribers 를 줄이지 않음 (스트림 합류자가 떠나도 abandoned 가 되지 않음)
+        call, leader = self._join(key)
+        if not leader:
+            try:
+                return call.wait(), True
+            finally:
+                self._leave(key, call)
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._forget(key, call)
+            call.finish(error=e)
+            raise
+        self._forget(key, call)
+        call.finish(result=result)
+        return result, False
+
+    def stream(self, key: str, fn: Callable) -> tuple:
+        # (청크 이터레이터, 공유 여부). fn 은 청크 이터레이터를 돌려주는 함수
+        # 다 받기 전에 그만둘 때는 이터레이터를 close() 해야 업스트림이 멈춤
+        call, leader = self._join(key)
+        if leader:
+            threading.Thread(target=self._pump, args=(key, call, fn), daemon=True).start()
+        return self._replay(key, call), not leader
+
+    def _replay(self, key: str, call: _Call) -> Iterator[str]:
+        try:
+            yield from call.replay()
+        finally:
+            self._leave(key, call)
+
+    def _pump(self, key: str, call: _Call, fn: Callable) -> None:
+        try:
+            chunks = fn()
+            for chunk in chunks:
+                if call.abandoned:
+                    # 받는 쪽이 모두 떠남: 업스트림을 닫고 (fn 쪽에서 연결 / 슬롯 정리) 중단
+                    close = getattr(chunks, "close", None)
+                    if close is not None:
+                        close()
+                    break
+                with call.condition:
+                    call.chunks.append(chunk)
+                    call.condition.notify_all()
+        except Exception as e:
+            self._forget(key, call)
+            call.finish(error=e)
+            return
+        self._forget(key, call)
+        call.finish(result="".join(call.chunks))
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> dict:
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self)}
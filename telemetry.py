@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from usage_stats import percentile
+
+# ==============================================================================
+# 생성 단계별 계측 (프롬프트 조립 → 클라이언트 준비 → 캐시 조회 → API 대기 / 첫 토큰 → 추출 → 검증 / 수리 → 렌더링)
+#   - Trace     : 생성 한 번의 단계별 소요 시간 + 카운터. 끝나면 JSON 한 줄로 로그 출력
+#   - Telemetry : 최근 N건 보관(p50/p95 요약) + 누적 히스토그램 / 카운터를 Prometheus 텍스트 형식으로 내보냄
+#                 (파일에 쓰거나, 작은 HTTP 서버로 /metrics 제공)
+# ==============================================================================
+logger = logging.getLogger("prompt_generator.telemetry")
+
+# 표시 순서 (여기에 없는 단계는 뒤에 붙음)
+PHASES = ("prompt", "client", "cache", "ttft", "api", "extract", "validate", "repair", "history", "render")
+
+# 초 단위 히스토그램 경계
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def phase_sort_key(name: str) -> tuple:
+    order = PHASES + ("total",)
+    return (order.index(name) if name in order else len(PHASES), name)
+
+
+def format_duration(seconds: float) -> str:
+    if seconds < 0.01:
+        return f"{seconds * 1000:.1f}ms"
+    return f"{seconds * 1000:.0f}ms" if seconds < 1 else f"{seconds:.2f}s"
+
+
+class Trace:
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.started_at = time.time()
+        self.phases = {}
+        self.counters = {}
+        self.outcome = "ok"
+        self.total: Optional[float] = None
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        # 같은 단계가 여러 번이면 합산 (분리 병렬 모드의 두 요청 등)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def count(self, name: str, value: int = 1) -> None:
+        if value:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self, outcome: str = "ok") -> None:
+        self.outcome = outcome
+        self.total = time.perf_counter() - self._start
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "outcome": self.outcome,
+            "started_at": self.started_at,
+            "total": self.total,
+            "phases": self.phases,
+            "counters": self.counters,
+        }
+
+
+class _Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.sum += seconds
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+
+
+class Telemetry:
+    def __init__(self, recent: int = 50, metrics_path: Optional[str] = None):
+        self.metrics_path = metrics_path
+        self._recent = deque(maxlen=recent)
+        self._histograms = {}  # phase -> _Histogram ("total" 포함)
+        self._generations = {}  # (kind, outcome) -> count
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def record(self, trace: Trace) -> None:
+        if trace.total is None:
+            trace.finish()
+        with self._lock:
+            self._recent.append(trace)
+            for name, seconds in [*trace.phases.items(), ("total", trace.total)]:
+                self._histograms.setdefault(name, _Histogram()).observe(seconds)
+            key = (trace.kind, trace.outcome)
+            self._generations[key] = self._generations.get(key, 0) + 1
+            for name, value in trace.counters.items():
+                self._counters[name] = self._counters.get(name, 0) + value
+        logger.info(json.dumps({"event": "generation", **trace.to_dict()}, ensure_ascii=False))
+        self._write_metrics()
+
+    def observe(self, trace: Trace, name: str, seconds: float) -> None:
+        # 워커에서 기록이 끝난 뒤 측정되는 단계 (화면 렌더링 등)
+        with self._lock:
+            trace.add(name, seconds)
+            self._histograms.setdefault(name, _Histogram()).observe(seconds)
+        logger.info(json.dumps({"event": "phase", "kind": trace.kind, "phase": name, "seconds": seconds}))
+
+    def count(self, name: str, value: int = 1) -> None:
+        # 생성 한 건에 묶이지 않는 이벤트 (미리 생성 결과 사용 / 버림 등, 화면 쪽에서 판단)
+        if value:
+            with self._lock:
+                self._counters[name] = self._counters.get(name, 0) + value
+            self._write_metrics()
+
+    def recent(self, n: Optional[int] = None) -> list:
+        with self._lock:
+            traces = list(self._recent)
+        return traces[-n:] if n else traces
+
+    def counters(self) -> dict:
+        # 프로세스 시작 후 누적 카운터 (캐시 히트, 검증 실패, 수리 요청 등)
+        with self._lock:
+            return dict(self._counters)
+
+    def summary(self, n: Optional[int] = None) -> list:
+        # 최근 n 건 기준 단계별 [{phase, count, p50, p95}]
+        traces = self.recent(n)
+        samples = {}
+        for trace in traces:
+            for name, seconds in trace.phases.items():
+                samples.setdefault(name, []).append(seconds)
+            samples.setdefault("total", []).append(trace.total)
+        return [
+            {
+                "phase": name,
+                "count": len(values),
+                "p50": percentile(values, 0.50),
+                "p95": percentile(values, 0.95),
+            }
+            for name, values in sorted(samples.items(), key=lambda item: phase_sort_key(item[0]))
+        ]
+
+    def render_prometheus(self) -> str:
+        lines = [
+            "# HELP prompt_generator_phase_seconds Time spent in each generation phase.",
+            "# TYPE prompt_generator_phase_seconds histogram",
+        ]
+        with self._lock:
+            for name, histogram in sorted(self._histograms.items()):
+                for bound, count in zip(LATENCY_BUCKETS, histogram.buckets):
+                    lines.append(f'prompt_generator_phase_seconds_bucket{{phase="{name}",le="{bound}"}} {count}')
+                lines.append(f'prompt_generator_phase_seconds_bucket{{phase="{name}",le="+Inf"}} {histogram.count}')
+                lines.append(f'prompt_generator_phase_seconds_sum{{phase="{name}"}} {histogram.sum:.6f}')
+                lines.append(f'prompt_generator_phase_seconds_count{{phase="{name}"}} {histogram.count}')
+
+            lines.append("# HELP prompt_generator_generations_total Finished generations by kind and outcome.")
+            lines.append("# TYPE prompt_generator_generations_total counter")
+            for (kind, outcome), count in sorted(self._generations.items()):
+                lines.append(f'prompt_generator_generations_total{{kind="{kind}",outcome="{outcome}"}} {count}')
+
+            lines.append("# HELP prompt_generator_events_total Generation events (cache hits, stream chunks, tokens, repairs).")
+            lines.append("# TYPE prompt_generator_events_total counter")
+            for name, value in sorted(self._counters.items()):
+                lines.append(f'prompt_generator_events_total{{event="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def _write_metrics(self) -> None:
+        if not self.metrics_path:
+            return
+        # 수집기가 쓰다 만 파일을 읽지 않도록 임시 파일에 쓴 뒤 교체
+        directory = os.path.dirname(self.metrics_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.metrics_path}.tmp"
+        with self._write_lock:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(self.render_prometheus())
+            os.replace(temp_path, self.metrics_path)
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        # GET /metrics 로 Prometheus 텍스트를 제공하는 백그라운드 서버
+        telemetry = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
@@ -0,0 +1,145 @@
+import asyncio
+import io
+import json
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+import batch_generate
+from batch_generate import load_briefs, retry_delay, run_batch
+from prompt_core import COMFYUI_JSON_TEMPLATE
+
+RESULT_TEXT = (
+    "### 1️⃣ ComfyUI 사용 json 프롬프트\n"
+    f"```json\n{json.dumps(COMFYUI_JSON_TEMPLATE, ensure_ascii=False)}\n```\n\n"
+    "### 2️⃣ 미드저니 사용 프롬프트\n"
+    "a woman working on a laptop at a cafe terrace --ar 16:9\n"
+)
+
+
+def api_error(cls, status: int, headers: dict = None):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return cls(f"HTTP {status}", response=response, body=None)
+
+
+class StubClient:
+    # chat.completions.create 만 흉내: 동시 실행 수를 기록하고, 브리프 이름별로 정해 둔 오류를 차례로 냄
+    def __init__(self, errors: dict = None, delay: float = 0.01):
+        self.errors = {name: list(items) for name, items in (errors or {}).items()}
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.peak = 0
+        self.chat = SimpleNamespace(completions=self)
+
+    async def create(self, **kwargs):
+        prompt = kwargs["messages"][-1]["content"]
+        name = next(name for name in ("scene-0", "scene-1", "scene-2", "scene-3", "scene-4") if name in prompt)
+        self.calls.append((name, kwargs))
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.errors.get(name):
+                raise self.errors[name].pop(0)
+        finally:
+            self.active -= 1
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=RESULT_TEXT), finish_reason="stop")],
+            usage=SimpleNamespace(prompt_tokens=1000, completion_tokens=200, prompt_tokens_details=None),
+        )
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    # 재시도 대기는 기록만 하고 바로 진행
+    calls = []
+
+    def fake_retry_delay(error, attempt):
+        calls.append((error.status_code, attempt))
+        return 0
+
+    monkeypatch.setattr(batch_generate, "retry_delay", fake_retry_delay)
+    return calls
+
+
+def briefs(count: int) -> list:
+    return [{"prompt_name": f"scene-{number}", "brand": "니코모리"} for number in range(count)]
+
+
+def run(batch_briefs: list, client: StubClient, **options) -> tuple:
+    output = io.StringIO()
+    summary = asyncio.run(run_batch(batch_briefs, client, output, **options))
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    return summary, sorted(records, key=lambda record: record["index"])
+
+
+def test_load_briefs_from_jsonl_and_csv(tmp_path):
+    jsonl = tmp_path / "briefs.jsonl"
+    jsonl.write_text(
+        '{"prompt_name": "카페", "duration": "6", "extra": "", "unknown": "x"}\n\n{"brand": "Aurora"}\n',
+        encoding="utf-8",
+    )
+    assert load_briefs(str(jsonl)) == [{"prompt_name": "카페", "duration": 6}, {"brand": "Aurora"}]
+
+    csv_path = tmp_path / "briefs.CSV"
+    csv_path.write_text("\ufeffprompt_name,duration,subject\n야간 씬,10,\n낮 씬,,고양이\n", encoding="utf-8")
+    assert load_briefs(str(csv_path)) == [
+        {"prompt_name": "야간 씬", "duration": 10},
+        {"prompt_name": "낮 씬", "subject": "고양이"},
+    ]
+
+
+def test_retry_delay_prefers_server_hints(monkeypatch):
+    assert retry_delay(api_error(openai.RateLimitError, 429, {"retry-after-ms": "1500"}), 1) == 1.5
+    assert retry_delay(api_error(openai.RateLimitError, 429, {"retry-after": "3"}), 4) == 3.0
+    assert retry_delay(api_error(openai.RateLimitError, 429, {"retry-after": "120"}), 1, max_delay=30) == 30
+
+    # 힌트가 없거나 숫자가 아니면 지수 백오프 (0.5–1배 지터)
+    monkeypatch.setattr(batch_generate.random, "random", lambda: 1.0)
+    assert retry_delay(openai.APIConnectionError(request=None), 3) == 4.0
+    assert retry_delay(api_error(openai.RateLimitError, 429, {"retry-after": "soon"}), 2) == 2.0
+    assert retry_delay(openai.APIConnectionError(request=None), 10, max_delay=60) == 60
+    monkeypatch.setattr(batch_generate.random, "random", lambda: 0.0)
+    assert retry_delay(openai.APIConnectionError(request=None), 3, base_delay=2.0) == 4.0
+
+
+def test_run_batch_caps_concurrency_and_writes_every_record(delays):
+    client = StubClient()
+    summary, records = run(briefs(5), client, concurrency=2)
+
+    assert client.peak == 2 and len(client.calls) == 5
+    assert [record["index"] for record in records] == [0, 1, 2, 3, 4]
+    for number, record in enumerate(records):
+        assert record["ok"] and record["attempts"] == 1
+        assert record["prompt_name"] == f"scene-{number}" and record["brand"] == "니코모리"
+        assert record["comfyui_json"] == COMFYUI_JSON_TEMPLATE
+        assert record["midjourney_prompt"] == "a woman working on a laptop at a cafe terrace --ar 16:9"
+        assert record["usage"]["prompt_tokens"] == 1000 and record["usage"]["mode"] == "batch"
+        assert all(isinstance(violation, str) for violation in record["violations"])
+    assert summary["total"] == 5 and summary["ok"] == 5 and summary["failed"] == 0
+    assert summary["prompt_tokens"] == 5000 and summary["completion_tokens"] == 1000
+    assert delays == []
+    # 출력 상한은 지정한 경우에만 보냄
+    assert all("max_tokens" not in kwargs for _, kwargs in client.calls)
+
+
+def test_run_batch_retries_rate_limits_and_gives_up_on_other_errors(delays):
+    client = StubClient({
+        "scene-0": [api_error(openai.RateLimitError, 429), api_error(openai.RateLimitError, 429)],
+        "scene-1": [api_error(openai.BadRequestError, 400)],
+        "scene-2": [api_error(openai.InternalServerError, 500)] * 3,
+    })
+    summary, records = run(briefs(3), client, concurrency=3, max_attempts=3, max_tokens=2000)
+
+    assert records[0]["ok"] and records[0]["attempts"] == 3
+    assert not records[1]["ok"] and records[1]["attempts"] == 1 and "HTTP 400" in records[1]["error"]
+    assert not records[2]["ok"] and records[2]["attempts"] == 3 and "HTTP 500" in records[2]["error"]
+    assert "usage" not in records[1] and "usage" not in records[2]
+    assert sorted(delays) == [(429, 1), (429, 2), (500, 1), (500, 2)]
+    assert [name for name, _ in client.calls].count("scene-0") == 3
+    assert all(kwargs["max_tokens"] == 2000 for _, kwargs in client.calls)
+    assert summary["ok"] == 1 and summary["failed"] == 2
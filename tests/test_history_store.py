@@ -0,0 +1,99 @@
+import sqlite3
+
+import pytest
+
+import history_store
+from history_store import HistoryStore
+
+
+class NoFtsConnection(sqlite3.Connection):
+    # FTS5 / trigram 을 지원하지 않는 SQLite 흉내
+    def execute(self, sql, *args):
+        if "fts5" in sql:
+            raise sqlite3.OperationalError("no such module: fts5")
+        return super().execute(sql, *args)
+
+
+@pytest.fixture(params=["fts", "like"])
+def store(request, tmp_path, monkeypatch):
+    if request.param == "like":
+        connect = sqlite3.connect
+        monkeypatch.setattr(
+            history_store.sqlite3, "connect", lambda path, **kwargs: connect(path, factory=NoFtsConnection, **kwargs)
+        )
+    store = HistoryStore(str(tmp_path / "history" / "history.db"))
+    assert store.fts_enabled == (request.param == "fts")
+    return store
+
+
+def add(store: HistoryStore, name: str, brand: str = "니코모리", prompt: str = "", mj: str = "") -> int:
+    return store.add({
+        "prompt_name": name,
+        "brand": brand,
+        "mode": "blocking",
+        "brief": {"prompt_name": name},
+        "combined_prompt": prompt or f"[주제] {name}",
+        "result_text": "result",
+        "comfyui_json": {"topic_and_content": name},
+        "midjourney_prompt": mj,
+    })
+
+
+def test_add_and_get_round_trip(store):
+    history_id = add(store, "카페 테라스 작업 씬", mj="cafe terrace --ar 16:9")
+    entry = store.get(history_id)
+    assert entry["prompt_name"] == "카페 테라스 작업 씬"
+    assert entry["brief"] == {"prompt_name": "카페 테라스 작업 씬"}
+    assert entry["comfyui_json"] == {"topic_and_content": "카페 테라스 작업 씬"}
+    assert entry["created_at"] > 0
+    assert store.get(history_id + 1) is None
+    assert len(store) == 1
+
+
+def test_search_matches_substrings_in_every_column(store):
+    cafe = add(store, "카페 테라스 작업 씬")
+    night = add(store, "야간 도시 산책", brand="Aurora", prompt="[배경] 네온 간판이 켜진 골목")
+    neon = add(store, "제품 클로즈업", mj="neon rim light, macro shot --ar 1:1")
+
+    assert [entry["id"] for entry in store.search("테라스")[0]] == [cafe]
+    assert [entry["id"] for entry in store.search("간판이")[0]] == [night]
+    assert [entry["id"] for entry in store.search("rim light")[0]] == [neon]
+    assert [entry["id"] for entry in store.search("aurora")[0]] == [night]
+    # trigram 보다 짧은 검색어는 LIKE 로 처리
+    assert [entry["id"] for entry in store.search("씬")[0]] == [cafe]
+    assert store.search("없는 검색어") == ([], 0)
+
+
+def test_search_treats_query_as_literal_text(store):
+    percent = add(store, "할인 50% 배너")
+    add(store, "할인 500 배너")
+    quoted = add(store, 'say "hello" 씬')
+
+    assert [entry["id"] for entry in store.search("50%")[0]] == [percent]
+    assert [entry["id"] for entry in store.search('"hello"')[0]] == [quoted]
+    assert store.search("%")[1] == 1
+    assert store.search("_")[1] == 0
+
+
+def test_search_filters_by_brand_and_pages_newest_first(store):
+    ids = [add(store, f"씬 {number}", brand="니코모리" if number % 2 else "Aurora") for number in range(7)]
+    nicomori = [history_id for number, history_id in enumerate(ids) if number % 2][::-1]
+
+    rows, total = store.search(brand="니코모리", limit=2)
+    assert total == 3 and [entry["id"] for entry in rows] == nicomori[:2]
+    rows, total = store.search(brand="니코모리", limit=2, offset=2)
+    assert total == 3 and [entry["id"] for entry in rows] == nicomori[2:]
+    assert store.search("씬 ", "Aurora")[1] == 4
+    assert store.brands() == ["Aurora", "니코모리"]
+
+
+@pytest.mark.parametrize("count", [0, 3, 5, 11])
+def test_iter_search_pages_through_every_match(store, count):
+    ids = [add(store, f"카페 씬 {number}") for number in range(count)]
+    add(store, "야간 도시 산책")
+
+    entries = list(store.iter_search("카페", batch_size=5))
+    assert [entry["id"] for entry in entries] == ids[::-1]
+    assert [entry["id"] for entry in store.iter_search(batch_size=5)] == [
+        entry["id"] for entry in store.search(limit=count + 1)[0]
+    ]
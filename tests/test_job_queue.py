@@ -0,0 +1,101 @@
+import threading
+import time
+
+from job_queue import STATUS_CANCELLED, STATUS_DONE, STATUS_ERROR, JobQueue
+
+
+def wait_until(predicate, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_progress_is_a_snapshot():
+    queue = JobQueue(max_workers=1)
+    release = threading.Event()
+
+    def work(job):
+        job.update(message="step 1")
+        release.wait(5)
+        job.update(message="step 2", tokens=10)
+        return "ok"
+
+    job = queue.submit(work)
+    wait_until(lambda: job.progress.get("message") == "step 1")
+    snapshot = job.progress
+    snapshot["message"] = "changed by reader"
+    release.set()
+    wait_until(lambda: job.done)
+    assert job.status == STATUS_DONE and job.result == "ok"
+    assert job.progress == {"message": "step 2", "tokens": 10}
+
+
+def test_cancel_is_cooperative():
+    queue = JobQueue(max_workers=1)
+    started, release = threading.Event(), threading.Event()
+
+    def work(job):
+        started.set()
+        release.wait(5)
+        job.check_cancelled()
+        return "unused"
+
+    job = queue.submit(work)
+    started.wait(5)
+    job.cancel()
+    assert job.status == STATUS_CANCELLED and job.cancelled
+    release.set()
+    queue._pool.shutdown(wait=True)
+    assert job.status == STATUS_CANCELLED and job.result is None
+
+
+def test_error_is_recorded():
+    queue = JobQueue(max_workers=1)
+
+    def work(job):
+        raise ValueError("bad")
+
+    job = queue.submit(work)
+    wait_until(lambda: job.done)
+    assert job.status == STATUS_ERROR and str(job.error) == "bad"
+    assert queue.get(job.id) is job and queue.get(None) is None
+
+
+def test_on_cancel_runs_once_for_running_and_finished_jobs():
+    queue = JobQueue(max_workers=1)
+    calls = []
+
+    job = queue.submit(lambda job: job.on_cancel(lambda: calls.append("done")) or "ok")
+    wait_until(lambda: job.done)
+    job.cancel()
+    job.cancel()
+    assert job.status == STATUS_DONE and job.result == "ok"
+    assert calls == ["done"]
+
+    release = threading.Event()
+
+    def work(job):
+        release.wait(5)
+        job.check_cancelled()
+
+    running = queue.submit(work)
+    running.on_cancel(lambda: calls.append("running"))
+    running.cancel()
+    release.set()
+    assert running.status == STATUS_CANCELLED
+    assert calls == ["done", "running"]
+    running.on_cancel(lambda: calls.append("late"))
+    assert calls == ["done", "running", "late"]
+
+
+def test_run_executes_in_the_calling_thread():
+    queue = JobQueue(max_workers=1)
+    caller = threading.current_thread()
+
+    job = queue.run(lambda job, value: (threading.current_thread() is caller, value), 7, label="hit")
+    assert job.status == STATUS_DONE and job.result == (True, 7)
+    assert job.label == "hit" and queue.get(job.id) is job
+
+    failed = queue.run(lambda job: 1 / 0)
+    assert failed.status == STATUS_ERROR and isinstance(failed.error, ZeroDivisionError)
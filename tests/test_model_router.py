@@ -0,0 +1,169 @@
+import threading
+
+import pytest
+
+from model_router import AllBackendsFailed, Backend, Completion, Router
+
+
+class FakeBackend(Backend):
+    def __init__(self, name: str, latency: float = 0.1, error: Exception = None):
+        self.name = name
+        self.model = f"{name}-model"
+        self.latency = latency
+        self.error = error
+        self.calls = 0
+
+    def complete(self, system_instruction, prompt, temperature, max_tokens=None):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return Completion(f"{self.name}:{prompt}", None, self.name, self.model, self.latency)
+
+
+def names(backends: list) -> list:
+    return [backend.name for backend in backends]
+
+
+def test_backend_is_abstract():
+    with pytest.raises(TypeError):
+        Backend()
+
+
+def test_configured_order_before_measurements():
+    router = Router([FakeBackend("openai"), FakeBackend("gemini")])
+    assert names(router.ranked()) == ["openai", "gemini"]
+
+
+def test_unmeasured_backend_stays_behind_measured_primary():
+    router = Router([FakeBackend("openai"), FakeBackend("gemini")], min_samples=5)
+    for _ in range(5):
+        router.complete("system", "prompt", 0.7)
+    assert names(router.ranked()) == ["openai", "gemini"]
+
+
+def test_unmeasured_backend_goes_after_measured_ones():
+    router = Router([FakeBackend("a"), FakeBackend("b")], min_samples=2)
+    for _ in range(2):
+        router.trackers["b"].record(1.0, ok=True)
+    assert names(router.ranked()) == ["b", "a"]
+
+
+def test_faster_measured_backend_ranks_first():
+    router = Router([FakeBackend("slow"), FakeBackend("fast")], min_samples=3)
+    for _ in range(3):
+        router.trackers["slow"].record(5.0, ok=True)
+        router.trackers["fast"].record(1.0, ok=True)
+    assert names(router.ranked()) == ["fast", "slow"]
+
+
+def test_unhealthy_backend_ranks_last():
+    router = Router([FakeBackend("flaky"), FakeBackend("ok"), FakeBackend("new")], min_samples=2)
+    for _ in range(2):
+        router.trackers["flaky"].record(0.1, ok=False)
+        router.trackers["ok"].record(3.0, ok=True)
+    assert names(router.ranked()) == ["ok", "new", "flaky"]
+
+
+def test_falls_back_to_next_backend():
+    primary = FakeBackend("primary", error=RuntimeError("down"))
+    secondary = FakeBackend("secondary")
+    router = Router([primary, secondary])
+    completion = router.complete("system", "hello", 0.7)
+    assert completion.text == "secondary:hello"
+    assert router.trackers["primary"].errors == 1
+    assert router.trackers["secondary"].wins == 1
+
+
+def test_all_backends_failed_chains_last_error():
+    error = RuntimeError("second")
+    router = Router([FakeBackend("a", error=RuntimeError("first")), FakeBackend("b", error=error)])
+    with pytest.raises(AllBackendsFailed) as info:
+        router.complete("system", "hello", 0.7)
+    assert info.value.__cause__ is error
+    assert "a: first" in str(info.value) and "b: second" in str(info.value)
+
+
+def test_stats_rows():
+    router = Router([FakeBackend("a")])
+    router.complete("system", "hello", 0.7)
+    (row,) = router.stats()
+    assert row["backend"] == "a" and row["calls"] == 1 and row["errors"] == 0 and row["wins"] == 1
+
+
+class BlockingBackend(FakeBackend):
+    # release 될 때까지 응답하지 않는 백엔드 (헤징 테스트용)
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def complete(self, system_instruction, prompt, temperature, max_tokens=None):
+        self.started.set()
+        assert self.release.wait(5)
+        return super().complete(system_instruction, prompt, temperature, max_tokens)
+
+
+class FakeLease:
+    def __init__(self):
+        self.released = threading.Event()
+
+    def release(self):
+        assert not self.released.is_set()
+        self.released.set()
+
+
+def test_hedge_wins_and_loser_usage_is_reported():
+    slow, fast = BlockingBackend("slow"), FakeBackend("fast")
+    router = Router([slow, fast], hedge_delay=0.01)
+    lease = FakeLease()
+    discarded = []
+    completion = router.complete(
+        "system", "hello", 0.7, acquire_hedge=lambda: lease, on_discarded=discarded.append
+    )
+    assert completion.backend == "fast"
+    assert router.trackers["fast"].hedges == 1
+    # 진 요청이 아직 실행 중이므로 헤지 슬롯은 유지
+    assert not lease.released.is_set() and discarded == []
+
+    slow.release.set()
+    assert lease.released.wait(5)
+    assert [c.backend for c in discarded] == ["slow"]
+
+
+def test_hedge_slot_released_when_hedge_loses():
+    slow, hedge = BlockingBackend("slow"), BlockingBackend("hedge")
+    router = Router([slow, hedge], hedge_delay=0.01)
+    lease = FakeLease()
+    discarded = []
+    result = {}
+    thread = threading.Thread(
+        target=lambda: result.update(completion=router.complete(
+            "system", "hello", 0.7, acquire_hedge=lambda: lease, on_discarded=discarded.append
+        ))
+    )
+    thread.start()
+    assert hedge.started.wait(5)
+    slow.release.set()
+    thread.join(5)
+    assert result["completion"].backend == "slow"
+    assert not lease.released.is_set()
+    hedge.release.set()
+    assert lease.released.wait(5)
+    assert [c.backend for c in discarded] == ["hedge"]
+
+
+def test_no_hedge_without_free_slot():
+    slow, other = BlockingBackend("slow"), FakeBackend("other")
+    router = Router([slow, other], hedge_delay=0.01)
+    attempts = []
+
+    def acquire_hedge():
+        attempts.append(1)
+        if len(attempts) == 3:
+            slow.release.set()
+        return None
+
+    completion = router.complete("system", "hello", 0.7, acquire_hedge=acquire_hedge)
+    assert completion.backend == "slow"
+    assert other.calls == 0 and router.trackers["other"].hedges == 0
+    assert len(attempts) >= 3
@@ -0,0 +1,126 @@
+import copy
+
+from output_validator import (
+    MIDJOURNEY_SECTION,
+    Violation,
+    drop_unknown_sections,
+    repair_targets,
+    validate_comfyui_json,
+    validate_midjourney,
+)
+from prompt_core import COMFYUI_JSON_TEMPLATE, DEFAULT_BRIEF, merge_patch
+
+
+def filled(value):
+    # 템플릿의 "___" 를 규칙에 맞는 영어 값으로 채운 정상 결과
+    if isinstance(value, dict):
+        return {key: filled(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [filled(item) for item in value]
+    if value == "___":
+        return "soft morning light"
+    return value
+
+
+def valid_json() -> dict:
+    return filled(copy.deepcopy(COMFYUI_JSON_TEMPLATE))
+
+
+def paths(violations: list) -> list:
+    return [violation.path for violation in violations]
+
+
+def test_valid_output_has_no_violations():
+    assert validate_comfyui_json(valid_json(), DEFAULT_BRIEF) == []
+    assert validate_midjourney("a woman working in a cafe --ar 16:9") == []
+
+
+def test_missing_json_is_whole_response_violation():
+    violations = validate_comfyui_json(None, DEFAULT_BRIEF)
+    assert len(violations) == 1
+    assert violations[0].section is None
+
+
+def test_placeholder_and_hangul():
+    data = valid_json()
+    data["background"]["location"] = "___"
+    data["style"]["mood"] = "따뜻한 분위기"
+    violations = validate_comfyui_json(data, DEFAULT_BRIEF)
+    assert paths(violations) == ["$.background.location", "$.style.mood"]
+    assert "___" in violations[0].message
+
+
+def test_camera_terms_only_flagged_in_global_fields():
+    data = valid_json()
+    data["camera_work"]["notes"] = "Slow dolly-in then a close-up"
+    data["camera_work"]["effects"] = ["lens flare", "wide shot"]
+    data["timeline"][0]["action"] = "wide shot of the terrace"
+    violations = validate_comfyui_json(data, DEFAULT_BRIEF)
+    assert paths(violations) == ["$.camera_work.notes", "$.camera_work.effects[1]"]
+    assert "close-up" in violations[0].message and "dolly-in" in violations[0].message
+
+
+def test_timeline_count_sequence_and_timestamp():
+    data = valid_json()
+    data["timeline"] = data["timeline"][:2]
+    data["timeline"][1]["sequence"] = 5
+    data["timeline"][0]["timestamp"] = "0-3s"
+    violations = validate_comfyui_json(data, DEFAULT_BRIEF)
+    assert paths(violations) == ["$.timeline", "$.timeline[0].timestamp", "$.timeline[1].sequence"]
+    assert all(violation.section == "timeline" for violation in violations)
+
+
+def test_voice_over_requires_speaking_action():
+    data = valid_json()
+    data["timeline"][1]["action"] = "she is speaking to the camera"
+    brief = {**DEFAULT_BRIEF, "audio_voice": "오늘도 좋은 하루"}
+    assert paths(validate_comfyui_json(data, brief)) == ["$.timeline[0].action", "$.timeline[2].action"]
+    assert validate_comfyui_json(data, DEFAULT_BRIEF) == []
+
+
+def test_requirements_must_be_verbatim():
+    data = valid_json()
+    data["requirements"] = "letterboxed video"
+    assert paths(validate_comfyui_json(data, DEFAULT_BRIEF)) == ["$.requirements"]
+
+
+def test_validate_midjourney():
+    assert len(validate_midjourney(None)) == 1
+    assert [violation.message for violation in validate_midjourney("line one\nline two")] == ["한 줄이어야 함"]
+    assert validate_midjourney("카페 --ar 16:9")[0].section == MIDJOURNEY_SECTION
+
+
+def test_violation_section():
+    assert Violation("$.timeline[0].action", "x").section == "timeline"
+    assert Violation("$.camera_work.notes", "x").section == "camera_work"
+    assert Violation(MIDJOURNEY_SECTION, "x").section == MIDJOURNEY_SECTION
+    assert Violation("$", "x").section is None
+    assert str(Violation("$.style", "bad")) == "$.style: bad"
+
+
+def test_repair_targets_in_template_order():
+    violations = [
+        Violation("$.timeline[1].sequence", "x"),
+        Violation(MIDJOURNEY_SECTION, "x"),
+        Violation("$.character.gender", "x"),
+        Violation("$.timeline", "x"),
+    ]
+    assert repair_targets(violations) == (["character", "timeline"], True)
+    assert repair_targets([Violation("$.style.mood", "x")]) == (["style"], False)
+    assert repair_targets(violations + [Violation("$", "x")]) == ([], False)
+
+
+def test_drop_unknown_sections():
+    data = {"extra_section": {}, **valid_json()}
+    assert list(drop_unknown_sections(data)) == list(COMFYUI_JSON_TEMPLATE)
+
+
+def test_merge_patch_replaces_only_repaired_sections():
+    previous = valid_json()
+    style = {**previous["style"], "mood": "calm"}
+    merged = merge_patch(previous, {"style": style, MIDJOURNEY_SECTION: "new prompt", "unknown": 1})
+    assert list(merged) == list(previous)
+    assert merged["style"] == style
+    assert merged["timeline"] == previous["timeline"]
+    assert previous["style"]["mood"] == "soft morning light"
+    assert validate_comfyui_json(merged, DEFAULT_BRIEF) == []
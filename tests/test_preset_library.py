@@ -0,0 +1,93 @@
+import json
+import os
+
+import pytest
+
+from preset_library import PresetError, PresetLibrary
+from prompt_core import DEFAULT_BRIEF
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write(path, data) -> str:
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def library(tmp_path):
+    write(tmp_path / "brand.json", {
+        "brand": "니코모리",
+        "tags": ["lifestyle"],
+        "defaults": {"style": "cinematic", "unknown_field": "ignored"},
+        "presets": [
+            {"id": "day", "name": "낮 씬", "tags": ["cafe"], "fields": {"lighting": "햇살"}},
+            {"id": "night", "base": "day", "tags": ["cafe", "night"], "fields": {"lighting": "네온"}},
+            {"id": "other", "brand": "Acme", "fields": {"subject": "로봇"}},
+        ],
+    })
+    return PresetLibrary(str(tmp_path))
+
+
+def test_brief_layers_defaults_base_and_fields(library):
+    brief = library.brief("night")
+    assert brief["style"] == "cinematic"
+    assert brief["lighting"] == "네온"
+    assert brief["brand"] == "니코모리"
+    # 이름은 base 에서 물려받지 않음
+    assert brief["prompt_name"] == "night"
+    assert "unknown_field" not in brief
+    assert brief["subject"] == DEFAULT_BRIEF["subject"]
+
+
+def test_brief_returns_a_copy(library):
+    library.brief("day")["lighting"] = "changed"
+    assert library.brief("day")["lighting"] == "햇살"
+
+
+def test_indexes_and_search(library):
+    assert len(library) == 3
+    assert library.brands() == ["Acme", "니코모리"]
+    assert library.tags("니코모리") == ["cafe", "lifestyle", "night"]
+    assert [p.id for p in library.search(brand="니코모리", tags=("night",))] == ["night"]
+    assert [p.id for p in library.search(query="낮")] == ["day"]
+    assert library.search(brand="없는 브랜드") == []
+
+
+def test_missing_and_cyclic_presets(tmp_path):
+    library = PresetLibrary(write(tmp_path / "cycle.json", [
+        {"id": "a", "base": "b"},
+        {"id": "b", "base": "a"},
+    ]))
+    with pytest.raises(PresetError, match="순환"):
+        library.brief("a")
+    with pytest.raises(PresetError):
+        library.brief("missing")
+
+
+def test_duplicate_ids_and_bad_files_are_reported(tmp_path):
+    write(tmp_path / "a.json", [{"id": "same"}])
+    write(tmp_path / "b.json", [{"id": "same"}])
+    (tmp_path / "broken.json").write_text("{", encoding="utf-8")
+    library = PresetLibrary(str(tmp_path))
+    assert len(library) == 1
+    assert len(library.errors) == 2
+
+
+def test_refresh_reloads_changed_files(tmp_path):
+    path = tmp_path / "presets.json"
+    write(path, [{"id": "a", "fields": {"subject": "first"}}])
+    library = PresetLibrary(str(path))
+    assert library.brief("a")["subject"] == "first"
+    write(path, [{"id": "a", "fields": {"subject": "second"}}, {"id": "b"}])
+    os.utime(path, (os.path.getmtime(path) + 10,) * 2)
+    library.refresh()
+    assert library.brief("a")["subject"] == "second"
+    assert len(library) == 2
+
+
+def test_bundled_presets_load():
+    library = PresetLibrary(os.path.join(ROOT, "presets"))
+    assert len(library) > 0 and library.errors == []
+    for preset in library.search():
+        assert library.brief(preset.id)["brand"] == preset.brand
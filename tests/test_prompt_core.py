@@ -0,0 +1,164 @@
+import copy
+import json
+
+import pytest
+
+from prompt_core import (
+    COMFYUI_JSON_TEMPLATE,
+    COMFYUI_SYSTEM_INSTRUCTION,
+    DEFAULT_BRIEF,
+    MIDJOURNEY_SYSTEM_INSTRUCTION,
+    STRUCTURED_OUTPUT_SCHEMA,
+    SYSTEM_INSTRUCTION,
+    StructuredOutputError,
+    _section,
+    build_combined_prompt,
+    changed_fields,
+    merge_patch,
+    parse_structured_output,
+    schema_errors,
+    sections_to_regenerate,
+)
+
+
+def test_blank_fields_are_dropped():
+    prompt = build_combined_prompt({**DEFAULT_BRIEF, "extra": "  ", "audio_voice": ""})
+    assert "[추가 메모]" not in prompt
+    assert "Voice / Narration" not in prompt
+    assert "- BGM: " in prompt
+
+
+def test_explicit_none_like_values_are_kept():
+    prompt = build_combined_prompt({**DEFAULT_BRIEF, "extra": "없음", "audio_voice": "none", "composition": "-"})
+    assert "[추가 메모]\n없음" in prompt
+    assert "- Voice / Narration: none" in prompt
+    assert "[구도]\n-" in prompt
+
+
+def structured_output(**overrides) -> dict:
+    return {
+        "comfyui_json": copy.deepcopy(COMFYUI_JSON_TEMPLATE),
+        "comfyui_missing": [],
+        "midjourney_prompt": "a woman working on a laptop at a cafe terrace --ar 16:9",
+        "midjourney_missing": ["eye color"],
+        **overrides,
+    }
+
+
+def test_parse_structured_output_accepts_schema_valid_json():
+    data = structured_output()
+    assert parse_structured_output(json.dumps(data, ensure_ascii=False)) == data
+
+
+def test_parse_structured_output_rejects_malformed_json():
+    with pytest.raises(StructuredOutputError, match="JSON 파싱 실패"):
+        parse_structured_output('{"comfyui_json": {')
+
+
+@pytest.mark.parametrize("mutate, error", [
+    (lambda data: data.pop("midjourney_prompt"), "$.midjourney_prompt: 누락"),
+    (lambda data: data.update(notes="extra"), "$.notes: 템플릿에 없는 key"),
+    (lambda data: data.update(comfyui_missing="none"), "$.comfyui_missing: array 가 아님"),
+    (lambda data: data["comfyui_json"].update(character="woman"), "$.comfyui_json.character: object 가 아님"),
+    (
+        lambda data: data["comfyui_json"]["timeline"][1].update(sequence="2"),
+        "$.comfyui_json.timeline[1].sequence: integer 가 아님",
+    ),
+    (
+        lambda data: data["comfyui_json"]["timeline"][0].update(sequence=True),
+        "$.comfyui_json.timeline[0].sequence: integer 가 아님",
+    ),
+    (
+        lambda data: data["comfyui_json"]["background"].update(weather=None),
+        "$.comfyui_json.background.weather: string 이 아님",
+    ),
+])
+def test_parse_structured_output_rejects_schema_violations(mutate, error):
+    data = structured_output()
+    mutate(data)
+    with pytest.raises(StructuredOutputError, match="스키마 검증 실패") as info:
+        parse_structured_output(json.dumps(data, ensure_ascii=False))
+    assert error in str(info.value)
+    assert schema_errors(data, STRUCTURED_OUTPUT_SCHEMA) == [error]
+
+
+def test_boolean_schema_and_error_list_cap():
+    assert schema_errors(True, {"type": "boolean"}) == []
+    assert schema_errors(1, {"type": "boolean"}, "$.flag") == ["$.flag: boolean 이 아님"]
+
+    # 위반이 많아도 메시지에는 앞의 10건만
+    data = structured_output(comfyui_json={})
+    with pytest.raises(StructuredOutputError) as info:
+        parse_structured_output(json.dumps(data))
+    assert len(schema_errors(data, STRUCTURED_OUTPUT_SCHEMA)) == len(COMFYUI_JSON_TEMPLATE)
+    assert str(info.value).count("누락") == 10
+
+
+def test_section_cuts_from_heading_line_to_next_heading_line():
+    instruction = "intro [B] mentioned inline\n[A]\nfirst\n[B]\nsecond\n[C]\nthird\n"
+    assert _section(instruction, "[A]", "[B]") == "[A]\nfirst\n"
+    # 본문 중간에 나온 "[B]" 가 아니라 줄 맨 앞의 제목부터
+    assert _section(instruction, "[B]", "[C]") == "[B]\nsecond\n"
+    assert _section(instruction, "[C]") == "[C]\nthird\n"
+    with pytest.raises(ValueError):
+        _section(instruction, "[D]")
+
+
+def test_split_instructions_take_their_own_conditions():
+    comfyui, midjourney = COMFYUI_SYSTEM_INSTRUCTION, MIDJOURNEY_SYSTEM_INSTRUCTION
+    assert "\n[조건 1: ComfyUI JSON 작성]" in comfyui and "\n[JSON 템플릿]" in comfyui
+    assert "\n[조건 3: 미드저니 프롬프트 작성]" not in comfyui
+    assert "\n2️⃣ 미드저니 사용 프롬프트" not in comfyui
+    assert "\n[조건 3: 미드저니 프롬프트 작성]" in midjourney
+    assert "\n[미드저니 사용 프롬프트 출력 예시]" in midjourney
+    assert "\n[조건 1: ComfyUI JSON 작성]" not in midjourney and "\n[JSON 템플릿]" not in midjourney
+    # 나눈 구간은 원래 지시문의 일부를 그대로 옮긴 것
+    for start, end in (
+        ("[조건 1: ComfyUI JSON 작성]", "[조건 3: 미드저니 프롬프트 작성]"),
+        ("[조건 3: 미드저니 프롬프트 작성]", "[출력 양식 – 반드시 이 순서를 지키세요]"),
+    ):
+        section = _section(SYSTEM_INSTRUCTION, start, end)
+        assert section.startswith(start) and section in SYSTEM_INSTRUCTION
+        assert section in comfyui + midjourney
+
+
+def test_changed_fields_ignores_surrounding_whitespace():
+    previous = dict(DEFAULT_BRIEF)
+    current = {**DEFAULT_BRIEF, "lighting": f"  {DEFAULT_BRIEF['lighting']}\n", "style": "anime", "duration": "8"}
+    assert changed_fields(previous, current) == ["style"]
+    assert changed_fields(previous, {**current, "extra": "메모"}) == ["style", "extra"]
+    assert changed_fields(previous, previous) == []
+
+
+def test_sections_follow_template_order_and_merge_multi_section_fields():
+    # lighting 은 background / style 두 섹션에 반영됨
+    assert sections_to_regenerate(["lighting"]) == ["background", "style"]
+    assert sections_to_regenerate(["aspect", "lighting"]) == ["background", "style", "aspect_ratio"]
+    assert sections_to_regenerate(["camera_move", "composition"]) == ["camera_work", "timeline"]
+    assert sections_to_regenerate(["prompt_name"]) == []
+    assert sections_to_regenerate([]) == []
+
+
+def test_sections_fall_back_to_full_regeneration():
+    # 어느 섹션에 반영될지 모르는 필드
+    assert sections_to_regenerate(["style", "extra"]) is None
+    # 섹션이 너무 많이 바뀌면 (10개 중 7개)
+    assert sections_to_regenerate(["subject", "action", "lighting", "camera_move"]) is None
+    assert sections_to_regenerate(["subject", "action", "lighting"]) == [
+        "topic_and_content", "character", "action", "background", "style", "timeline",
+    ]
+
+
+def test_merge_patch_replaces_only_known_sections_in_place():
+    previous = copy.deepcopy(COMFYUI_JSON_TEMPLATE)
+    patch = {
+        "style": {**previous["style"], "genre": "anime"},
+        "background": {**previous["background"], "time_of_day": "night"},
+        "midjourney_prompt": "night cafe --ar 16:9",
+    }
+    merged = merge_patch(previous, patch)
+    assert list(merged) == list(COMFYUI_JSON_TEMPLATE)
+    assert merged["style"]["genre"] == "anime" and merged["background"]["time_of_day"] == "night"
+    assert merged["character"] == previous["character"]
+    assert "midjourney_prompt" not in merged
+    assert previous["style"]["genre"] == "___"
@@ -0,0 +1,309 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+import rate_limiter
+from rate_limiter import (
+    DEFAULT_MAX_ATTEMPTS,
+    DEFAULT_RETRY_AFTER,
+    PRIORITY_BATCH,
+    Lane,
+    RateLimitScheduler,
+    TokenBucket,
+    retry_after_seconds,
+    transient_retry_delay,
+)
+
+
+def wait_until(predicate, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, headers: dict):
+        super().__init__("rate limited")
+        self.response = SimpleNamespace(headers=headers)
+
+
+def test_token_bucket_refills_per_minute(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    bucket = TokenBucket(60)
+    assert bucket.level == 60
+    assert bucket.delay(10, now[0]) == 0.0
+    bucket.take(60)
+    assert bucket.delay(10, now[0]) == pytest.approx(10.0)
+    now[0] += 5
+    assert bucket.delay(10, now[0]) == pytest.approx(5.0)
+    # 한도보다 큰 요청은 가득 찼을 때 보냄
+    assert bucket.delay(500, now[0]) == pytest.approx(55.0)
+
+
+def test_token_bucket_resize_and_sync(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    bucket = TokenBucket()
+    assert bucket.delay(10 ** 9, now[0]) == 0.0
+    bucket.resize(100)
+    assert bucket.limit == 100 and bucket.level == 100
+    bucket.sync(30)
+    assert bucket.level == 30
+    bucket.sync(80)
+    assert bucket.level == 30
+    bucket.resize(20)
+    assert bucket.level == 20
+    bucket.resize(0)
+    assert bucket.limit is None
+
+
+def run_in_order(scheduler: RateLimitScheduler, lanes: list) -> list:
+    # 슬롯 하나를 잡아 둔 채 lanes 순서대로 대기열에 세운 뒤, 실제로 시작된 순서를 반환
+    order = []
+    holder = scheduler.acquire(Lane("holder"), 1)
+    threads = []
+    for lane in lanes:
+        def work(lane=lane):
+            with scheduler.acquire(lane, 1):
+                order.append(lane.key)
+
+        thread = threading.Thread(target=work)
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: scheduler.stats()["queued"] == len(threads))
+    holder.release()
+    for thread in threads:
+        thread.join(5)
+    return order
+
+
+def test_round_robin_between_keys():
+    scheduler = RateLimitScheduler(max_concurrent=1)
+    order = run_in_order(scheduler, [Lane("a"), Lane("a"), Lane("a"), Lane("b"), Lane("c")])
+    assert order == ["a", "b", "c", "a", "a"]
+
+
+def test_interactive_before_batch():
+    scheduler = RateLimitScheduler(max_concurrent=1)
+    order = run_in_order(scheduler, [Lane("batch", PRIORITY_BATCH), Lane("batch", PRIORITY_BATCH), Lane("ui")])
+    assert order == ["ui", "batch", "batch"]
+
+
+def test_cancelled_waiter_leaves_queue():
+    scheduler = RateLimitScheduler(max_concurrent=1)
+    cancelled = threading.Event()
+    positions = []
+    errors = []
+
+    def check_cancelled():
+        if cancelled.is_set():
+            raise RuntimeError("cancelled")
+
+    def work():
+        try:
+            scheduler.acquire(Lane("a", check_cancelled=check_cancelled, on_wait=positions.append), 1)
+        except RuntimeError as e:
+            errors.append(e)
+
+    holder = scheduler.acquire(Lane("holder"), 1)
+    thread = threading.Thread(target=work)
+    thread.start()
+    wait_until(lambda: positions)
+    cancelled.set()
+    thread.join(5)
+    assert len(errors) == 1
+    assert positions[0] == 1
+    assert scheduler.stats()["queued"] == 0
+    holder.release()
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_run_retries_on_429(monkeypatch):
+    scheduler = RateLimitScheduler()
+    pauses = []
+    monkeypatch.setattr(scheduler, "pause", pauses.append)
+    calls = []
+
+    def call():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RateLimited({"retry-after-ms": "250"})
+        return "ok"
+
+    assert scheduler.run(Lane("a"), 1, call) == "ok"
+    assert pauses == [0.25]
+    assert scheduler.stats()["retried"] == 1
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_run_gives_up_and_does_not_retry_other_errors(monkeypatch):
+    scheduler = RateLimitScheduler()
+    monkeypatch.setattr(scheduler, "pause", lambda seconds: None)
+    calls = []
+
+    def throttled():
+        calls.append(1)
+        raise RateLimited({})
+
+    with pytest.raises(RateLimited):
+        scheduler.run(Lane("a"), 1, throttled, max_attempts=2)
+    assert len(calls) == 2
+
+    def broken():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        scheduler.run(Lane("a"), 1, broken)
+    assert len(calls) == 3
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_open_keeps_slot_until_released(monkeypatch):
+    scheduler = RateLimitScheduler()
+    monkeypatch.setattr(scheduler, "pause", lambda seconds: None)
+    attempts = iter([RateLimited({}), None])
+
+    def create():
+        error = next(attempts)
+        if error is not None:
+            raise error
+        return "stream"
+
+    lease, stream = scheduler.open(Lane("a"), 1, create)
+    assert stream == "stream"
+    assert scheduler.stats()["in_flight"] == 1
+    with lease:
+        pass
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_retry_after_seconds_follows_cause():
+    assert retry_after_seconds(ValueError()) is None
+    assert retry_after_seconds(RateLimited({"retry-after": "3"})) == 3.0
+    assert retry_after_seconds(RateLimited({"retry-after": "soon"})) == DEFAULT_RETRY_AFTER
+    try:
+        try:
+            raise RateLimited({"retry-after-ms": "1500"})
+        except RateLimited as e:
+            raise RuntimeError("all backends failed") from e
+    except RuntimeError as e:
+        assert retry_after_seconds(e) == 1.5
+
+
+def test_update_from_headers():
+    scheduler = RateLimitScheduler()
+    scheduler.update_from_headers({
+        "x-ratelimit-limit-requests": "500",
+        "x-ratelimit-remaining-requests": "120",
+        "x-ratelimit-limit-tokens": "bad",
+    })
+    stats = scheduler.stats()
+    assert stats["requests_limit"] == 500
+    assert stats["requests_available"] == pytest.approx(120, abs=1)
+    assert stats["tokens_limit"] is None
+
+    scheduler.update_from_headers({"retry-after": "5"}, status_code=429)
+    stats = scheduler.stats()
+    assert stats["throttled"] == 1
+    assert 4 < stats["paused_for"] <= 5
+
+
+def test_try_acquire_only_when_a_slot_is_free():
+    scheduler = RateLimitScheduler(max_concurrent=2)
+    first = scheduler.try_acquire(Lane("a"), 1)
+    assert first is not None
+    second = scheduler.acquire(Lane("b"), 1)
+    assert scheduler.try_acquire(Lane("a"), 1) is None
+
+    waiting = threading.Thread(target=lambda: scheduler.acquire(Lane("c"), 1).release())
+    waiting.start()
+    wait_until(lambda: scheduler.stats()["queued"] == 1)
+    second.release()
+    waiting.join(5)
+    assert scheduler.stats()["queued"] == 0
+
+    scheduler.pause(60)
+    assert scheduler.try_acquire(Lane("a"), 1) is None
+    first.release()
+    assert scheduler.stats()["in_flight"] == 0
+
+
+class ServerError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def flaky(error: BaseException, failures: int = 1):
+    calls = []
+
+    def call():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise error
+        return "ok"
+
+    return call, calls
+
+
+@pytest.mark.parametrize("error", [
+    ServerError(503),
+    openai.APIConnectionError(request=None),
+    openai.APITimeoutError(request=None),
+    ConnectionResetError("reset"),
+])
+def test_run_backs_off_on_transient_errors(monkeypatch, error):
+    scheduler = RateLimitScheduler()
+    sleeps = []
+    monkeypatch.setattr(scheduler, "_backoff", lambda lane, seconds: sleeps.append(seconds))
+    monkeypatch.setattr(scheduler, "pause", lambda seconds: pytest.fail("transient errors must not pause everyone"))
+    call, calls = flaky(error, failures=2)
+
+    assert scheduler.run(Lane("a"), 1, call) == "ok"
+    assert len(calls) == 3
+    assert scheduler.stats()["retried"] == 2
+    assert scheduler.stats()["in_flight"] == 0
+    # 지수 백오프 + 지터: 1회차 0.5–1초, 2회차 1–2초
+    assert len(sleeps) == 2
+    assert 0.5 <= sleeps[0] <= 1.0 and 1.0 <= sleeps[1] <= 2.0
+
+
+def test_transient_retry_follows_cause_and_gives_up(monkeypatch):
+    scheduler = RateLimitScheduler()
+    monkeypatch.setattr(scheduler, "_backoff", lambda lane, seconds: None)
+    try:
+        raise RuntimeError("all backends failed") from ServerError(500)
+    except RuntimeError as e:
+        wrapped = e
+    call, calls = flaky(wrapped, failures=10)
+
+    with pytest.raises(RuntimeError):
+        scheduler.run(Lane("a"), 1, call, max_attempts=DEFAULT_MAX_ATTEMPTS)
+    assert len(calls) == DEFAULT_MAX_ATTEMPTS
+
+    assert transient_retry_delay(ServerError(400), 1) is None
+    assert transient_retry_delay(ValueError(), 1) is None
+
+
+def test_transient_backoff_checks_cancellation(monkeypatch):
+    scheduler = RateLimitScheduler()
+    monkeypatch.setattr(rate_limiter, "TRANSIENT_RETRY_BASE", 10.0)
+    checks = []
+
+    def check_cancelled():
+        checks.append(1)
+        if len(checks) > 1:
+            raise RuntimeError("cancelled")
+
+    call, calls = flaky(ServerError(502))
+    with pytest.raises(RuntimeError, match="cancelled"):
+        scheduler.run(Lane("a", check_cancelled=check_cancelled), 1, call)
+    assert len(calls) == 1
@@ -0,0 +1,116 @@
+import pytest
+
+import response_cache
+from response_cache import (
+    ResponseCache,
+    SimilarityIndex,
+    canonical_brief,
+    dedupe_similar,
+    make_cache_key,
+    similarity_text,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_cache_key_depends_on_every_part():
+    base = make_cache_key("gpt-4.1", 0.7, "system", "prompt")
+    assert base == make_cache_key("gpt-4.1", 0.7, "system", "prompt")
+    assert base != make_cache_key("gpt-4.1-mini", 0.7, "system", "prompt")
+    assert base != make_cache_key("gpt-4.1", 0.2, "system", "prompt")
+    assert base != make_cache_key("gpt-4.1", 0.7, "other", "prompt")
+    assert base != make_cache_key("gpt-4.1", 0.7, "system", "other")
+
+
+def test_canonical_brief_ignores_cosmetic_differences():
+    a = {"prompt_name": "첫 번째", "brand": "Nicomori", "subject": "카페   테라스\n\n 여성 "}
+    b = {"subject": "카페 테라스\n여성", "brand": "NICOMORI", "prompt_name": "두 번째"}
+    assert canonical_brief(a) == canonical_brief(b)
+    assert canonical_brief(a) != canonical_brief({**b, "subject": "카페 테라스 남성"})
+
+
+def test_canonical_brief_normalizes_unicode_composition():
+    composed = {"subject": "\uac00"}
+    decomposed = {"subject": "\u1100\u1161"}
+    assert canonical_brief(composed) == canonical_brief(decomposed)
+
+
+def test_similarity_text_uses_values_only():
+    assert similarity_text({"prompt_name": "x", "brand": "A", "subject": "b"}) == "a\nb"
+
+
+def test_get_set_and_stats(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    assert cache.get("k") is None
+    cache.set("k", "v")
+    assert cache.get("k") == "v"
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "entries": 1}
+    assert cache.get("k", record_stats=False) == "v"
+    assert cache.hits == 1
+
+
+def test_ttl_expires_entries(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=60)
+    cache.set("k", "v")
+    clock[0] += 59
+    assert cache.get("k") == "v"
+    assert cache.cached_keys(["k"]) == {"k"}
+    clock[0] += 2
+    assert cache.cached_keys(["k"]) == set()
+    assert cache.get("k") is None
+    assert len(cache) == 0
+
+
+def test_lru_evicts_least_recently_used(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.set("a", "1")
+    clock[0] += 1
+    cache.set("b", "2")
+    clock[0] += 1
+    assert cache.get("a") == "1"  # a 가 최근 사용
+    clock[0] += 1
+    cache.set("c", "3")
+    assert cache.cached_keys(["a", "b", "c"]) == {"a", "c"}
+
+
+def test_prompts_follow_responses(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_entries=1)
+    cache.set("a", "1", text="first", namespace="text")
+    clock[0] += 1
+    cache.set("b", "2", text="second", namespace="text")
+    assert cache.load_prompts() == [("b", "text", "second")]
+    cache.clear()
+    assert cache.load_prompts() == [] and len(cache) == 0
+
+
+def test_cache_persists_across_instances(tmp_path):
+    path = str(tmp_path / "nested" / "cache.sqlite3")
+    ResponseCache(path).set("k", "v")
+    assert ResponseCache(path).get("k") == "v"
+
+
+def test_similarity_index_lookup_and_namespaces():
+    index = SimilarityIndex(ngram=3)
+    index.add("a", "카페 테라스에서 노트북으로 일하는 20대 여성", namespace="text")
+    assert index.lookup("카페 테라스에서 노트북으로 일하는 20대 여성", 0.9, namespace="text") == ("a", 1.0)
+    assert index.lookup("카페 테라스에서 노트북으로 일하는 20대 여성", 0.9, namespace="structured") is None
+    assert index.lookup("바닷가에서 뛰는 강아지", 0.5, namespace="text") is None
+    assert index.stats()["hits"] == 1 and index.stats()["misses"] == 2
+
+
+def test_similarity_index_is_bounded():
+    index = SimilarityIndex(max_entries=2)
+    for key in "abc":
+        index.add(key, f"text {key}")
+    assert len(index) == 2
+    assert index.lookup("text a", 0.99) is None
+
+
+def test_dedupe_similar_keeps_first_of_each_group():
+    texts = ["카페 테라스의 여성", "카페 테라스의  여성", "바닷가의 강아지"]
+    assert dedupe_similar(texts, 0.9) == [0, 2]
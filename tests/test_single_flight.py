@@ -0,0 +1,189 @@
+import threading
+import time
+
+import pytest
+
+from rate_limiter import Lane, RateLimitScheduler
+from single_flight import SingleFlight
+from telemetry import Telemetry
+from usage_stats import ScopedUsageLog
+
+
+def wait_until(predicate, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def start_leader(flight: SingleFlight, key: str, fn):
+    # 대표 호출을 다른 스레드에서 시작하고, fn 이 실행되기 시작할 때까지 기다림
+    entered, result = threading.Event(), {}
+
+    def leader_fn():
+        entered.set()
+        return fn()
+
+    def run():
+        try:
+            result["value"] = flight.do(key, leader_fn)
+        except Exception as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert entered.wait(5)
+    return thread, result
+
+
+def test_do_runs_leader_and_shares_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    thread, leader = start_leader(flight, "k", lambda: release.wait(5) and "answer")
+
+    follower = {}
+    follower_thread = threading.Thread(target=lambda: follower.update(value=flight.do("k", lambda: "other")))
+    follower_thread.start()
+    wait_until(lambda: flight.coalesced == 1)
+    release.set()
+    thread.join(5)
+    follower_thread.join(5)
+
+    assert leader["value"] == ("answer", False)
+    assert follower["value"] == ("answer", True)
+    assert flight.stats() == {"leaders": 1, "coalesced": 1, "in_flight": 0}
+
+
+def test_do_propagates_leader_error_to_followers():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError("boom")
+
+    thread, leader = start_leader(flight, "k", fail)
+    follower = {}
+
+    def join():
+        try:
+            flight.do("k", lambda: "unused")
+        except ValueError as e:
+            follower["error"] = e
+
+    follower_thread = threading.Thread(target=join)
+    follower_thread.start()
+    wait_until(lambda: flight.coalesced == 1)
+    release.set()
+    thread.join(5)
+    follower_thread.join(5)
+    assert str(leader["error"]) == "boom"
+    assert follower["error"] is leader["error"]
+
+
+def test_finished_key_starts_a_new_call():
+    flight = SingleFlight()
+    assert flight.do("k", lambda: 1) == (1, False)
+    assert flight.do("k", lambda: 2) == (2, False)
+    assert flight.leaders == 2 and len(flight) == 0
+
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: "a") == ("a", False)
+    assert flight.do("b", lambda: "b") == ("b", False)
+    assert flight.coalesced == 0
+
+
+def test_stream_replays_all_chunks_to_late_joiner():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def chunks():
+        yield "a"
+        release.wait(5)
+        yield "b"
+
+    first, shared_first = flight.stream("k", chunks)
+    assert next(first) == "a"
+    second, shared_second = flight.stream("k", lambda: iter(["unused"]))
+    release.set()
+    assert (shared_first, shared_second) == (False, True)
+    assert "a" + "".join(first) == "ab"
+    assert "".join(second) == "ab"
+
+
+def test_stream_error_is_raised_to_every_reader():
+    flight = SingleFlight()
+
+    def chunks():
+        yield "a"
+        raise RuntimeError("cut")
+
+    reader, _ = flight.stream("k", chunks)
+    with pytest.raises(RuntimeError):
+        list(reader)
+
+
+def upstream(scheduler: RateLimitScheduler, usage_log: list, state: dict, gate: threading.Semaphore):
+    # ask_openai_stream 과 같은 구조: 슬롯을 잡고 청크를 내보내다가, 닫히면 받은 만큼의 사용량을 기록
+    def chunks():
+        received = []
+        try:
+            with scheduler.acquire(Lane("s"), 1):
+                for index in range(1000):
+                    assert gate.acquire(timeout=5)
+                    received.append("x")
+                    state["produced"] = index + 1
+                    yield "x"
+        finally:
+            state["closed"] = True
+            usage_log.append({"prompt_tokens": 100, "completion_tokens": len(received)})
+
+    return chunks
+
+
+def test_cancelled_stream_closes_upstream_and_counts_late_usage():
+    flight = SingleFlight()
+    scheduler = RateLimitScheduler()
+    telemetry = Telemetry()
+    usage_log = ScopedUsageLog([])
+    state = {}
+    gate = threading.Semaphore(1)
+
+    deltas, _ = flight.stream("k", upstream(scheduler, usage_log, state, gate))
+    assert next(deltas) == "x"
+    # 미리 생성 작업이 취소됨: 워커는 이 시점까지의 기록만 보고, 늦게 오는 사용량은 listener 로 셈
+    deltas.close()
+    records = usage_log.follow(
+        lambda record: telemetry.count(
+            "speculative_wasted_tokens", record["prompt_tokens"] + record["completion_tokens"]
+        )
+    )
+    assert records == []
+    # 다음 청크가 도착하면 펌프가 업스트림을 닫음
+    gate.release()
+    wait_until(lambda: state.get("closed"))
+
+    assert state["produced"] == 2
+    assert scheduler.stats()["in_flight"] == 0
+    assert len(flight) == 0
+    [record] = usage_log
+    assert telemetry.counters()["speculative_wasted_tokens"] == 100 + record["completion_tokens"]
+
+
+def test_stream_keeps_running_while_a_follower_reads():
+    flight = SingleFlight()
+    scheduler = RateLimitScheduler()
+    state = {}
+    gate = threading.Semaphore(0)
+
+    leader, _ = flight.stream("k", upstream(scheduler, [], state, gate))
+    follower, shared = flight.stream("k", lambda: iter(["unused"]))
+    assert shared
+    leader.close()
+    for _ in range(1000):
+        gate.release()
+    assert "".join(follower) == "x" * 1000
+    assert state["produced"] == 1000
+    assert scheduler.stats()["in_flight"] == 0
@@ -0,0 +1,162 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+from telemetry import Telemetry, Trace, format_duration, phase_sort_key
+
+GOLDEN_PROMETHEUS = """\
+# HELP prompt_generator_phase_seconds Time spent in each generation phase.
+# TYPE prompt_generator_phase_seconds histogram
+prompt_generator_phase_seconds_bucket{phase="api",le="0.001"} 0
+prompt_generator_phase_seconds_bucket{phase="api",le="0.005"} 0
+prompt_generator_phase_seconds_bucket{phase="api",le="0.01"} 0
+prompt_generator_phase_seconds_bucket{phase="api",le="0.05"} 0
+prompt_generator_phase_seconds_bucket{phase="api",le="0.1"} 0
+prompt_generator_phase_seconds_bucket{phase="api",le="0.25"} 0
+prompt_generator_phase_seconds_bucket{phase="api",le="0.5"} 1
+prompt_generator_phase_seconds_bucket{phase="api",le="1.0"} 1
+prompt_generator_phase_seconds_bucket{phase="api",le="2.5"} 2
+prompt_generator_phase_seconds_bucket{phase="api",le="5.0"} 2
+prompt_generator_phase_seconds_bucket{phase="api",le="10.0"} 2
+prompt_generator_phase_seconds_bucket{phase="api",le="30.0"} 2
+prompt_generator_phase_seconds_bucket{phase="api",le="60.0"} 2
+prompt_generator_phase_seconds_bucket{phase="api",le="+Inf"} 2
+prompt_generator_phase_seconds_sum{phase="api"} 2.300000
+prompt_generator_phase_seconds_count{phase="api"} 2
+prompt_generator_phase_seconds_bucket{phase="total",le="0.001"} 0
+prompt_generator_phase_seconds_bucket{phase="total",le="0.005"} 0
+prompt_generator_phase_seconds_bucket{phase="total",le="0.01"} 0
+prompt_generator_phase_seconds_bucket{phase="total",le="0.05"} 0
+prompt_generator_phase_seconds_bucket{phase="total",le="0.1"} 0
+prompt_generator_phase_seconds_bucket{phase="total",le="0.25"} 0
+prompt_generator_phase_seconds_bucket{phase="total",le="0.5"} 1
+prompt_generator_phase_seconds_bucket{phase="total",le="1.0"} 1
+prompt_generator_phase_seconds_bucket{phase="total",le="2.5"} 1
+prompt_generator_phase_seconds_bucket{phase="total",le="5.0"} 2
+prompt_generator_phase_seconds_bucket{phase="total",le="10.0"} 2
+prompt_generator_phase_seconds_bucket{phase="total",le="30.0"} 2
+prompt_generator_phase_seconds_bucket{phase="total",le="60.0"} 2
+prompt_generator_phase_seconds_bucket{phase="total",le="+Inf"} 2
+prompt_generator_phase_seconds_sum{phase="total"} 3.400000
+prompt_generator_phase_seconds_count{phase="total"} 2
+# HELP prompt_generator_generations_total Finished generations by kind and outcome.
+# TYPE prompt_generator_generations_total counter
+prompt_generator_generations_total{kind="blocking",outcome="ok"} 1
+prompt_generator_generations_total{kind="stream",outcome="cancelled"} 1
+# HELP prompt_generator_events_total Generation events (cache hits, stream chunks, tokens, repairs).
+# TYPE prompt_generator_events_total counter
+prompt_generator_events_total{event="prompt_tokens"} 200
+prompt_generator_events_total{event="speculative_hit"} 1
+prompt_generator_events_total{event="stream_chunks"} 5
+"""
+
+
+def trace(kind: str, total: float, outcome: str = "ok", **phases) -> Trace:
+    # 소요 시간을 고정한 trace (finish 뒤에 total 을 덮어씀)
+    result = Trace(kind)
+    for name, seconds in phases.items():
+        result.add(name, seconds)
+    result.finish(outcome)
+    result.total = total
+    return result
+
+
+@pytest.fixture
+def telemetry():
+    telemetry = Telemetry(recent=3)
+    blocking = trace("blocking", 0.4, api=0.3)
+    blocking.count("cache_hit", 0)
+    blocking.count("prompt_tokens", 120)
+    stream = trace("stream", 3.0, "cancelled", api=2.0)
+    stream.count("prompt_tokens", 80)
+    stream.count("stream_chunks", 5)
+    telemetry.record(blocking)
+    telemetry.record(stream)
+    telemetry.count("speculative_hit")
+    telemetry.count("speculative_wasted", 0)
+    return telemetry
+
+
+def test_trace_accumulates_phases_and_skips_zero_counts():
+    result = Trace("structured")
+    with result.phase("extract"):
+        pass
+    result.add("api", 0.5)
+    result.add("api", 0.25)
+    result.count("validated")
+    result.count("validated")
+    result.count("repaired", 0)
+    result.count("prompt_tokens", 300)
+    assert result.phases["api"] == 0.75 and result.phases["extract"] >= 0
+    assert result.counters == {"validated": 2, "prompt_tokens": 300}
+    assert result.total is None
+
+    result.finish("error")
+    data = result.to_dict()
+    assert data["kind"] == "structured" and data["outcome"] == "error"
+    assert data["total"] >= 0 and data["counters"] == result.counters
+
+
+def test_record_finishes_open_traces():
+    telemetry = Telemetry()
+    open_trace = Trace("blocking")
+    telemetry.record(open_trace)
+    assert open_trace.total is not None and open_trace.outcome == "ok"
+    assert telemetry.recent() == [open_trace]
+
+
+def test_counters_add_up_across_traces_and_events(telemetry):
+    assert telemetry.counters() == {"prompt_tokens": 200, "stream_chunks": 5, "speculative_hit": 1}
+
+
+def test_summary_aggregates_recent_traces_in_phase_order(telemetry):
+    telemetry.observe(telemetry.recent()[0], "render", 0.02)
+    telemetry.record(trace("blocking", 1.0, cache=0.01, api=0.8))
+    assert telemetry.summary() == [
+        {"phase": "cache", "count": 1, "p50": 0.01, "p95": 0.01},
+        {"phase": "api", "count": 3, "p50": 0.8, "p95": 2.0},
+        {"phase": "render", "count": 1, "p50": 0.02, "p95": 0.02},
+        {"phase": "total", "count": 3, "p50": 1.0, "p95": 3.0},
+    ]
+    # 최근 n 건만
+    assert telemetry.summary(1) == [
+        {"phase": "cache", "count": 1, "p50": 0.01, "p95": 0.01},
+        {"phase": "api", "count": 1, "p50": 0.8, "p95": 0.8},
+        {"phase": "total", "count": 1, "p50": 1.0, "p95": 1.0},
+    ]
+    # 보관 건수(recent=3)를 넘으면 오래된 것부터 빠짐
+    telemetry.record(trace("blocking", 0.1, api=0.05))
+    assert [row["count"] for row in telemetry.summary() if row["phase"] == "total"] == [3]
+
+
+def test_render_prometheus_golden(telemetry):
+    assert telemetry.render_prometheus() == GOLDEN_PROMETHEUS
+
+
+def test_metrics_file_and_http_endpoint(tmp_path, telemetry):
+    metrics_path = tmp_path / "metrics" / "prompt_generator.prom"
+    telemetry.metrics_path = str(metrics_path)
+    telemetry.count("speculative_miss")
+    assert metrics_path.read_text(encoding="utf-8") == telemetry.render_prometheus()
+
+    server = telemetry.serve(0)
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{base}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert response.read().decode("utf-8") == telemetry.render_prometheus()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{base}/other")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_phase_order_and_duration_format():
+    assert sorted(["total", "custom", "render", "api", "prompt"], key=phase_sort_key) == [
+        "prompt", "api", "render", "custom", "total",
+    ]
+    assert format_duration(0.0042) == "4.2ms"
+    assert format_duration(0.25) == "250ms"
+    assert format_duration(3.456) == "3.46s"
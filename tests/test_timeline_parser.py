@@ -0,0 +1,72 @@
+from timeline_parser import (
+    TimelineSegment,
+    fill_timeline,
+    format_seconds,
+    parse_timeline,
+    timeline_skeleton,
+    validate_timeline,
+)
+
+
+def test_parse_timeline_formats():
+    text = (
+        "0-3초: 카페 전경\n"
+        "- 3~6s 인물이 노트북을 연다\n"
+        "00:06 - 00:08.5 클로즈업\n"
+    )
+    assert parse_timeline(text) == [
+        TimelineSegment(0, 3, "카페 전경"),
+        TimelineSegment(3, 6, "인물이 노트북을 연다"),
+        TimelineSegment(6, 8.5, "클로즈업"),
+    ]
+
+
+def test_parse_timeline_joins_continuation_lines():
+    segments = parse_timeline("0-3초: 카페 전경\n  햇살이 들어온다\n\n3-5초: 미소")
+    assert [segment.description for segment in segments] == ["카페 전경 햇살이 들어온다", "미소"]
+
+
+def test_parse_timeline_without_segments():
+    assert parse_timeline("") == []
+    assert parse_timeline(None) == []
+    assert parse_timeline("그냥 설명만 있는 타임라인") == []
+
+
+def test_format_seconds():
+    assert format_seconds(0) == "00:00"
+    assert format_seconds(75) == "01:15"
+    assert format_seconds(2.5) == "00:02.5"
+
+
+def test_validate_timeline_reports_gaps_overlaps_and_overruns():
+    segments = [
+        TimelineSegment(0, 3, "a"),
+        TimelineSegment(4, 6, "b"),
+        TimelineSegment(5, 9, "c"),
+        TimelineSegment(9, 9, "d"),
+    ]
+    issues = validate_timeline(segments, duration=8)
+    assert issues == [
+        "00:03-00:04 구간이 비어 있음",
+        "3번 구간이 00:05-00:06 에서 앞 구간과 겹침",
+        "3번 구간(00:05-00:09)이 영상 길이(00:08)를 넘음",
+        "4번 구간(00:09-00:09): 끝 시간이 시작 시간보다 빠르거나 같음",
+    ]
+
+
+def test_validate_timeline_reports_trailing_gap():
+    assert validate_timeline([TimelineSegment(0, 5, "a")], duration=8) == ["00:05-00:08 구간이 비어 있음"]
+    assert validate_timeline([TimelineSegment(0, 8, "a")], duration=8) == []
+
+
+def test_skeleton_and_fill():
+    segments = parse_timeline("0-3초: a\n3-6초: b")
+    assert timeline_skeleton(segments) == [
+        {"sequence": 1, "timestamp": "00:00-00:03", "action": "___", "audio": "___"},
+        {"sequence": 2, "timestamp": "00:03-00:06", "action": "___", "audio": "___"},
+    ]
+    # 모델이 구간을 덜 돌려주면 나머지는 none
+    assert fill_timeline(segments, [{"action": "걷는다", "audio": ""}]) == [
+        {"sequence": 1, "timestamp": "00:00-00:03", "action": "걷는다", "audio": "none"},
+        {"sequence": 2, "timestamp": "00:03-00:06", "action": "none", "audio": "none"},
+    ]
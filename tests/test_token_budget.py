@@ -0,0 +1,71 @@
+import math
+
+import token_budget
+from prompt_core import COMFYUI_JSON_TEMPLATE, DEFAULT_BRIEF, SYSTEM_INSTRUCTION, build_combined_prompt
+from token_budget import (
+    MIN_RESERVED_TOKENS,
+    OUTPUT_HEADROOM,
+    TRUNCATION_MARK,
+    count_tokens,
+    expected_output_tokens,
+    fit_brief,
+    plan_request,
+    reserved_tokens_for,
+    truncate_to_tokens,
+)
+
+
+def test_count_tokens_fallback(monkeypatch):
+    monkeypatch.setattr(token_budget, "_encoding", lambda: None)
+    assert count_tokens("") == 0
+    assert count_tokens("abcdefgh") == 2
+    assert count_tokens("카페 abcd") == 2 + 2
+
+
+def test_truncate_to_tokens_cuts_on_line_boundary(monkeypatch):
+    monkeypatch.setattr(token_budget, "_encoding", lambda: None)
+    text = "0-3초: " + "a" * 40 + "\n3-6초: " + "b" * 40
+    assert truncate_to_tokens(text, 1000) == text
+    cut = truncate_to_tokens(text, 20)
+    assert cut.endswith(TRUNCATION_MARK)
+    assert "3-6초" not in cut and cut.startswith("0-3초")
+
+
+def test_fit_brief_truncates_or_warns(monkeypatch):
+    monkeypatch.setattr(token_budget, "_encoding", lambda: None)
+    brief = {**DEFAULT_BRIEF, "extra": "가" * 1000, "unknown": "나" * 1000}
+
+    fitted, warnings = fit_brief(brief)
+    assert count_tokens(fitted["extra"]) <= 400 + count_tokens(TRUNCATION_MARK)
+    assert fitted["unknown"] == brief["unknown"]
+    assert len(warnings) == 1 and warnings[0].startswith("extra:")
+
+    kept, warnings = fit_brief(brief, truncate=False)
+    assert kept == brief
+    assert len(warnings) == 1
+
+
+def test_expected_output_tokens_scales_with_sections_and_timeline():
+    full = expected_output_tokens()
+    assert expected_output_tokens(timeline_items=6) > full
+    assert expected_output_tokens(["style"], include_midjourney=False, notes=False) < full
+    assert expected_output_tokens([], include_midjourney=False, notes=False) == 0
+    assert expected_output_tokens(list(COMFYUI_JSON_TEMPLATE)) == full
+
+
+def test_reserved_tokens_for():
+    assert reserved_tokens_for(0) == MIN_RESERVED_TOKENS
+    assert reserved_tokens_for(1000) == math.ceil(1000 * OUTPUT_HEADROOM)
+
+
+def test_plan_request():
+    prompt = build_combined_prompt(DEFAULT_BRIEF)
+    plan = plan_request(SYSTEM_INSTRUCTION, prompt, 500, ("field warning",))
+    assert plan.prompt_tokens == count_tokens(prompt)
+    assert plan.input_tokens > plan.system_tokens + plan.prompt_tokens
+    assert plan.expected_output_tokens == 500
+    assert plan.reserved_output_tokens == reserved_tokens_for(500)
+    assert plan.warnings == ("field warning",)
+
+    long_plan = plan_request(SYSTEM_INSTRUCTION, "단어 " * 3000, 500)
+    assert len(long_plan.warnings) == 1
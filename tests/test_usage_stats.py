@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+from usage_stats import ScopedUsageLog, estimate_cost, percentile, usage_record
+
+
+def test_scoped_usage_log_keeps_job_records_apart():
+    session = [{"mode": "earlier"}]
+    job_a, job_b = ScopedUsageLog(session), ScopedUsageLog(session)
+    job_a.append({"mode": "a"})
+    job_b.append({"mode": "b"})
+    job_a.append({"mode": "a2"})
+    assert [r["mode"] for r in job_a] == ["a", "a2"]
+    assert [r["mode"] for r in job_b] == ["b"]
+    assert [r["mode"] for r in session] == ["earlier", "a", "b", "a2"]
+
+
+def test_usage_record_reads_cached_tokens():
+    usage = SimpleNamespace(
+        prompt_tokens=1000, completion_tokens=100, prompt_tokens_details=SimpleNamespace(cached_tokens=800)
+    )
+    record = usage_record(usage, "gpt-4.1", "text", 1.5)
+    assert (record["prompt_tokens"], record["cached_tokens"], record["completion_tokens"]) == (1000, 800, 100)
+    assert record["cost"] == estimate_cost("gpt-4.1", 1000, 800, 100)
+    assert usage_record(None, "gpt-4.1", "stream", 0.1)["prompt_tokens"] == 0
+
+
+def test_percentile():
+    assert percentile([], 0.95) == 0.0
+    assert percentile([3, 1, 2], 0.5) == 2
+    assert percentile(list(range(101)), 0.95) == 95
+
+
+def test_scoped_usage_log_follow_reports_later_records():
+    parent = []
+    log = ScopedUsageLog(parent)
+    log.append({"n": 1})
+    late = []
+    assert log.follow(late.append) == [{"n": 1}]
+    log.append({"n": 2})
+    assert late == [{"n": 2}]
+    assert parent == [{"n": 1}, {"n": 2}]
@@ -0,0 +1,123 @@
+import json
+import os
+import struct
+import zipfile
+
+import pytest
+
+from workflow_export import (
+    ARCHIVE_NAME,
+    BUNDLE_NAME,
+    INDEX_NAME,
+    MANIFEST_NAME,
+    BundleReader,
+    BundleWriter,
+    ExportError,
+    iter_batch_results,
+    main,
+    scene_filename,
+)
+
+
+def scene(name: str, brand: str = "니코모리", **extra) -> dict:
+    return {"prompt_name": name, "brand": brand, "comfyui_json": {"scene": name, "brand": brand}, **extra}
+
+
+def test_scene_filename():
+    assert scene_filename("카페 테라스 / 낮", "니코모리", 3) == "00003-니코모리-카페_테라스_낮.json"
+    assert scene_filename("", "", None) == "scene.json"
+    assert len(scene_filename("x" * 200)) == 80 + len(".json")
+
+
+def test_round_trip(tmp_path):
+    out = str(tmp_path / "bundle")
+    with BundleWriter(out) as writer:
+        writer.add(scene("카페 씬", mj="cafe --ar 16:9"))
+        writer.add({"brief": {"prompt_name": "Night Walk", "brand": "Acme"}, "comfyui_json": {"scene": "night"}})
+        writer.add(scene("카페 씬", brand="Acme"))
+        writer.add({"prompt_name": "실패", "comfyui_json": None})
+    assert writer.count == 3 and writer.skipped == 1
+    assert not os.path.exists(out + ".partial")
+
+    manifest = json.loads((tmp_path / "bundle" / MANIFEST_NAME).read_text(encoding="utf-8"))
+    assert manifest["scenes"] == 3 and manifest["skipped"] == 1
+    assert manifest["files"][0] == "scenes/00001-니코모리-카페_씬.json"
+    for filename in manifest["files"]:
+        assert os.path.exists(os.path.join(out, filename))
+    with zipfile.ZipFile(os.path.join(out, ARCHIVE_NAME)) as archive:
+        assert archive.namelist() == manifest["files"]
+    lines = (tmp_path / "bundle" / BUNDLE_NAME).read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["index"] for line in lines] == [0, 1, 2]
+
+    with BundleReader(out) as reader:
+        [found] = reader.lookup("카페 씬", "니코모리")
+        assert found["comfyui_json"] == {"scene": "카페 씬", "brand": "니코모리"}
+        assert found["midjourney_prompt"] == "cafe --ar 16:9"
+        # 이름만으로 찾으면 브랜드와 관계없이 장면 번호 순
+        assert [item["brand"] for item in reader.lookup("  카페   씬 ")] == ["니코모리", "Acme"]
+        assert reader.lookup("night walk", "ACME")[0]["comfyui_json"] == {"scene": "night"}
+        assert reader.lookup("카페 씬", "Other") == []
+        assert reader.lookup("없는 장면") == []
+
+
+def test_empty_bundle(tmp_path):
+    out = str(tmp_path / "empty")
+    with BundleWriter(out, archive=False) as writer:
+        pass
+    assert not os.path.exists(os.path.join(out, ARCHIVE_NAME))
+    with BundleReader(out) as reader:
+        assert reader.lookup("anything") == []
+
+
+def test_close_replaces_existing_bundle(tmp_path):
+    out = str(tmp_path / "bundle")
+    with BundleWriter(out) as writer:
+        writer.add(scene("old"))
+    with BundleWriter(out) as writer:
+        writer.add(scene("new"))
+    assert sorted(os.listdir(tmp_path)) == ["bundle"]
+    with BundleReader(out) as reader:
+        assert reader.lookup("old") == []
+        assert len(reader.lookup("new")) == 1
+    with pytest.raises(ExportError):
+        writer.close()
+
+
+def test_abort_keeps_previous_bundle(tmp_path):
+    out = str(tmp_path / "bundle")
+    with BundleWriter(out) as writer:
+        writer.add(scene("kept"))
+    with pytest.raises(RuntimeError):
+        with BundleWriter(out) as writer:
+            writer.add(scene("lost"))
+            raise RuntimeError("generation failed")
+    assert sorted(os.listdir(tmp_path)) == ["bundle"]
+    with BundleReader(out) as reader:
+        assert len(reader.lookup("kept")) == 1
+        assert reader.lookup("lost") == []
+
+
+def test_reader_rejects_unknown_index(tmp_path):
+    out = str(tmp_path / "bundle")
+    with BundleWriter(out) as writer:
+        writer.add(scene("a"))
+    with open(os.path.join(out, INDEX_NAME), "r+b") as f:
+        f.write(struct.pack("<4s", b"XXXX"))
+    with pytest.raises(ExportError):
+        BundleReader(out)
+
+
+def test_cli_exports_only_successful_batch_records(tmp_path):
+    results = tmp_path / "results.jsonl"
+    records = [
+        {"ok": True, "index": 0, **scene("a")},
+        {"ok": False, "index": 1, "error": "rate limited"},
+        {"ok": True, "index": 2, "prompt_name": "b", "comfyui_json": None},
+    ]
+    results.write_text("\n".join(json.dumps(record, ensure_ascii=False) for record in records) + "\n", encoding="utf-8")
+    assert [record["index"] for record in iter_batch_results(str(results))] == [0, 2]
+
+    out = tmp_path / "bundle"
+    assert main([str(results), "-o", str(out), "--no-archive"]) == 0
+    manifest = json.loads((out / MANIFEST_NAME).read_text(encoding="utf-8"))
+    assert manifest["scenes"] == 1 and manifest["skipped"] == 1 and manifest["archive"] is None
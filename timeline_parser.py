@@ -0,0 +1,98 @@
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+# ==============================================================================
+# 씬별 타임라인 텍스트 → 구간 목록 (API 호출 없이 로컬에서 계산)
+#   "0-3초: ...", "3~6s ...", "00:06 - 00:08 ..." 같은 줄을 구간으로 인식하고,
+#   구간 시작 패턴이 없는 줄은 앞 구간 설명에 이어 붙임
+# ==============================================================================
+_TIME = r"(\d{1,2}:\d{2}(?:\.\d+)?|\d+(?:\.\d+)?)\s*(?:초|secs?|seconds?|s)?"
+_SEGMENT_LINE = re.compile(
+    rf"^\s*(?:[-*•]\s*)?{_TIME}\s*(?:-|~|–|—|to)\s*{_TIME}\s*[:：)\]\-–—]?\s*(.*)$",
+    re.IGNORECASE,
+)
+
+
+@dataclass(frozen=True)
+class TimelineSegment:
+    start: float
+    end: float
+    description: str
+
+    @property
+    def timestamp(self) -> str:
+        return f"{format_seconds(self.start)}-{format_seconds(self.end)}"
+
+
+def _to_seconds(value: str) -> float:
+    if ":" in value:
+        minutes, seconds = value.split(":")
+        return int(minutes) * 60 + float(seconds)
+    return float(value)
+
+
+def format_seconds(seconds: float) -> str:
+    # MM:SS (소수점 초는 그대로 유지: 00:02.5)
+    minutes, rest = divmod(seconds, 60)
+    if rest == int(rest):
+        return f"{int(minutes):02d}:{int(rest):02d}"
+    return f"{int(minutes):02d}:{rest:04.1f}"
+
+
+def parse_timeline(text: str) -> list:
+    segments = []
+    for line in (text or "").splitlines():
+        match = _SEGMENT_LINE.match(line)
+        if match:
+            start, end, description = match.groups()
+            segments.append([_to_seconds(start), _to_seconds(end), description.strip()])
+        elif segments and line.strip():
+            segments[-1][2] = (segments[-1][2] + " " + line.strip()).strip()
+    return [TimelineSegment(start, end, description) for start, end, description in segments]
+
+
+def validate_timeline(segments: list, duration: Optional[float] = None) -> list:
+    # 구간 순서대로 빈 구간 / 겹침 / 영상 길이 초과를 검사해서 문제 설명 목록을 반환
+    issues = []
+    cursor = 0.0
+    for number, segment in enumerate(segments, start=1):
+        if segment.end <= segment.start:
+            issues.append(f"{number}번 구간({segment.timestamp}): 끝 시간이 시작 시간보다 빠르거나 같음")
+            continue
+        if segment.start > cursor:
+            issues.append(f"{format_seconds(cursor)}-{format_seconds(segment.start)} 구간이 비어 있음")
+        elif segment.start < cursor:
+            issues.append(
+                f"{number}번 구간이 {format_seconds(segment.start)}-{format_seconds(cursor)} 에서 앞 구간과 겹침"
+            )
+        if duration is not None and segment.end > duration:
+            issues.append(f"{number}번 구간({segment.timestamp})이 영상 길이({format_seconds(duration)})를 넘음")
+        cursor = max(cursor, segment.end)
+
+    if segments and duration is not None and cursor < duration:
+        issues.append(f"{format_seconds(cursor)}-{format_seconds(duration)} 구간이 비어 있음")
+    return issues
+
+
+def timeline_skeleton(segments: list) -> list:
+    # ComfyUI JSON "timeline" 배열의 구조 부분 (action / audio 는 모델이 작성)
+    return [
+        {"sequence": number, "timestamp": segment.timestamp, "action": "___", "audio": "___"}
+        for number, segment in enumerate(segments, start=1)
+    ]
+
+
+def fill_timeline(segments: list, prose: list) -> list:
+    # 모델이 쓴 action / audio 를 로컬에서 계산한 sequence / timestamp 와 합침.
+    # 모델이 구간 수를 다르게 돌려준 경우 모자란 구간은 "none" 으로 채움
+    timeline = []
+    for number, segment in enumerate(segments, start=1):
+        item = prose[number - 1] if number <= len(prose) else {}
+        timeline.append({
+            "sequence": number,
+            "timestamp": segment.timestamp,
+            "action": item.get("action") or "none",
+            "audio": item.get("audio") or "none",
+        })
+    return timeline
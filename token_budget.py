@@ -0,0 +1,174 @@
+import json
+import math
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+from prompt_core import COMFYUI_JSON_TEMPLATE, DEFAULT_BRIEF, MODEL_NAME
+
+# ==============================================================================
+# 요청 전 토큰 예산 (API 호출 없이 로컬에서 계산)
+#   - 입력: 시스템 / 사용자 프롬프트 토큰 수. 긴 자유 입력 필드는 필드별 상한을 넘으면 경고하거나 잘라냄
+#   - 출력: [JSON 템플릿] 의 섹션 / 타임라인 구간 수로 예상 출력 길이를 계산 (미리보기 표시와 분당 토큰 한도 예약에만 사용.
+#           근사치라 API 의 max_tokens 로는 보내지 않음 – 상한에 걸려 잘리면 JSON 이 깨짐)
+# 토크나이저는 tiktoken 이 설치돼 있으면 사용하고, 없으면 보수적으로(많게) 근사
+# ==============================================================================
+
+# 자유 입력 필드별 토큰 상한 (여기에 없는 필드는 DEFAULT_FIELD_TOKEN_LIMIT)
+FIELD_TOKEN_LIMITS = {
+    "timeline_detail": 600,
+    "extra": 400,
+    "character_detail": 300,
+    "action": 300,
+    "background": 300,
+}
+DEFAULT_FIELD_TOKEN_LIMIT = 200
+# 사용자 프롬프트 전체 상한 (넘으면 경고만 함 – 어느 필드를 줄일지는 사용자가 판단)
+PROMPT_TOKEN_BUDGET = 2000
+
+# 출력 예상치: 템플릿 값 하나 / 타임라인 action·audio 하나 / 미드저니 한 줄 / 누락 목록 등 설명 부분
+VALUE_TOKENS = 12
+TIMELINE_VALUE_TOKENS = 45
+MIDJOURNEY_TOKENS = 90
+NOTES_TOKENS = 220
+# 분당 토큰 한도에서 미리 차감할 출력 토큰 = 예상치 × 여유 배수
+OUTPUT_HEADROOM = 1.8
+MIN_RESERVED_TOKENS = 256
+
+# 메시지 하나당 role / 구분자 토큰, 응답 시작 토큰 (OpenAI chat 형식 기준 근사)
+MESSAGE_OVERHEAD_TOKENS = 3
+REPLY_OVERHEAD_TOKENS = 3
+
+PLACEHOLDER = "___"
+TRUNCATION_MARK = " …(이하 생략)"
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(MODEL_NAME)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+_ASCII = re.compile(r"[\x00-\x7f]+")
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # 근사: 영문 / 기호는 약 4글자당 1토큰, 한글 등 그 외 문자는 글자당 1토큰
+    ascii_chars = sum(len(run) for run in _ASCII.findall(text))
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+@lru_cache(maxsize=32)
+def count_system_tokens(system_instruction: str) -> int:
+    # 시스템 지시문은 몇 가지 고정 문자열뿐이므로 한 번만 셈
+    return count_tokens(system_instruction)
+
+
+def truncate_to_tokens(text: str, limit: int) -> str:
+    # 상한까지만 남기고, 가능하면 줄 단위로 자름 (타임라인 구간이 중간에서 끊기지 않도록)
+    if count_tokens(text) <= limit:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= limit:
+            low = middle
+        else:
+            high = middle - 1
+    cut = text[:low]
+    if "\n" in cut:
+        cut = cut[:cut.rindex("\n")]
+    return cut.rstrip() + TRUNCATION_MARK
+
+
+def fit_brief(brief: dict, truncate: bool = True) -> tuple:
+    # (예산을 적용한 브리프, 경고 문구 목록). truncate=False 면 경고만 하고 브리프는 그대로
+    fitted = dict(brief)
+    warnings = []
+    for key, value in brief.items():
+        if not isinstance(value, str) or key not in DEFAULT_BRIEF:
+            continue
+        limit = FIELD_TOKEN_LIMITS.get(key, DEFAULT_FIELD_TOKEN_LIMIT)
+        tokens = count_tokens(value)
+        if tokens <= limit:
+            continue
+        if truncate:
+            fitted[key] = truncate_to_tokens(value, limit)
+            warnings.append(f"{key}: 약 {tokens:,} 토큰 → {limit:,} 토큰으로 잘라서 보냄")
+        else:
+            warnings.append(f"{key}: 약 {tokens:,} 토큰 (권장 상한 {limit:,})")
+    return fitted, warnings
+
+
+def _skeleton_tokens(value) -> tuple:
+    # (값을 비운 JSON 구조의 토큰 수, "___" 자리 수)
+    text = json.dumps(value, ensure_ascii=False, indent=2)
+    return count_tokens(text.replace(f'"{PLACEHOLDER}"', '""')), text.count(f'"{PLACEHOLDER}"')
+
+
+def comfyui_output_tokens(sections: Optional[list] = None, timeline_items: int = 3) -> int:
+    # 요청한 섹션(None 이면 전체)의 예상 출력 토큰. 타임라인은 구간 수에 비례
+    tokens = 2
+    for key in sections if sections is not None else COMFYUI_JSON_TEMPLATE:
+        value = COMFYUI_JSON_TEMPLATE[key]
+        if key == "timeline":
+            structure, _ = _skeleton_tokens(value[0])
+            tokens += timeline_items * (structure + 2 * TIMELINE_VALUE_TOKENS) + count_tokens(f'"{key}": []')
+            continue
+        structure, placeholders = _skeleton_tokens({key: value})
+        tokens += structure + placeholders * VALUE_TOKENS
+    return tokens
+
+
+def expected_output_tokens(
+    sections: Optional[list] = None,
+    include_midjourney: bool = True,
+    notes: bool = True,
+    timeline_items: int = 3,
+) -> int:
+    tokens = comfyui_output_tokens(sections, timeline_items) if sections != [] else 0
+    if include_midjourney:
+        tokens += MIDJOURNEY_TOKENS
+    if notes:
+        tokens += NOTES_TOKENS
+    return tokens
+
+
+def reserved_tokens_for(expected: int) -> int:
+    return max(MIN_RESERVED_TOKENS, math.ceil(expected * OUTPUT_HEADROOM))
+
+
+@dataclass(frozen=True)
+class RequestBudget:
+    system_tokens: int
+    prompt_tokens: int
+    expected_output_tokens: int
+    reserved_output_tokens: int
+    warnings: tuple = ()
+
+    @property
+    def input_tokens(self) -> int:
+        return self.system_tokens + self.prompt_tokens + 2 * MESSAGE_OVERHEAD_TOKENS + REPLY_OVERHEAD_TOKENS
+
+
+def plan_request(system_instruction: str, prompt: str, expected: int, warnings: tuple = ()) -> RequestBudget:
+    prompt_tokens = count_tokens(prompt)
+    if prompt_tokens > PROMPT_TOKEN_BUDGET:
+        warnings = (*warnings, f"사용자 프롬프트가 약 {prompt_tokens:,} 토큰으로 예산({PROMPT_TOKEN_BUDGET:,})을 넘음")
+    return RequestBudget(
+        system_tokens=count_system_tokens(system_instruction),
+        prompt_tokens=prompt_tokens,
+        expected_output_tokens=expected,
+        reserved_output_tokens=reserved_tokens_for(expected),
+        warnings=tuple(warnings),
+    )
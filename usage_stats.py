@@ -0,0 +1,101 @@
+import hashlib
+import threading
+import time
+from typing import Callable, Optional
+
+# ==============================================================================
+# 토큰 사용량 / 비용 / 지연 시간 기록
+# ==============================================================================
+
+# 모델별 단가 (USD / 1M tokens): (입력, 캐시된 입력, 출력)
+MODEL_PRICING = {
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gemini-2.0-flash": (0.10, 0.025, 0.40),
+}
+
+
+def prompt_fingerprint(text: str) -> str:
+    # 시스템 지시문이 호출마다 바이트 단위로 동일한지 확인하기 위한 짧은 해시
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+def estimate_cost(model: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> float:
+    if model not in MODEL_PRICING:
+        return 0.0
+    input_price, cached_price, output_price = MODEL_PRICING[model]
+    uncached_tokens = prompt_tokens - cached_tokens
+    return (
+        uncached_tokens * input_price
+        + cached_tokens * cached_price
+        + completion_tokens * output_price
+    ) / 1_000_000
+
+
+class ScopedUsageLog(list):
+    # 작업 하나의 사용량 기록. append 하면 세션 전체 기록(parent)에도 같이 남김.
+    # 요약 / 절약 계산은 이 목록만 보므로 같은 세션의 다른 작업(미리 생성 등)이 동시에 남긴 기록이 섞이지 않음
+    def __init__(self, parent: list):
+        super().__init__()
+        self.parent = parent
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def append(self, record: dict) -> None:
+        with self._lock:
+            super().append(record)
+            listeners = list(self._listeners)
+        self.parent.append(record)
+        for listener in listeners:
+            listener(record)
+
+    def follow(self, listener: Callable[[dict], None]) -> list:
+        # 지금까지의 기록을 돌려주고, 이후에 추가되는 기록은 listener 로 알림
+        # (작업이 끝난 뒤에 도착하는 사용량: 취소로 닫힌 스트림, 헤지에서 진 요청 등)
+        with self._lock:
+            self._listeners.append(listener)
+            return list(self)
+
+
+def usage_record(usage, model: str, mode: str, latency: float, ttft: Optional[float] = None) -> dict:
+    # usage: OpenAI 응답의 usage 객체 (스트리밍에서 include_usage 를 안 켰다면 None)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", 0) or 0
+    return {
+        "time": time.time(),
+        "model": model,
+        "mode": mode,
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "completion_tokens": completion_tokens,
+        "latency": latency,
+        "ttft": ttft,
+        "cost": estimate_cost(model, prompt_tokens, cached_tokens, completion_tokens),
+    }
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize_usage(records: list) -> dict:
+    prompt_tokens = sum(r["prompt_tokens"] for r in records)
+    cached_tokens = sum(r["cached_tokens"] for r in records)
+    ttfts = [r["ttft"] for r in records if r["ttft"] is not None]
+    return {
+        "calls": len(records),
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "cached_ratio": (cached_tokens / prompt_tokens) if prompt_tokens else 0.0,
+        "completion_tokens": sum(r["completion_tokens"] for r in records),
+        "cost": sum(r["cost"] for r in records),
+        "avg_latency": (sum(r["latency"] for r in records) / len(records)) if records else 0.0,
+        "avg_ttft": (sum(ttfts) / len(ttfts)) if ttfts else None,
+    }
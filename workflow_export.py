@@ -0,0 +1,255 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import shutil
+import struct
+import sys
+import time
+import zipfile
+from typing import Iterable, Optional
+
+# ==============================================================================
+# ComfyUI JSON 내보내기 번들 (생성 결과에서 파싱된 comfyui_json 만 모아 한 번에 기록)
+#   <out>/scenes/00001-<브랜드>-<프롬프트 이름>.json   장면별 ComfyUI JSON (그대로 붙여넣기 / 불러오기용)
+#   <out>/bundle.jsonl   장면 하나당 한 줄 {"index", "prompt_name", "brand", "file", "midjourney_prompt", "comfyui_json"}
+#   <out>/bundle.zip     scenes/*.json 을 압축한 아카이브 (archive=True 일 때)
+#   <out>/manifest.idx   bundle.jsonl 의 줄 위치 인덱스 (아래 형식). mmap 으로 열어 이진 탐색하면
+#                        번들 전체를 파싱하지 않고 (브랜드, 프롬프트 이름) 또는 프롬프트 이름만으로 장면을 찾음
+#   <out>/manifest.json  장면 수 / 파일 목록 / 생성 시각
+# 장면은 들어오는 대로 파일에 바로 쓰고(메모리에는 인덱스 레코드만 남음), <out>.partial 에 모두 쓴 뒤 한 번에 교체
+#
+# manifest.idx 형식 (little endian)
+#   헤더  : magic "PGMX" · version u32 · 레코드 수 u32
+#   레코드: key 해시 u64 · bundle.jsonl 바이트 오프셋 u64 · 줄 길이 u32 · 장면 번호 u32  (key 해시, 장면 번호 순 정렬)
+#   key 해시 = blake2b-8("<브랜드>\x1f<프롬프트 이름>") (공백 정리 + casefold).
+#   브랜드가 있는 장면은 브랜드를 비운 key 로도 한 번 더 등록 (프롬프트 이름만으로 조회)
+# ==============================================================================
+MANIFEST_MAGIC = b"PGMX"
+MANIFEST_VERSION = 1
+_HEADER = struct.Struct("<4sII")
+_RECORD = struct.Struct("<QQII")
+
+SCENES_DIR = "scenes"
+BUNDLE_NAME = "bundle.jsonl"
+ARCHIVE_NAME = "bundle.zip"
+INDEX_NAME = "manifest.idx"
+MANIFEST_NAME = "manifest.json"
+
+_UNSAFE_FILENAME = re.compile(r"[^\w.-]+")
+
+
+class ExportError(ValueError):
+    pass
+
+
+def _normalize(value) -> str:
+    return " ".join(str(value or "").split()).casefold()
+
+
+def manifest_key(prompt_name: str, brand: str = "") -> int:
+    key = f"{_normalize(brand)}\x1f{_normalize(prompt_name)}".encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+def scene_filename(prompt_name: str, brand: str = "", number: Optional[int] = None) -> str:
+    slug = _UNSAFE_FILENAME.sub("_", "-".join(part for part in (brand, prompt_name) if part)).strip("_.")
+    return (f"{number:05d}-" if number is not None else "") + f"{slug[:80] or 'scene'}.json"
+
+
+class BundleWriter:
+    def __init__(self, path: str, archive: bool = True):
+        self.path = path.rstrip("/\\")
+        self.count = 0
+        self.skipped = 0
+        self._partial = f"{self.path}.partial"
+        self._records = []  # (key 해시, 오프셋, 길이, 장면 번호)
+        self._files = []
+        if os.path.exists(self._partial):
+            shutil.rmtree(self._partial)
+        os.makedirs(os.path.join(self._partial, SCENES_DIR))
+        self._bundle = open(os.path.join(self._partial, BUNDLE_NAME), "wb")
+        self._archive = (
+            zipfile.ZipFile(os.path.join(self._partial, ARCHIVE_NAME), "w", zipfile.ZIP_DEFLATED) if archive else None
+        )
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add(self, scene: dict) -> Optional[str]:
+        # scene: 생성 결과 / 배치 결과 레코드 / 생성 기록 항목 (comfyui_json 이 없으면 건너뜀). 반환값은 장면 파일 경로
+        comfyui_json = scene.get("comfyui_json")
+        if comfyui_json is None:
+            self.skipped += 1
+            return None
+        self.count += 1
+        prompt_name = scene.get("prompt_name") or (scene.get("brief") or {}).get("prompt_name") or ""
+        brand = scene.get("brand") or (scene.get("brief") or {}).get("brand") or ""
+        filename = f"{SCENES_DIR}/{scene_filename(prompt_name, brand, self.count)}"
+
+        content = json.dumps(comfyui_json, ensure_ascii=False, indent=2).encode("utf-8")
+        with open(os.path.join(self._partial, filename), "wb") as f:
+            f.write(content)
+        if self._archive is not None:
+            self._archive.writestr(filename, content)
+
+        line = json.dumps({
+            "index": scene.get("index", self.count - 1),
+            "prompt_name": prompt_name,
+            "brand": brand,
+            "file": filename,
+            "midjourney_prompt": scene.get("midjourney_prompt", scene.get("mj")),
+            "comfyui_json": comfyui_json,
+        }, ensure_ascii=False).encode("utf-8") + b"\n"
+        offset = self._bundle.tell()
+        self._bundle.write(line)
+        keys = {manifest_key(prompt_name, brand), manifest_key(prompt_name)}
+        self._records.extend((key, offset, len(line) - 1, self.count) for key in keys)
+        self._files.append(filename)
+        return os.path.join(self.path, filename)
+
+    def add_all(self, scenes: Iterable[dict]) -> int:
+        for scene in scenes:
+            self.add(scene)
+        return self.count
+
+    def close(self) -> dict:
+        # 인덱스 / 요약을 쓰고 완성된 디렉터리를 한 번에 제자리로 옮김
+        if self._closed:
+            raise ExportError("이미 닫힌 번들입니다")
+        self._closed = True
+        self._bundle.close()
+        if self._archive is not None:
+            self._archive.close()
+
+        self._records.sort()
+        with open(os.path.join(self._partial, INDEX_NAME), "wb") as f:
+            f.write(_HEADER.pack(MANIFEST_MAGIC, MANIFEST_VERSION, len(self._records)))
+            for record in self._records:
+                f.write(_RECORD.pack(*record))
+        summary = {
+            "version": MANIFEST_VERSION,
+            "created_at": time.time(),
+            "scenes": self.count,
+            "skipped": self.skipped,
+            "bundle": BUNDLE_NAME,
+            "archive": ARCHIVE_NAME if self._archive is not None else None,
+            "index": INDEX_NAME,
+            "files": self._files,
+        }
+        with open(os.path.join(self._partial, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+        if os.path.exists(self.path):
+            previous = f"{self.path}.old"
+            if os.path.exists(previous):
+                shutil.rmtree(previous)
+            os.replace(self.path, previous)
+            os.replace(self._partial, self.path)
+            shutil.rmtree(previous)
+        else:
+            os.replace(self._partial, self.path)
+        return {**summary, "path": self.path}
+
+    def abort(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._bundle.close()
+        if self._archive is not None:
+            self._archive.close()
+        shutil.rmtree(self._partial, ignore_errors=True)
+
+
+class BundleReader:
+    # manifest.idx / bundle.jsonl 을 mmap 으로 열어 필요한 줄만 읽음 (ComfyUI 큐 러너 등에서 사용)
+    def __init__(self, path: str):
+        self.path = path
+        self._index_file = open(os.path.join(path, INDEX_NAME), "rb")
+        self._bundle_file = open(os.path.join(path, BUNDLE_NAME), "rb")
+        self._index = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        size = os.fstat(self._bundle_file.fileno()).st_size
+        self._bundle = mmap.mmap(self._bundle_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        magic, version, self._count = _HEADER.unpack_from(self._index, 0)
+        if magic != MANIFEST_MAGIC or version != MANIFEST_VERSION:
+            raise ExportError(f"{path}: 지원하지 않는 manifest.idx 형식입니다")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self._index.close()
+        if isinstance(self._bundle, mmap.mmap):
+            self._bundle.close()
+        self._index_file.close()
+        self._bundle_file.close()
+
+    def _key_at(self, position: int) -> int:
+        return _RECORD.unpack_from(self._index, _HEADER.size + position * _RECORD.size)[0]
+
+    def lookup(self, prompt_name: str, brand: str = "") -> list:
+        # 같은 이름의 장면이 여러 개면 (후보 / 재생성) 모두 장면 번호 순으로 반환
+        key = manifest_key(prompt_name, brand)
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        scenes = []
+        position = low
+        while position < self._count:
+            record_key, offset, length, _ = _RECORD.unpack_from(
+                self._index, _HEADER.size + position * _RECORD.size
+            )
+            if record_key != key:
+                break
+            scene = json.loads(self._bundle[offset:offset + length])
+            # 해시 충돌 방지: 실제 이름 / 브랜드 비교
+            if _normalize(scene["prompt_name"]) == _normalize(prompt_name) and (
+                not brand or _normalize(scene["brand"]) == _normalize(brand)
+            ):
+                scenes.append(scene)
+            position += 1
+        return scenes
+
+
+def iter_batch_results(path: str) -> Iterable[dict]:
+    # batch_generate 결과 JSONL 을 한 줄씩 읽음 (실패한 레코드는 건너뜀)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if record.get("ok"):
+                    yield record
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="배치 결과(JSONL)에서 ComfyUI JSON 번들을 만듭니다.")
+    parser.add_argument("input", help="batch_generate.py 결과 JSONL 경로")
+    parser.add_argument("-o", "--output", default="comfyui_bundle", help="번들 디렉터리")
+    parser.add_argument("--no-archive", action="store_true", help="bundle.zip 을 만들지 않음")
+    args = parser.parse_args(argv)
+
+    with BundleWriter(args.output, archive=not args.no_archive) as writer:
+        writer.add_all(iter_batch_results(args.input))
+    print(f"장면 {writer.count}개 → {args.output} (ComfyUI JSON 없음 {writer.skipped}개 제외)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())